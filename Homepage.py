@@ -1,8 +1,15 @@
 import streamlit as st
-from utilities.chatbot import ChatBot
+from utilities.chatbot import ChatBot, cancel_unfinished_answer
 from utilities.mongodb import CloudData
 from time import sleep
 from utilities.rag import RAG, NextQuestionGenerator
+from utilities.biomarker import BiomarkerStore
+from utilities.history import get_history_writer
+from utilities.retrieval_service import RetrievalClient
+from utilities.suggestions import LocalSuggestionEngine
+from utilities.multi_source import DocumentSource, MultiSourceRetriever, QASource
+from utilities import profiling
+import os
 
 
 st.set_page_config(
@@ -10,34 +17,59 @@ st.set_page_config(
     page_icon="👋",
 )
 
+profiling.start_rerun("Homepage.py")
+
+
+@st.cache_resource
+def load_rag():
+    """One knowledge base per process, shared by every session so an admin reload reaches all of them"""
+    return RAG(index_path="traing_data/qa_embeddings.index",
+               qa_file_path="traing_data/structured_qa.json", top_k=3, min_similarity=0.75)
+
+
 if "chat_bot_init" not in st.session_state:
     st.session_state.chat_bot_init = True
 if "cd_init" not in st.session_state:
     st.session_state.cd = CloudData()
     st.session_state.cd_init = False
     st.session_state.cd_init = True
+if "biomarker_store" not in st.session_state:
+    st.session_state.biomarker_store = BiomarkerStore(st.session_state.cd)
 if "username" not in st.session_state:
     st.session_state.user_name = ""
 if "rag" not in st.session_state:
-    st.session_state.rag = RAG(index_path="traing_data/qa_embeddings.index",
-                               qa_file_path="traing_data/structured_qa.json", top_k=3, min_similarity=0.75)
+    # Share one retrieval engine per host when a retrieval service is running
+    if os.environ.get("HEALTHBOT_RETRIEVAL_URL"):
+        st.session_state.rag = RetrievalClient(
+            os.environ["HEALTHBOT_RETRIEVAL_URL"], top_k=3, min_similarity=0.75)
+    else:
+        st.session_state.rag = load_rag()
+    # Search the document chunk store alongside the QA pairs when it has been built
+    sources = [QASource(st.session_state.rag)]
+    if isinstance(st.session_state.rag, RAG) and os.path.exists("traing_data/doc_chunks.index"):
+        sources.append(DocumentSource("traing_data/doc_chunks.index", "traing_data/doc_chunks.json",
+                                      st.session_state.rag.generate_embeddings))
+    st.session_state.retriever = MultiSourceRetriever(sources, top_k=3)
 
 
 if st.session_state.get("is_logged_in"):
 
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-
     if st.session_state.chat_bot_init:
         api_key = st.session_state.cd.get_settings()['api_key']
         init_prompt = st.session_state.cd.get_settings()['init_prompt']
         st.session_state.chat_bot = ChatBot(
-            api_key, init_prompt, rag=st.session_state.rag)
+            api_key, init_prompt, rag=st.session_state.rag,
+            retriever=st.session_state.retriever,
+            biomarker_store=st.session_state.biomarker_store,
+            user_name=st.session_state.username,
+            suggestion_engine=LocalSuggestionEngine(st.session_state.rag),
+            history=get_history_writer(st.session_state.cd))
+        st.session_state.chat_bot.restore_history()
         st.session_state.chat_bot_init = False
-        st.session_state.messages.append(
-            {"role": "assistant", "content": "I am the Online Health Science Knowledge Chatbot serving ARIN7102 Group3.1. How can I assist you?", "type": "content"})
         st.rerun()
 
+    cancel_unfinished_answer(st.session_state)
+
     st.sidebar.success("Welcome, " + st.session_state["username"] + "!")
     st.sidebar.page_link(page="Homepage.py", label="Homepage")
     st.sidebar.page_link(page="pages/chatbot.py", label="Chatbot")
@@ -128,3 +160,5 @@ else:
                     st.success(info)
                 else:
                     st.error(info)
+
+profiling.stop_rerun()
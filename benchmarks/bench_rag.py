@@ -0,0 +1,189 @@
+"""
+Retrieval benchmark for utilities.rag.RAG.
+
+For each corpus size and each index configuration this builds a fresh RAG
+over a synthetic corpus and reports build time, memory, latency percentiles
+for rag_query / retrieve_top_questions (single) and
+retrieve_top_questions_batch (batched), and recall@k against an exact
+IndexFlatIP. Runs CPU-only and offline with HashingEncoder.
+
+    python -m benchmarks.bench_rag --sizes 1000 10000 --output bench.json
+"""
+import os
+
+# CPU-only: hide GPUs before torch is imported anywhere
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic import HashingEncoder, generate_corpus, generate_queries, write_corpus
+from utilities.rag import RAG
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def index_configs(workdir):
+    """
+    Name -> extra RAG keyword arguments for each supported index configuration
+    """
+    return {
+        "flat": {},
+        "flat_mmap": {"mmap": True},
+        "fp16": {"index_type": "fp16"},
+        "pq": {"index_type": "pq"},
+        "pca128": {"projection": "pca", "projection_dim": 128},
+        "opq128_pq": {"index_type": "pq", "projection": "opq", "projection_dim": 128},
+        "sharded": {"shard_dir": os.path.join(workdir, "shards"), "n_probe_shards": 3},
+    }
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+def time_calls(fn, args_list, warmup=5):
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def recall_at_k(rag, exact_index, query_embeddings, k):
+    _, exact = exact_index.search(query_embeddings, k)
+    _, found = rag.index.search(query_embeddings, k)
+    hits = sum(len(set(e[e >= 0]) & set(f[f >= 0])) for e, f in zip(exact, found))
+    return hits / float(exact.shape[0] * k)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(size, args, encoder):
+    qa_pairs = generate_corpus(size, n_topics=args.topics, seed=args.seed)
+    queries = generate_queries(qa_pairs, args.queries, seed=args.seed + 1)
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        qa_path = os.path.join(workdir, "structured_qa.json")
+        write_corpus(qa_pairs, qa_path)
+
+        # Exact reference and query vectors are shared by every configuration
+        corpus_embeddings = RAG.encode_texts(
+            encoder, [item["question"] for item in qa_pairs], "cpu")
+        exact_index = RAG.build_faiss_index(corpus_embeddings)
+        query_embeddings = RAG.encode_texts(encoder, queries, "cpu")
+        batches = [queries[i:i + args.batch_size]
+                   for i in range(0, len(queries), args.batch_size)]
+
+        for name, extra in index_configs(workdir).items():
+            if args.configs and name not in args.configs:
+                continue
+            index_path = os.path.join(workdir, f"{name}.index")
+            gc.collect()
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            rag = RAG(index_path=index_path, qa_file_path=qa_path, model=encoder,
+                      top_k=args.k, min_similarity=-1.0, **extra)
+            build_s = time.perf_counter() - start
+            rss_after = rss_bytes()
+
+            on_disk = dir_bytes(extra["shard_dir"]) if "shard_dir" in extra else \
+                os.path.getsize(index_path) if os.path.exists(index_path) else None
+
+            result = {
+                "config": name,
+                "corpus_size": size,
+                "build_s": build_s,
+                "rss_delta_bytes": rss_after - rss_before,
+                "index_bytes_on_disk": on_disk,
+                "rag_query": time_calls(rag.rag_query, [(q,) for q in queries]),
+                "retrieve_top_questions": time_calls(
+                    rag.retrieve_top_questions, [(q,) for q in queries]),
+                "retrieve_top_questions_batch": time_calls(
+                    rag.retrieve_top_questions_batch, [(b,) for b in batches], warmup=1),
+                "batch_size": args.batch_size,
+                f"recall@{args.k}": recall_at_k(rag, exact_index, query_embeddings, args.k),
+            }
+            results.append(result)
+            print(f"[{size:>8}] {name:<10} build {build_s:7.2f}s  "
+                  f"query p50 {result['retrieve_top_questions']['p50_ms']:.2f}ms "
+                  f"p99 {result['retrieve_top_questions']['p99_ms']:.2f}ms  "
+                  f"recall@{args.k} {result[f'recall@{args.k}']:.3f}")
+            del rag
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--configs", nargs="*", default=None,
+                        help="subset of index configurations to run (default: all)")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+    encoder = HashingEncoder(dim=args.dim)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "faiss": faiss.__version__},
+        "params": vars(args),
+        "results": [],
+    }
+    for size in args.sizes:
+        report["results"].extend(run_size(size, args, encoder))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
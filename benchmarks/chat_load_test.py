@@ -0,0 +1,151 @@
+"""
+End-to-end chat load test against the local streaming stub.
+
+Runs N concurrent simulated conversations through ChatBot.generate_response
+(optionally followed by generate_nq) and reports time-to-first-token,
+tokens/sec per stream and end-to-end turn latency. Uses an in-process stub
+unless --base-url points at a running one.
+
+    python -m benchmarks.chat_load_test --conversations 32 --turns 3 --tokens-per-sec 80
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_llm_server import add_config_arguments, config_from_args, start_stub_server
+from utilities.chatbot import ChatBot
+
+QUESTIONS = [
+    "Can green tea help with high blood pressure?",
+    "How much fiber should I eat per day?",
+    "Is walking enough exercise for weight loss?",
+    "What foods raise HDL cholesterol?",
+]
+
+
+def summarize(samples, scale=1.0):
+    if not samples:
+        return None
+    samples = np.asarray(samples) * scale
+    return {"count": int(samples.size),
+            "p50": float(np.percentile(samples, 50)),
+            "p95": float(np.percentile(samples, 95)),
+            "p99": float(np.percentile(samples, 99)),
+            "mean": float(samples.mean())}
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ttft = []
+        self.turn_latency = []
+        self.tokens_per_sec = []
+        self.suggestion_latency = []
+        self.tokens = 0
+        self.errors = []
+
+    def add(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                if key == "tokens":
+                    self.tokens += value
+                elif key == "error":
+                    self.errors.append(value)
+                else:
+                    getattr(self, key).append(value)
+
+
+def run_conversation(conv_id, args, base_url, recorder):
+    bot = ChatBot(api_key="stub-key", init_prompt="You are a health assistant.",
+                  model=args.model, api_base=base_url,
+                  inline_suggestions=args.inline_suggestions)
+    for turn in range(args.turns):
+        question = QUESTIONS[(conv_id + turn) % len(QUESTIONS)]
+        start = time.perf_counter()
+        first = None
+        chunks = 0
+        try:
+            for parsed in bot.generate_response(question, use_rag=False):
+                if "queue_position" in parsed:
+                    continue
+                if first is None and (parsed.get("content") or parsed.get("reasoning")):
+                    first = time.perf_counter()
+                chunks += 1
+        except Exception as e:
+            recorder.add(error=f"{type(e).__name__}: {e}")
+            continue
+        end = time.perf_counter()
+        if first is None:
+            recorder.add(error="empty stream")
+            continue
+        recorder.add(ttft=first - start, turn_latency=end - start, tokens=chunks,
+                     tokens_per_sec=chunks / max(end - first, 1e-9))
+
+        if args.with_suggestions:
+            start = time.perf_counter()
+            bot.generate_nq()
+            recorder.add(suggestion_latency=time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent ChatBot load test against a local stub")
+    parser.add_argument("--conversations", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--model", default="deepseek-reasoner",
+                        choices=["deepseek-reasoner", "deepseek-chat"])
+    parser.add_argument("--with-suggestions", action="store_true",
+                        help="also time generate_nq after every turn")
+    parser.add_argument("--inline-suggestions", action="store_true",
+                        help="ask for follow-ups in the answer trailer instead of a second request")
+    parser.add_argument("--base-url", default=None,
+                        help="use an already running stub instead of starting one")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_stub_server(config_from_args(args))
+        base_url = server.base_url
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.conversations) as pool:
+        futures = [pool.submit(run_conversation, conv_id, args, base_url, recorder)
+                   for conv_id in range(args.conversations)]
+    wall = time.perf_counter() - start
+    # Failures outside a streamed turn (bot setup, suggestions) end the whole conversation
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            recorder.add(error=f"conversation aborted: {type(e).__name__}: {e}")
+
+    report = {
+        "params": vars(args),
+        "wall_s": wall,
+        "turns_completed": len(recorder.turn_latency),
+        "errors": len(recorder.errors),
+        "error_samples": recorder.errors[:10],
+        "aggregate_tokens_per_sec": recorder.tokens / wall,
+        "ttft_ms": summarize(recorder.ttft, 1000.0),
+        "turn_latency_ms": summarize(recorder.turn_latency, 1000.0),
+        "stream_tokens_per_sec": summarize(recorder.tokens_per_sec),
+        "suggestion_latency_ms": summarize(recorder.suggestion_latency, 1000.0),
+        "server": server.stats.as_dict() if server else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local OpenAI-compatible chat-completions stub for load testing.
+
+Speaks the streaming (SSE) and non-streaming chat-completions protocol,
+including reasoning_content deltas for deepseek-reasoner, with configurable
+time-to-first-token, token rate and error injection. Responses use chunked
+transfer encoding so clients can keep connections alive.
+
+    python -m benchmarks.stub_llm_server --port 8765 --tokens-per-sec 50 --ttft-ms 300
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("regular exercise helps most people manage their blood pressure and "
+         "a balanced diet with enough fiber supports healthy cholesterol levels "
+         "but you should talk to your doctor before making big changes").split()
+
+
+@dataclass
+class StubConfig:
+    ttft_ms: float = 300.0
+    tokens_per_sec: float = 50.0
+    content_tokens: int = 120
+    reasoning_tokens: int = 60
+    error_rate: float = 0.0
+    error_status: int = 429
+    mid_stream_error_rate: float = 0.0
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.active_streams = 0
+        self.max_active_streams = 0
+
+    def stream_started(self):
+        with self._lock:
+            self.active_streams += 1
+            self.max_active_streams = max(self.max_active_streams, self.active_streams)
+
+    def stream_finished(self):
+        with self._lock:
+            self.active_streams -= 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors,
+                    "active_streams": self.active_streams,
+                    "max_active_streams": self.max_active_streams}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self) -> StubConfig:
+        return self.server.config
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.stats._lock:
+            self.server.stats.requests += 1
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(body or b"{}")
+
+        if random.random() < self.config.error_rate:
+            with self.server.stats._lock:
+                self.server.stats.errors += 1
+            self._send_json(self.config.error_status,
+                            {"error": {"message": "injected error", "type": "stub_error"}})
+            return
+
+        time.sleep(self.config.ttft_ms / 1000.0)
+        if request.get("stream"):
+            self._stream(request)
+        else:
+            self._complete(request)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _complete(self, request):
+        prompt = request["messages"][-1]["content"]
+        if "follow-up questions" in prompt:
+            content = "\n".join(f"{i}. {self._sentence(8)}?" for i in (1, 2, 3))
+        else:
+            content = self._sentence(self.config.content_tokens)
+        time.sleep(self.config.content_tokens / self.config.tokens_per_sec)
+        self._send_json(200, {
+            "id": str(uuid.uuid4()), "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4,
+                      "completion_tokens": self.config.content_tokens,
+                      "total_tokens": len(prompt) // 4 + self.config.content_tokens},
+        })
+
+    def _stream(self, request):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        reasoner = request.get("model") == "deepseek-reasoner"
+        completion_id = str(uuid.uuid4())
+        interval = 1.0 / self.config.tokens_per_sec
+        deltas = []
+        if reasoner:
+            deltas += [{"content": None, "reasoning_content": w + " "}
+                       for w in self._words(self.config.reasoning_tokens)]
+        words = [w + " " for w in self._words(self.config.content_tokens)]
+        if "<<<FOLLOW_UPS>>>" in request["messages"][-1]["content"]:
+            # Inline follow-up trailer as requested by ChatBot(inline_suggestions=True)
+            trailer = json.dumps([self._sentence(8) + "?" for _ in range(3)])
+            words += ["\n<<<FOLLOW_UPS>>>\n", trailer, "\n<<<END>>>"]
+        deltas += [{"content": w, "reasoning_content": None} if reasoner else {"content": w}
+                   for w in words]
+        fail_at = (random.randrange(len(deltas))
+                   if random.random() < self.config.mid_stream_error_rate else None)
+
+        self.server.stats.stream_started()
+        try:
+            for i, delta in enumerate(deltas):
+                if i == fail_at:
+                    # Drop the connection without finishing the chunked body
+                    self.close_connection = True
+                    return
+                if i == 0:
+                    delta = dict(delta, role="assistant")
+                self._write_event({
+                    "id": completion_id, "object": "chat.completion.chunk",
+                    "created": int(time.time()), "model": request.get("model"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                })
+                time.sleep(interval)
+            self._write_event({
+                "id": completion_id, "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "delta": {"content": "", "reasoning_content": None} if reasoner else {"content": ""}}],
+            })
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+        finally:
+            self.server.stats.stream_finished()
+
+    def _write_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _words(n):
+        return [WORDS[i % len(WORDS)] for i in range(n)]
+
+    def _sentence(self, n):
+        return " ".join(self._words(n))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig):
+        super().__init__(address, StubHandler)
+        self.config = config
+        self.stats = StubStats()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected under load
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub_server(config: StubConfig, host="127.0.0.1", port=0) -> StubServer:
+    """
+    Start the stub on a background thread and return it (port=0 picks a free port)
+    """
+    server = StubServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--content-tokens", type=int, default=120)
+    parser.add_argument("--reasoning-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests rejected before streaming")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--mid-stream-error-rate", type=float, default=0.0,
+                        help="fraction of streams dropped part way through")
+
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec,
+                      content_tokens=args.content_tokens, reasoning_tokens=args.reasoning_tokens,
+                      error_rate=args.error_rate, error_status=args.error_status,
+                      mid_stream_error_rate=args.mid_stream_error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible streaming stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), config_from_args(args))
+    print(f"Stub chat-completions server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Synthetic QA corpora and an offline encoder for benchmarking RAG.
+
+Nothing here touches the network: questions are built from templates over a
+fixed vocabulary, and HashingEncoder turns text into deterministic vectors
+(a sum of per-token random projections), so paraphrases that share words end
+up close together just like with a real sentence encoder.
+"""
+import json
+import random
+import zlib
+
+import numpy as np
+import torch
+
+CONDITIONS = [
+    "diabetes", "hypertension", "asthma", "arthritis", "migraine", "insomnia",
+    "anemia", "eczema", "obesity", "depression", "anxiety", "osteoporosis",
+    "gout", "acne", "psoriasis", "reflux", "constipation", "flu", "allergy",
+    "high cholesterol",
+]
+SUBJECTS = [
+    "green tea", "oatmeal", "vitamin d", "fish oil", "turmeric", "walking",
+    "yoga", "garlic", "probiotics", "magnesium", "dark chocolate", "coffee",
+    "intermittent fasting", "spinach", "blueberries", "ginger", "zinc",
+    "swimming", "meditation", "almonds",
+]
+TEMPLATES = [
+    "Can {subject} help with {condition}?",
+    "Is {subject} safe for people with {condition}?",
+    "How much {subject} should I take for {condition}?",
+    "Does {subject} make {condition} worse?",
+    "What are the side effects of {subject} when you have {condition}?",
+    "How long does {subject} take to improve {condition}?",
+]
+PARAPHRASES = [
+    "Could {subject} be good for {condition}?",
+    "Would {subject} be safe if I have {condition}?",
+    "What amount of {subject} is right for {condition}?",
+    "Can {subject} worsen my {condition}?",
+    "Any side effects from {subject} with {condition}?",
+    "When will {subject} start improving my {condition}?",
+]
+
+
+def generate_corpus(n_pairs, n_topics=50, seed=0):
+    """
+    Generate n_pairs QA pairs spread over n_topics topics, in the same shape
+    as structured_qa.json (topic/question/answer/source).
+    """
+    rng = random.Random(seed)
+    topics = [f"{rng.choice(SUBJECTS)} and {rng.choice(CONDITIONS)} #{t}"
+              for t in range(n_topics)]
+    qa_pairs = []
+    for i in range(n_pairs):
+        topic = topics[i % n_topics]
+        subject, condition = topic.split(" #")[0].split(" and ")
+        template = TEMPLATES[rng.randrange(len(TEMPLATES))]
+        # A per-pair tag keeps questions distinct at large corpus sizes
+        question = template.format(subject=subject, condition=condition) + f" (case {i})"
+        answer = (f"Maybe. {subject.capitalize()} affects {condition} in several ways. "
+                  f"Talk to your doctor before changing your routine. Note {i}.")
+        qa_pairs.append({"topic": topic, "question": question, "answer": answer,
+                         "source": f"Generated from {topic}"})
+    return qa_pairs
+
+
+def generate_queries(qa_pairs, n_queries, seed=1):
+    """
+    Paraphrase randomly chosen corpus questions into user queries
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        item = qa_pairs[rng.randrange(len(qa_pairs))]
+        subject, condition = item["topic"].split(" #")[0].split(" and ")
+        queries.append(rng.choice(PARAPHRASES).format(subject=subject, condition=condition))
+    return queries
+
+
+def write_corpus(qa_pairs, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(qa_pairs, f, ensure_ascii=False)
+
+
+class HashingEncoder:
+    """
+    Offline stand-in for SentenceTransformer with the same encode() signature
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._token_vectors = {}
+
+    def _token_vector(self, token):
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vector = rng.standard_normal(self.dim).astype("float32")
+            self._token_vectors[token] = vector
+        return vector
+
+    def encode(self, texts, convert_to_tensor=False, device=None, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            tokens = "".join(c if c.isalnum() else " " for c in text.lower()).split()
+            for token in tokens:
+                out[row] += self._token_vector(token)
+        if convert_to_tensor:
+            return torch.from_numpy(out).to(device or "cpu")
+        return out
@@ -1,12 +1,23 @@
+import argparse
 import json
-from openai import OpenAI
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import RateLimitError
 from tqdm import tqdm
 from tenacity import retry, stop_after_attempt, wait_exponential
 import time
+from utilities.llm_client import get_client
 
-# Initialize DeepSeek client
-client = OpenAI(api_key="**********", base_url="https://api.deepseek.com")
-data = json.load(open("data.json", "r", encoding="utf-8"))
+# Initialize DeepSeek client from the shared pool; retries are left to
+# tenacity so that 429s reach the rate limiter instead of being retried inside openai
+client = get_client(api_key="**********").with_options(max_retries=0)
+
+# Shared rate limiter, only set in concurrent mode (see main())
+rate_limiter = None
+
+# Rough completion size of 3 QA pairs, used to pre-charge the token bucket
+COMPLETION_TOKEN_ESTIMATE = 512
 
 # ================== OPTIMIZED PROMPT (NO PMIDs) ==================
 SYSTEM_PROMPT = """You are a doctor generating clear, patient-friendly Q&A pairs. Follow these rules:
@@ -29,25 +40,132 @@ Q: Can granola bars lower cholesterol?
 A: Yes, because they contain soluble fiber that helps remove cholesterol from your body. For best results, choose bars with whole oats and less than 5g of added sugar per serving.
 """
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=60))
-def generate_qa(topic_name, content):
-    """Generate 3 QA pairs without PMIDs."""
+# ================== RATE LIMITING ==================
+class TokenBucket:
+    """Thread-unsafe token bucket refilled continuously at `per_minute` units/min.
+
+    Locking is done by RateLimiter, which owns one bucket for requests and
+    one for tokens.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.per_second = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now, scale=1.0):
+        self.level = min(self.capacity,
+                         self.level + (now - self.updated) * self.per_second * scale)
+        self.updated = now
+
+    def wait_time(self, amount, scale=1.0):
+        """Seconds until `amount` units are available (0 if available now)."""
+        amount = min(amount, self.capacity)  # never wait for more than a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.per_second * scale)
+
+    def consume(self, amount):
+        # May go negative when actual usage exceeds the estimate; the debt is
+        # paid back by later refills.
+        self.level -= amount
+
+
+class RateLimiter:
+    """Requests/min + tokens/min limiter with adaptive back-off on 429s.
+
+    Every 429 halves the effective refill rate and pauses all workers for an
+    exponentially growing cool-down; every success slowly restores the rate.
+    """
+
+    def __init__(self, requests_per_min, tokens_per_min, min_scale=0.1, max_cooldown=60):
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+        self.scale = 1.0
+        self.min_scale = min_scale
+        self.max_cooldown = max_cooldown
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens can be spent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now, self.scale)
+                self.tokens.refill(now, self.scale)
+                wait = max(self.cooldown_until - now,
+                           self.requests.wait_time(1, self.scale),
+                           self.tokens.wait_time(tokens, self.scale))
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(min(tokens, self.tokens.capacity))
+                    return
+            time.sleep(wait)
+
+    def record_usage(self, estimated, actual):
+        """Correct the token bucket once the real usage is known."""
+        with self._lock:
+            self.tokens.consume(actual - estimated)
+
+    def on_rate_limited(self):
+        with self._lock:
+            self.consecutive_429 += 1
+            self.scale = max(self.min_scale, self.scale / 2)
+            cooldown = min(self.max_cooldown, 2 ** self.consecutive_429)
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    def on_success(self):
+        with self._lock:
+            self.consecutive_429 = 0
+            self.scale = min(1.0, self.scale + 0.05)
+
+
+def estimate_tokens(messages):
+    """Cheap token estimate (~4 characters per token) for the prompt plus completion."""
+    return sum(len(m["content"]) for m in messages) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+def build_messages(topic_name, content):
     sentences = set()
     for pmid_sents in content["distant_exact_sentences"].values():
         sentences.update(pmid_sents)
     context = " ".join(sentences)[:3000]  # Truncate long text
 
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": USER_PROMPT_TEMPLATE.format(
-                topic_name=topic_name,
-                context=context
-            )}
-        ],
-        temperature=0.3  # Keep answers factual
-    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(
+            topic_name=topic_name,
+            context=context
+        )}
+    ]
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=60))
+def generate_qa(topic_name, content):
+    """Generate 3 QA pairs without PMIDs."""
+    messages = build_messages(topic_name, content)
+
+    estimated = estimate_tokens(messages)
+    if rate_limiter is not None:
+        rate_limiter.acquire(estimated)
+    try:
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=messages,
+            temperature=0.3  # Keep answers factual
+        )
+    except RateLimitError:
+        # Slow every worker down, then let tenacity retry this topic
+        if rate_limiter is not None:
+            rate_limiter.on_rate_limited()
+        raise
+    if rate_limiter is not None:
+        rate_limiter.on_success()
+        if response.usage is not None:
+            rate_limiter.record_usage(estimated, response.usage.total_tokens)
     return parse_qa(response.choices[0].message.content, topic_name)
 
 def parse_qa(raw_text, topic_name):
@@ -88,23 +206,176 @@ def parse_qa(raw_text, topic_name):
 
 
 
+# ===== CHECKPOINTING =====
+class CheckpointWriter:
+    """Append-only per-topic results (JSONL) plus a progress journal.
+
+    Each finished topic becomes one line {"topic", "qa"} in the checkpoint
+    file, followed by a {"topic", "status"} line in the journal, so a crash
+    loses at most the topics that were in flight.
+    """
+
+    def __init__(self, checkpoint_path, journal_path, resume=False):
+        mode = "a" if resume else "w"
+        self.checkpoint = open(checkpoint_path, mode, encoding="utf-8")
+        self.journal = open(journal_path, mode, encoding="utf-8")
+        if resume:
+            # Start on a fresh line if the previous run died mid-write
+            for f, path in ((self.checkpoint, checkpoint_path), (self.journal, journal_path)):
+                if f.tell() > 0:
+                    with open(path, "rb") as raw:
+                        raw.seek(-1, os.SEEK_END)
+                        if raw.read(1) != b"\n":
+                            f.write("\n")
+        self._lock = threading.Lock()
+
+    def record_success(self, topic_name, qa_pairs):
+        with self._lock:
+            # Data first, journal second: a topic is only "done" once its data is on disk
+            self.checkpoint.write(json.dumps({"topic": topic_name, "qa": qa_pairs}, ensure_ascii=False) + "\n")
+            self.checkpoint.flush()
+            self.journal.write(json.dumps({"topic": topic_name, "status": "done", "count": len(qa_pairs)},
+                                          ensure_ascii=False) + "\n")
+            self.journal.flush()
+
+    def record_failure(self, topic_name, error):
+        with self._lock:
+            self.journal.write(json.dumps({"topic": topic_name, "status": "failed", "error": str(error)},
+                                          ensure_ascii=False) + "\n")
+            self.journal.flush()
+
+    def close(self):
+        self.checkpoint.close()
+        self.journal.close()
+
+
+def iter_jsonl(path):
+    """Yield parsed lines, skipping a torn last line left by a crash."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def load_journal(journal_path):
+    """Return the latest status of every topic seen in the journal."""
+    status = {}
+    for entry in iter_jsonl(journal_path):
+        status[entry["topic"]] = entry["status"]
+    return status
+
+
+def compact(checkpoint_path, output_path):
+    """Stream the JSONL checkpoint into the JSON list that RAG loads.
+
+    Topics written more than once (re-run after a crash) keep their last
+    record. Only topic names are held in memory, never the QA pairs.
+    """
+    last_line = {}
+    for line_no, record in enumerate(iter_jsonl(checkpoint_path)):
+        last_line[record["topic"]] = line_no
+
+    total = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        out.write("[")
+        for line_no, record in enumerate(iter_jsonl(checkpoint_path)):
+            if last_line[record["topic"]] != line_no:
+                continue
+            for qa in record["qa"]:
+                out.write(",\n  " if total else "\n  ")
+                out.write(json.dumps(qa, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+                total += 1
+        out.write("\n]" if total else "]")
+    return total
+
+
 # ===== PROCESS ALL TOPICS =====
-all_qa = []
-failed_topics = []
+def run_serial(data, writer):
+    for topic_name, content in tqdm(data.items(), desc="Generating QA Pairs"):
+        try:
+            writer.record_success(topic_name, generate_qa(topic_name, content))
+            time.sleep(1)  # Rate limiting to avoid API overload
+        except Exception as e:
+            writer.record_failure(topic_name, e)
+            print(f"⚠️ Failed on {topic_name}: {str(e)}")
+            continue
 
-for topic_name, content in tqdm(data.items(), desc="Generating QA Pairs"):
-    try:
-        all_qa.extend(generate_qa(topic_name, content))
-        time.sleep(1)  # Rate limiting to avoid API overload
-    except Exception as e:
-        failed_topics.append(topic_name)
-        print(f"⚠️ Failed on {topic_name}: {str(e)}")
-        continue
-
-# Save results
-with open("health_qa_full_dataset.json", "w", encoding="utf-8") as f:
-    json.dump(all_qa, f, indent=2, ensure_ascii=False)
-
-# Generate report
-print(f"\n✅ Successfully generated {len(all_qa)} QA pairs from {len(data)} topics!")
-print(f"⚠️ Failed on {len(failed_topics)} topics: {failed_topics}")
\ No newline at end of file
+
+def run_concurrent(data, writer, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(generate_qa, topic_name, content): topic_name
+                   for topic_name, content in data.items()}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating QA Pairs"):
+            # Drop the future once written so finished results are not kept around
+            topic_name = futures.pop(future)
+            try:
+                writer.record_success(topic_name, future.result())
+            except Exception as e:
+                writer.record_failure(topic_name, e)
+                print(f"⚠️ Failed on {topic_name}: {str(e)}")
+
+
+def main():
+    global rate_limiter
+
+    parser = argparse.ArgumentParser(description="Generate patient-friendly QA pairs with DeepSeek")
+    parser.add_argument("--input", default="data.json")
+    parser.add_argument("--output", default="health_qa_full_dataset.json")
+    parser.add_argument("--checkpoint", default=None,
+                        help="per-topic JSONL results (default: <output>.jsonl)")
+    parser.add_argument("--journal", default=None,
+                        help="progress journal of done/failed topics (default: <output>.progress.jsonl)")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip topics already done in the journal, retry failed and unstarted ones")
+    parser.add_argument("--compact-only", action="store_true",
+                        help="only rebuild the output JSON from the checkpoint")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="number of topics generated in parallel (1 = original serial loop)")
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute (concurrent mode)")
+    parser.add_argument("--tpm", type=int, default=100000, help="tokens per minute (concurrent mode)")
+    args = parser.parse_args()
+
+    stem = os.path.splitext(args.output)[0]
+    checkpoint_path = args.checkpoint or stem + ".jsonl"
+    journal_path = args.journal or stem + ".progress.jsonl"
+
+    if not args.compact_only:
+        data = json.load(open(args.input, "r", encoding="utf-8"))
+        if args.resume:
+            status = load_journal(journal_path)
+            data = {topic_name: content for topic_name, content in data.items()
+                    if status.get(topic_name) != "done"}
+            print(f"Resuming: {len(data)} topics left to generate")
+
+        writer = CheckpointWriter(checkpoint_path, journal_path, resume=args.resume)
+        try:
+            if args.concurrency > 1:
+                rate_limiter = RateLimiter(args.rpm, args.tpm)
+                run_concurrent(data, writer, args.concurrency)
+            else:
+                run_serial(data, writer)
+        finally:
+            writer.close()
+
+    # Save results
+    total = compact(checkpoint_path, args.output)
+
+    # Generate report
+    status = load_journal(journal_path)
+    done = [t for t, s in status.items() if s == "done"]
+    failed_topics = [t for t, s in status.items() if s == "failed"]
+    print(f"\n✅ Successfully generated {total} QA pairs from {len(done)} topics!")
+    print(f"⚠️ Failed on {len(failed_topics)} topics: {failed_topics}")
+    if failed_topics:
+        print("Run again with --resume to retry them.")
+
+
+if __name__ == "__main__":
+    main()
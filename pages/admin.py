@@ -1,5 +1,9 @@
 import streamlit as st
+import pandas as pd
+import time
 from time import sleep
+from utilities import metrics, profiling
+from utilities.chatbot import cancel_unfinished_answer
 
 
 class User:
@@ -12,8 +16,12 @@ class User:
         st.session_state.cd.delete_user(self.name)
 
 
+profiling.start_rerun("pages/admin.py")
+
 if st.session_state.get("is_logged_in"):
 
+    cancel_unfinished_answer(st.session_state)
+
     st.sidebar.success("Welcome, " + st.session_state["username"] + "!")
     st.sidebar.page_link(page="./Homepage.py", label="Homepage")
     st.sidebar.page_link(page="pages/chatbot.py", label="Chatbot")
@@ -21,8 +29,9 @@ if st.session_state.get("is_logged_in"):
     st.sidebar.page_link(page="pages/biomarker.py", label="Biomarker")
     st.sidebar.page_link(page="pages/admin.py", label="Admin")
 
-    with st.container():
-        user_col = st.tabs(["Users"])
+    users_tab, metrics_tab, profiling_tab, kb_tab = st.tabs(
+        ["Users", "Metrics", "Profiling", "Knowledge base"])
+    with users_tab:
         total_users = st.session_state.cd.get_all_users()
         l = len(total_users)
         with st.container():
@@ -58,6 +67,118 @@ if st.session_state.get("is_logged_in"):
                         sleep(1)
                         st.rerun()
 
+    with metrics_tab:
+        enabled = st.toggle("Enable latency metrics", value=metrics.is_enabled())
+        if enabled != metrics.is_enabled():
+            if enabled:
+                metrics.enable(json_logs=True)
+            else:
+                metrics.disable()
+            st.rerun()
+
+        summaries = metrics.snapshot()
+        if not summaries:
+            st.info("No samples recorded yet.")
+        else:
+            st.dataframe(pd.DataFrame([
+                {
+                    "stage": m["name"],
+                    "unit": "ms" if m["unit"] == "seconds" else m["unit"],
+                    "count": m["count"],
+                    **{p: round(m[p] * 1000, 2) if m["unit"] == "seconds" else m[p]
+                       for p in ("p50", "p95", "p99", "max") if p in m},
+                }
+                for m in summaries
+            ]), use_container_width=True, hide_index=True)
+            c1, c2 = st.columns([1, 1])
+            with c1:
+                if st.button("Refresh"):
+                    st.rerun()
+            with c2:
+                if st.button("Reset metrics"):
+                    metrics.reset()
+                    st.rerun()
+            with st.expander("Prometheus export"):
+                st.code(metrics.prometheus_text(), language="text")
+
+    with profiling_tab:
+        settings = profiling.settings()
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            mode = st.selectbox("Profiler", profiling.MODES,
+                                index=profiling.MODES.index(settings["mode"]),
+                                disabled=profiling.is_enabled())
+        with c2:
+            trace_memory = st.checkbox("Track allocations (tracemalloc)", value=settings["trace_memory"],
+                                       disabled=profiling.is_enabled())
+        enabled = st.toggle("Profile every rerun", value=profiling.is_enabled())
+        if enabled != profiling.is_enabled():
+            if enabled:
+                profiling.enable(mode=mode, trace_memory=trace_memory)
+            else:
+                profiling.disable()
+            st.rerun()
+        st.caption(f"Profiles are saved to `{settings['profile_dir']}`.")
+
+        profiles = profiling.list_profiles()
+        if not profiles:
+            st.info("No profiles recorded yet.")
+        else:
+            st.dataframe(pd.DataFrame([
+                {
+                    "name": p["name"],
+                    "kind": p["kind"],
+                    "started": p["started"],
+                    "duration (ms)": p["duration_ms"],
+                    "mode": p["mode"],
+                    "hottest function": p["top_functions"][0]["function"] if p["top_functions"] else "",
+                    "file": p["profile_file"],
+                }
+                for p in profiles
+            ]), use_container_width=True, hide_index=True)
+            selected = st.selectbox("Details", range(len(profiles)),
+                                    format_func=lambda i: f"{profiles[i]['name']} @ {profiles[i]['started']} "
+                                                          f"({profiles[i]['duration_ms']} ms)")
+            st.dataframe(pd.DataFrame(profiles[selected]["top_functions"]),
+                         use_container_width=True, hide_index=True)
+            if profiles[selected].get("top_allocations"):
+                st.write("**Top allocation sites**")
+                st.dataframe(pd.DataFrame(profiles[selected]["top_allocations"]),
+                             use_container_width=True, hide_index=True)
+            c1, c2 = st.columns([1, 1])
+            with c1:
+                if st.button("Refresh", key="refresh_profiles"):
+                    st.rerun()
+            with c2:
+                if st.button("Delete profiles"):
+                    profiling.clear_profiles()
+                    st.rerun()
+
+    with kb_tab:
+        info = st.session_state.rag.knowledge_base_info()
+        st.write(f"**QA pairs:** {info['qa_pairs']}  \n**QA file sha256:** `{info['qa_sha256'][:16]}`")
+        reload_status = info["reload"]
+        if reload_status["time"] is not None:
+            st.write(f"**Last reload:** {reload_status['state']} at "
+                     f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reload_status['time']))}")
+        if reload_status["error"]:
+            st.error(reload_status["error"])
+        st.caption("Reloading rebuilds the index in the background if the QA file changed; "
+                   "questions keep using the current knowledge base until the new one is ready. "
+                   "All sessions served by this process share the knowledge base; other server "
+                   "processes keep theirs until reloaded there, unless they use the retrieval service.")
+        c1, c2 = st.columns([1, 1])
+        with c1:
+            if st.button("Reload knowledge base"):
+                st.session_state.rag.reload(background=True)
+                sleep(0.5)
+                st.rerun()
+        with c2:
+            if st.button("Refresh", key="refresh_kb"):
+                st.rerun()
+
 
 else:
     st.switch_page("./Homepage.py")
+
+profiling.stop_rerun()
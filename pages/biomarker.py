@@ -1,6 +1,8 @@
 import streamlit as st
 import time
-import json
+from utilities import profiling
+from utilities.biomarker import summarize
+from utilities.chatbot import cancel_unfinished_answer
 
 st.set_page_config(
     page_title="Online Health Science Knowledge Biomarker Configuration",
@@ -8,9 +10,13 @@ st.set_page_config(
     layout="wide",
 )
 
+profiling.start_rerun("pages/biomarker.py")
+
 if not st.session_state.get("is_logged_in"):
     st.switch_page("./Homepage.py")
 
+cancel_unfinished_answer(st.session_state)
+
 st.sidebar.success("Welcome, " + st.session_state["username"] + "!")
 st.sidebar.page_link(page="./Homepage.py", label="Homepage")
 st.sidebar.page_link(page="pages/chatbot.py", label="Chatbot")
@@ -64,30 +70,34 @@ with st.container():
     )
 
 if st.session_state.enable_biomarker:
+    saved = st.session_state.biomarker_store.get(st.session_state.username)
+    if saved:
+        st.info(summarize(saved))
     with st.form("biomarker_form"):
         st.subheader("Basic Physiological Metrics")
         col1, col2 = st.columns(2)
         with col1:
-            blood_pressure = st.text_input("Blood Pressure (mmHg)", "120/80")
+            blood_pressure = st.text_input(
+                "Blood Pressure (mmHg)", saved.get("blood_pressure", "120/80"))
             heart_rate = st.number_input(
-                "Heart Rate (bpm)", min_value=30, max_value=200, value=72)
+                "Heart Rate (bpm)", min_value=30, max_value=200, value=saved.get("heart_rate", 72))
         with col2:
             body_temp = st.number_input(
-                "Body Temperature (°C)", min_value=35.0, max_value=42.0, value=36.6)
+                "Body Temperature (°C)", min_value=35.0, max_value=42.0, value=saved.get("body_temp", 36.6))
             bmi = st.number_input("BMI", min_value=10.0,
-                                  max_value=50.0, value=22.0)
+                                  max_value=50.0, value=saved.get("bmi", 22.0))
 
         st.subheader("Blood Biochemistry")
         blood_cols = st.columns(3)
         with blood_cols[0]:
             glucose = st.number_input(
-                "Glucose (mmol/L)", min_value=2.0, max_value=20.0, value=5.4)
+                "Glucose (mmol/L)", min_value=2.0, max_value=20.0, value=saved.get("glucose", 5.4))
         with blood_cols[1]:
             cholesterol = st.number_input(
-                "Total Cholesterol (mmol/L)", min_value=2.0, max_value=10.0, value=4.5)
+                "Total Cholesterol (mmol/L)", min_value=2.0, max_value=10.0, value=saved.get("cholesterol", 4.5))
         with blood_cols[2]:
             hdl = st.number_input(
-                "HDL (mmol/L)", min_value=0.5, max_value=3.0, value=1.2)
+                "HDL (mmol/L)", min_value=0.5, max_value=3.0, value=saved.get("hdl", 1.2))
 
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -101,9 +111,11 @@ if st.session_state.enable_biomarker:
                 "cholesterol": cholesterol,
                 "hdl": hdl
             }
-            with open("user_data/biomarker.json", 'w', encoding='utf-8') as f:
-                json.dump(biomarker_data, f, ensure_ascii=False, indent=4)
+            st.session_state.biomarker_store.save(
+                st.session_state.username, biomarker_data)
 
             success = st.success("Configuration saved successfully!")
             time.sleep(2)
             st.switch_page("pages/chatbot.py")
+
+profiling.stop_rerun()
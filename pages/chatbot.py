@@ -1,6 +1,7 @@
 import streamlit as st
 from st_chat_message import message
-import time
+from utilities.chatbot import BufferedStream
+from utilities import profiling
 
 st.set_page_config(
     page_title="Online Health Science Knowledge Chatbot",
@@ -8,6 +9,8 @@ st.set_page_config(
     layout="wide",
 )
 
+GREETING = "I am the Online Health Science Knowledge Chatbot serving ARIN7102 Group3.1. How can I assist you?"
+
 # State management functions
 
 
@@ -17,19 +20,24 @@ def reset_states():
         "is_processing": False,
         "is_responding": False,
         "has_suggestions": False,
-        "current_stream": None
+        "current_stream": None,
+        "queue_position": 0
     })
 
 
 def clear_message():
-    st.session_state.messages = []
-    st.session_state.messages.append(
-        {"role": "assistant", "content": "I am the Online Health Science Knowledge Chatbot serving ARIN7102 Group3.1. How can I assist you?", "type": "content"})
     st.session_state.new_message = ""
     st.session_state.chat_bot.reset()
     reset_states()
 
 
+def stop_generation():
+    st.session_state.chat_bot.cancel()
+    if st.session_state.current_stream is not None:
+        st.session_state.current_stream.close()
+    reset_states()
+
+
 def clear_text():
     st.session_state.new_message = st.session_state["chat_input"]
     st.session_state["chat_input"] = ""
@@ -41,12 +49,15 @@ def click_suggestion():
     st.session_state.has_suggestions = False
 
 
+def refine_suggestions():
+    st.session_state.chat_bot.generate_nq(refine=True)
+
+
 required_states = {
     "new_message": "",
-    "messages": [],
+    "pending_input": "",
     "current_stream": None,
-    "reasoning_buffer": "",
-    "last_render_time": 0,
+    "queue_position": 0,
     "is_idle": True,
     "is_processing": False,
     "is_responding": False,
@@ -55,6 +66,8 @@ required_states = {
     "enable_rag": False
 }
 
+profiling.start_rerun("pages/chatbot.py")
+
 for key, default_value in required_states.items():
     if key not in st.session_state:
         st.session_state[key] = default_value
@@ -79,12 +92,15 @@ with chat_container:
     with col2:
         st.toggle("Enable RAG", key="enable_rag")
     with col3:
-        if len(st.session_state.messages) > 1:
+        if st.session_state.is_responding:
+            st.button("⏹️ Stop", on_click=stop_generation)
+        elif len(st.session_state.chat_bot.conversation) > 0:
             st.button("🗑️ Clear Chat", on_click=clear_message)
 
 # Chat display
 with st.container(height=550, border=True, key="chat-container"):
-    messages = st.session_state.messages
+    message(GREETING, is_user=False, avatar_style="bottts", key="assistant_greeting")
+    messages = st.session_state.chat_bot.conversation.display_messages()
     for idx, m in enumerate(messages):
         if m["role"] == "user":
             message(m["content"], is_user=True, key=f"user_{idx}")
@@ -102,6 +118,12 @@ with st.container(height=550, border=True, key="chat-container"):
                 avatar_style="bottts",
                 key=f"assistant_content_{idx}",
             )
+    # Shown while retrieval runs, before the turn exists in the conversation
+    if st.session_state.pending_input:
+        message(st.session_state.pending_input, is_user=True, key="user_pending")
+    if st.session_state.is_responding and st.session_state.queue_position:
+        st.caption(f"⏳ The assistant is busy, your question is number "
+                   f"{st.session_state.queue_position} in the queue...")
 
     # Suggestions rendering
     if st.session_state.has_suggestions:
@@ -116,6 +138,8 @@ with st.container(height=550, border=True, key="chat-container"):
                         use_container_width=True,
                         on_click=click_suggestion
                     )
+            st.button("✨ Refine suggestions", key="refine_suggestions",
+                      on_click=refine_suggestions)
 
 # Input handling
 st.text_input(
@@ -130,8 +154,7 @@ st.text_input(
 # State machine logic
 # State 1: Handle new input
 if st.session_state.is_idle and st.session_state.new_message:
-    user_input = st.session_state.new_message
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.pending_input = st.session_state.new_message
     st.session_state.new_message = ""
     st.session_state.is_idle = False
     st.session_state.is_processing = True
@@ -141,99 +164,52 @@ if st.session_state.is_idle and st.session_state.new_message:
 if st.session_state.is_processing:
     try:
         if not st.session_state.enable_biomarker:
-            st.session_state.current_stream = st.session_state.chat_bot.generate_response(
-                st.session_state.messages[-1]["content"],
+            stream = st.session_state.chat_bot.generate_response(
+                st.session_state.pending_input,
                 use_rag=st.session_state.enable_rag
             )
         else:
-            st.session_state.current_stream = st.session_state.chat_bot.generate_response_with_biomarker(
-                st.session_state.messages[-1]["content"],
+            stream = st.session_state.chat_bot.generate_response_with_biomarker(
+                st.session_state.pending_input,
                 use_rag=st.session_state.enable_rag
             )
+        # Read the network stream on a background thread, independent of reruns
+        st.session_state.current_stream = BufferedStream(
+            stream, stall_timeout=st.session_state.chat_bot.stream_idle_timeout)
 
-        st.session_state.messages.extend([
-            {"role": "assistant", "type": "reasoning", "content": ""},
-            {"role": "assistant", "type": "content", "content": ""}
-        ])
+        st.session_state.pending_input = ""
         st.session_state.is_processing = False
         st.session_state.is_responding = True
-        st.session_state.reasoning_buffer = ""
-        st.session_state.last_render_time = 0
         st.rerun()
     except Exception as e:
         st.error(str(e))
+        st.session_state.pending_input = ""
         reset_states()
         st.rerun()
 
+# State 3: Show the answer. ChatBot writes the chunks into the current turn of
+# its conversation while the producer thread reads the stream; the page only
+# collects what arrived since the last rerun and rerenders.
 if st.session_state.is_responding and st.session_state.current_stream:
-    chunks = []
-    start_time = time.time()
-    stream_exhausted = False
+    stream = st.session_state.current_stream
+    # 每次rerun之间最多等待0.3秒
+    for chunk in stream.drain(timeout=0.3):
+        st.session_state.queue_position = chunk.get("queue_position", 0)
 
-    try:
-        # 批量处理chunk (最多0.3秒)
-        while (time.time() - start_time) < 0.3:
-            chunk = next(st.session_state.current_stream)
-            chunks.append(chunk)
-    except StopIteration:
-        stream_exhausted = True
-    except Exception as e:
-        st.error(str(e))
+    if stream.error is not None:
+        st.error(str(stream.error))
         reset_states()
         st.rerun()
 
-    # 统一处理chunks（无论是否异常）
-    finally:
-        # 处理所有已获取的chunks
-        reasoning_updates = []
-        content_updates = []
-
-        # 解析chunks内容
-        for chunk in chunks:
-            if chunk.get("reasoning"):
-                reasoning_updates.append(chunk["reasoning"])
-            if chunk.get("content"):
-                content_updates.append(chunk["content"])
-
-        # 更新状态缓冲区
-        if reasoning_updates:
-            st.session_state.reasoning_buffer += "".join(reasoning_updates)
-        if content_updates:
-            st.session_state.messages[-1]["content"] += "".join(
-                content_updates)
-
-        # 判断是否需要渲染
-        should_render = False
-        if len(chunks) >= 3 or \
-           (time.time() - st.session_state.last_render_time) > 0.2 or \
-           len(st.session_state.reasoning_buffer) > 100:
-            should_render = True
-
-        # 强制刷新推理过程
-        if st.session_state.reasoning_buffer:
-            st.session_state.messages[-2]["content"] += st.session_state.reasoning_buffer
-            st.session_state.reasoning_buffer = ""
-
-        # 触发界面更新
-        if should_render or content_updates:
-            st.session_state.last_render_time = time.time()
-            st.rerun()
-
-        # 流结束时清理状态
-        if stream_exhausted:
-            # 确保最后的推理内容被刷新
-            if st.session_state.reasoning_buffer:
-                st.session_state.messages[-2]["content"] += st.session_state.reasoning_buffer
-                st.session_state.reasoning_buffer = ""
-
-            # 重置状态
-            st.session_state.last_render_time = 0
-            st.session_state.current_stream = None
-            st.session_state.is_responding = False
-            st.session_state.is_idle = True
-            st.session_state.has_suggestions = (
-                len(st.session_state.messages) > 1 and
-                st.session_state.messages[-1]["role"] == "assistant" and
-                st.session_state.messages[-1]["type"] == "content"
-            )
-            st.rerun()
+    # 流结束时清理状态
+    if stream.finished:
+        st.session_state.current_stream = None
+        st.session_state.queue_position = 0
+        st.session_state.is_responding = False
+        st.session_state.is_idle = True
+        st.session_state.has_suggestions = (
+            st.session_state.chat_bot.conversation.last_turn() is not None
+        )
+    st.rerun()
+
+profiling.stop_rerun()
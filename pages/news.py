@@ -1,6 +1,8 @@
 import streamlit as st
 from datetime import datetime
 from utilities.spider import fetch_who_news
+from utilities import profiling
+from utilities.chatbot import cancel_unfinished_answer
 
 st.set_page_config(
     page_title="WHO health news",
@@ -9,6 +11,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+profiling.start_rerun("pages/news.py")
+
 st.markdown("""
 <style>
 .news-card {
@@ -57,6 +61,8 @@ st.caption("The news is from official website of WHO (update per 5 min)")
 if not st.session_state.get("is_logged_in"):
     st.switch_page("./Homepage.py")
 
+cancel_unfinished_answer(st.session_state)
+
 st.sidebar.success("Welcome, " + st.session_state["username"] + "!")
 st.sidebar.page_link(page="./Homepage.py", label="Homepage")
 st.sidebar.page_link(page="pages/chatbot.py", label="Chatbot")
@@ -117,3 +123,5 @@ for news in news_data:
             st.markdown('</div>', unsafe_allow_html=True)
 
         st.divider()
+
+profiling.stop_rerun()
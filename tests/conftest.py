@@ -0,0 +1,80 @@
+"""
+Shared fixtures. Everything runs offline: the knowledge base is a synthetic
+corpus encoded with benchmarks.synthetic.HashingEncoder, and the LLM is a
+fake client that streams canned chunks.
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.synthetic import HashingEncoder, generate_corpus, write_corpus
+from utilities.rag import RAG
+
+
+@pytest.fixture(scope="session")
+def encoder():
+    return HashingEncoder()
+
+
+@pytest.fixture
+def corpus():
+    return generate_corpus(50, n_topics=10)
+
+
+@pytest.fixture
+def kb_paths(tmp_path, corpus):
+    qa_path = str(tmp_path / "qa.json")
+    write_corpus(corpus, qa_path)
+    return str(tmp_path / "qa.index"), qa_path
+
+
+@pytest.fixture
+def rag(kb_paths, encoder):
+    index_path, qa_path = kb_paths
+    return RAG(index_path, qa_path, model=encoder, top_k=3, min_similarity=0.3)
+
+
+class FakeResponse:
+    """
+    Streamed completion of `n` chunks, one every `delay` seconds. Like the
+    real response, reading after close() fails.
+    """
+
+    def __init__(self, n, delay, text="w"):
+        self.n = n
+        self.delay = delay
+        self.text = text
+        self.closed = False
+
+    def __iter__(self):
+        for i in range(self.n):
+            time.sleep(self.delay)
+            if self.closed:
+                raise RuntimeError("read from closed response")
+            delta = SimpleNamespace(content=f"{self.text}{i} ", reasoning_content=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, n=200, delay=0.01, text="w"):
+        self.n = n
+        self.delay = delay
+        self.text = text
+        self.responses = []
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        response = FakeResponse(self.n, self.delay, self.text)
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from utilities.biomarker import METRICS, classify, summarize, summarize_history, to_matrix
+
+
+def test_to_matrix_parses_blood_pressure_and_missing_values():
+    values = to_matrix([{"blood_pressure": "135/88", "heart_rate": "72", "bmi": "n/a"}])
+    assert values.shape == (1, len(METRICS))
+    assert values[0, 0] == 135 and values[0, 1] == 88 and values[0, 2] == 72
+    assert np.isnan(values[0, METRICS.index("bmi")])
+
+
+def test_classify_thresholds():
+    heart_rate = METRICS.index("heart_rate")
+    values = np.full((5, len(METRICS)), np.nan)
+    values[:, heart_rate] = [45, 55, 80, 100, 120]
+    levels = classify(values)
+    assert levels[:, heart_rate].tolist() == [-2, -1, 0, 1, 2]
+    # Unrecorded metrics are treated as normal
+    assert not levels[:, :heart_rate].any()
+
+
+def test_normal_blood_pressure_is_not_flagged():
+    assert summarize({"blood_pressure": "120/80", "heart_rate": 70}) == \
+        "All recorded metrics within normal range."
+
+
+def test_summary_lists_only_flagged_metrics():
+    summary = summarize({"blood_pressure": "150/85", "heart_rate": 70, "glucose": 7.5})
+    assert summary == ("Flagged: BP 150/85 mmHg high (hypertension); "
+                       "glucose 7.5 mmol/L high (diabetic if fasting). Other recorded metrics normal.")
+
+
+def test_empty_record_has_no_summary():
+    assert summarize({}) == ""
+
+
+def test_history_counts_out_of_range_readings():
+    records = [{"heart_rate": 110}, {"heart_rate": 70}, {"heart_rate": 105}]
+    assert summarize_history(records) == "Recent readings: heart rate high 2/3."
+    assert summarize_history(records[:1]) == ""
@@ -0,0 +1,156 @@
+import time
+
+import pytest
+
+from tests.conftest import FakeClient
+from utilities.chatbot import (FOLLOW_UP_END, FOLLOW_UP_START, BufferedStream, ChatBot, FollowUpTrailerParser,
+                               cancel_unfinished_answer)
+
+
+def drain_all(stream, timeout=10.0):
+    chunks = []
+    deadline = time.monotonic() + timeout
+    while not stream.finished:
+        assert time.monotonic() < deadline, "stream did not finish"
+        chunks.extend(stream.drain(0.05))
+    return chunks
+
+
+@pytest.fixture
+def bot(fake_client):
+    bot = ChatBot(api_key="test", model="deepseek-chat")
+    bot.client = fake_client
+    return bot
+
+
+def test_answer_is_recorded_on_the_turn(bot):
+    bot.client.n, bot.client.delay = 5, 0
+    chunks = list(bot.generate_response("hello", use_rag=False))
+    assert "".join(c["content"] for c in chunks if c.get("content")) == "w0 w1 w2 w3 w4 "
+    turn = bot.conversation.last_turn()
+    assert turn.query == "hello" and turn.answer == "w0 w1 w2 w3 w4 " and turn.complete
+
+
+def test_cancel_closes_the_response_and_keeps_the_partial_answer(bot):
+    stream = bot.generate_response("question", use_rag=False)
+    for _ in range(3):
+        next(stream)
+    bot.cancel()
+    assert bot.client.responses[0].closed
+    assert list(stream) == []
+    assert bot.conversation.last_turn().answer == "w0 w1 w2 "
+
+
+def test_new_question_cancels_the_unfinished_answer(bot):
+    first = bot.generate_response("first", use_rag=False)
+    next(first)
+    bot.client.n = 2
+    list(bot.generate_response("second", use_rag=False))
+    assert bot.client.responses[0].closed
+    assert [(t.query, t.answer) for t in bot.conversation.turns] == [("first", "w0 "), ("second", "w0 w1 ")]
+
+
+class SessionState(dict):
+    """Minimal stand-in for st.session_state: a dict with attribute access"""
+    __getattr__ = dict.__getitem__
+
+
+def test_leaving_the_chat_page_cancels_the_unfinished_answer(bot):
+    stream = bot.generate_response("question", use_rag=False)
+    next(stream)
+    session_state = SessionState(chat_bot=bot, current_stream=stream, is_responding=True, is_idle=False)
+    cancel_unfinished_answer(session_state)
+    assert bot.client.responses[0].closed
+    assert session_state == SessionState(chat_bot=bot, current_stream=None, is_responding=False, is_idle=True)
+
+    # Nothing to cancel on later pages
+    cancel_unfinished_answer(session_state)
+    assert len(bot.client.responses) == 1
+
+
+def test_new_turn_while_previous_producer_is_still_streaming(bot):
+    first = BufferedStream(bot.generate_response("first", use_rag=False))
+    time.sleep(0.2)
+    second = BufferedStream(bot.generate_response("second", use_rag=False))
+    time.sleep(0.2)
+
+    # The second turn owns its response; the wound-down first stream did not reset it
+    state = bot._active_state
+    assert state.response is bot.client.responses[1]
+    assert not state.aborted
+    assert bot.client.responses[0].closed
+    drain_all(first)
+    assert first.error is None
+
+    bot.cancel()
+    drain_all(second)
+    assert bot.client.responses[1].closed
+    assert second.error is None
+    assert [(t.query, t.complete) for t in bot.conversation.turns] == [("first", True), ("second", True)]
+
+
+def test_cancel_waits_for_the_producer_to_finish(bot):
+    stream = BufferedStream(bot.generate_response("question", use_rag=False))
+    time.sleep(0.1)
+    state = bot._active_state
+    bot.cancel()
+    assert state.finished.is_set()
+    assert state.aborted
+    drain_all(stream)
+    assert stream.error is None
+    assert bot.conversation.pending is None
+
+
+def test_producer_blocked_on_full_buffer_stops_on_cancel(bot):
+    stream = BufferedStream(bot.generate_response("question", use_rag=False), capacity=2)
+    time.sleep(0.2)
+    state = bot._active_state
+    bot.cancel(timeout=2.0)
+    assert state.finished.is_set()
+    drain_all(stream)
+    assert stream.error is None
+    # The partial answer is kept
+    assert bot.conversation.last_turn().answer.startswith("w0 w1 ")
+
+
+def test_inline_suggestions_are_stripped_from_the_answer():
+    text = f'The answer.{FOLLOW_UP_START}["Is it safe?", "How much?"]{FOLLOW_UP_END}'
+    parser = FollowUpTrailerParser()
+    # Feed in small pieces so the marker is split across chunks
+    visible = "".join(parser.feed(text[i:i + 3]) for i in range(0, len(text), 3)) + parser.finish()
+    assert visible == "The answer."
+    assert parser.suggestions() == ["Is it safe?", "How much?"]
+
+
+def test_trailer_parser_passes_text_without_trailer_through():
+    parser = FollowUpTrailerParser()
+    text = "Plain answer with < and << signs"
+    visible = "".join(parser.feed(c) for c in text) + parser.finish()
+    assert visible == text
+    assert parser.suggestions() is None
+
+
+def test_trailer_parser_rejects_malformed_trailer():
+    parser = FollowUpTrailerParser()
+    parser.feed(f"Answer.{FOLLOW_UP_START}not json{FOLLOW_UP_END}")
+    assert parser.finish() == ""
+    assert parser.suggestions() is None
+
+
+def test_buffered_stream_stops_reading_when_closed():
+    client = FakeClient(n=1000, delay=0)
+    stream = BufferedStream(iter(client.create()), capacity=4)
+    time.sleep(0.05)
+    stream.close()
+    drain_all(stream)
+    assert stream.error is None
+
+
+def test_buffered_stream_reports_producer_errors():
+    def failing():
+        yield {"content": "a"}
+        raise ValueError("boom")
+
+    stream = BufferedStream(failing())
+    assert drain_all(stream) == [{"content": "a"}]
+    assert isinstance(stream.error, ValueError)
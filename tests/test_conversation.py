@@ -0,0 +1,45 @@
+from utilities.conversation import Conversation
+
+
+def reference(question, answer, similarity=0.9):
+    return {"question": question, "answer": answer, "similarity": similarity}
+
+
+def answered(conversation, query, answer="Answer.", references=None):
+    turn = conversation.begin(query, references)
+    turn.answer = answer
+    conversation.end_turn(turn)
+    return turn
+
+
+def test_api_messages_pair_user_and_assistant():
+    conversation = Conversation("system", context_turns=3)
+    answered(conversation, "q1", "a1")
+    conversation.begin("q2")
+    messages = conversation.api_messages("extra")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert messages[-1]["content"] == "q2extra"
+
+
+def test_turn_without_answer_is_dropped():
+    conversation = Conversation()
+    conversation.begin("q1")
+    conversation.end_turn()
+    assert len(conversation) == 0
+
+
+def test_turns_outside_context_window_are_compacted():
+    conversation = Conversation(context_turns=2)
+    refs = [reference("Q?", "A.")]
+    first = answered(conversation, "q1", references=refs)
+    answered(conversation, "q2")
+    answered(conversation, "q3")
+    assert first.references is None
+    assert first.user_content() == "q1"
+
+
+def test_context_references_cover_the_window():
+    conversation = Conversation(context_turns=2)
+    answered(conversation, "q1", references=[reference("Old question?", "A.")])
+    answered(conversation, "q2", references=[reference("Recent question?", "B.")])
+    assert conversation.context_references() == ["recent question?"]
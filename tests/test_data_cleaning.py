@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from data_cleaning_updated import CheckpointWriter, RateLimiter, TokenBucket, compact, iter_jsonl, load_journal
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(60)
+    bucket.updated = 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    bucket.refill(10.0)
+    assert bucket.level == pytest.approx(10.0)
+    bucket.refill(1000.0)
+    assert bucket.level == 60.0
+
+
+def test_token_bucket_never_waits_for_more_than_capacity():
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    assert bucket.wait_time(600) == pytest.approx(60.0)
+
+
+def test_token_bucket_repays_debt_at_reduced_rate():
+    bucket = TokenBucket(60)
+    bucket.consume(70)
+    assert bucket.wait_time(1, scale=0.5) == pytest.approx(22.0)
+
+
+def test_rate_limiter_backs_off_and_recovers():
+    limiter = RateLimiter(60, 10000)
+    limiter.on_rate_limited()
+    limiter.on_rate_limited()
+    assert limiter.scale == 0.25
+    limiter.on_success()
+    assert limiter.scale == pytest.approx(0.3) and limiter.consecutive_429 == 0
+
+
+def test_checkpoint_resume_survives_a_torn_line(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    journal = str(tmp_path / "journal.jsonl")
+    writer = CheckpointWriter(checkpoint, journal)
+    writer.record_success("gout", [{"question": "Q1?", "answer": "A1"}])
+    writer.record_failure("flu", ValueError("timeout"))
+    writer.close()
+    # A crash in the middle of the next record
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write('{"topic": "flu", "qa": [')
+
+    writer = CheckpointWriter(checkpoint, journal, resume=True)
+    writer.record_success("flu", [{"question": "Q2?", "answer": "A2"}])
+    writer.record_success("gout", [{"question": "Q3?", "answer": "A3"}])
+    writer.close()
+
+    assert [record["topic"] for record in iter_jsonl(checkpoint)] == ["gout", "flu", "gout"]
+    assert load_journal(journal) == {"gout": "done", "flu": "done"}
+
+    output = tmp_path / "structured_qa.json"
+    assert compact(checkpoint, str(output)) == 2
+    # Topics written twice keep their last record
+    assert [qa["question"] for qa in json.loads(output.read_text(encoding="utf-8"))] == ["Q2?", "Q3?"]
+
+
+def test_iter_jsonl_of_missing_file_is_empty(tmp_path):
+    assert list(iter_jsonl(str(tmp_path / "missing.jsonl"))) == []
@@ -0,0 +1,33 @@
+import numpy as np
+
+from utilities.dedup import deduplicate_qa, deduplicate_with_rag, find_duplicate_clusters
+
+
+def near_duplicates():
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((3, 16)).astype("float32")
+    vectors = np.concatenate([base, base[:2] + 0.01 * rng.standard_normal((2, 16)).astype("float32")])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_duplicate_clusters_group_near_identical_vectors():
+    vectors = near_duplicates()
+    clusters = find_duplicate_clusters(vectors, threshold=0.95, batch_size=2)
+    assert sorted(clusters) == [(0, [3]), (1, [4]), (2, [])]
+    # The preferred order decides the representative
+    assert (3, [0]) in find_duplicate_clusters(vectors, threshold=0.95, order=[3, 4, 0, 1, 2])
+
+
+def test_keeps_the_longest_answer_in_original_order():
+    qa_pairs = [{"question": f"Q{i}?", "answer": "a" * n} for i, n in enumerate([5, 5, 5, 1, 9])]
+    kept, report = deduplicate_qa(qa_pairs, near_duplicates(), threshold=0.95)
+    assert [item["question"] for item in kept] == ["Q0?", "Q2?", "Q4?"]
+    assert report["removed"] == 2
+    assert {"canonical": "Q4?", "duplicates": ["Q1?"]} in report["clusters"]
+
+
+def test_deduplicates_with_the_rag_encoder(rag, corpus):
+    qa_pairs = corpus[:10] + [dict(corpus[3], answer=corpus[3]["answer"] + " More detail.")]
+    kept, report = deduplicate_with_rag(rag, qa_pairs)
+    assert len(kept) == 10 and report["removed"] == 1
+    assert kept[-1]["answer"].endswith("More detail.")
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from utilities.conversation import Turn
+from utilities.history import HistoryWriter
+
+
+class FakeCloudData:
+    def __init__(self, block=None):
+        self.batches = []
+        self.block = block
+
+    def insert_history(self, batch):
+        if self.block is not None:
+            self.block.wait()
+        self.batches.append(batch)
+
+
+def turn(query):
+    return Turn(query=query, answer="answer", complete=True)
+
+
+def test_records_are_written_in_batches():
+    cd = FakeCloudData()
+    writer = HistoryWriter(cd, max_batch=3, flush_interval=10.0)
+    for i in range(7):
+        writer.record("alice", "conv", turn(f"q{i}"))
+    assert writer.flush(5.0)
+    assert [len(batch) for batch in cd.batches] == [3, 3, 1]
+    assert cd.batches[0][0]["query"] == "q0" and cd.batches[0][0]["name"] == "alice"
+    assert writer.written == 7
+
+
+def test_full_queue_drops_records_and_flush_times_out():
+    block = threading.Event()
+    writer = HistoryWriter(FakeCloudData(block), max_batch=1, flush_interval=0.01, max_queue=2)
+    for i in range(6):
+        writer.record("alice", "conv", turn(f"q{i}"))
+        time.sleep(0.02)
+    assert writer.dropped > 0
+
+    start = time.monotonic()
+    assert not writer.flush(0.2)
+    assert time.monotonic() - start < 1.0
+    block.set()
+    assert writer.flush(5.0)
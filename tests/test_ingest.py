@@ -0,0 +1,66 @@
+import gzip
+import json
+
+import pytest
+
+from utilities.ingest import DEFAULT_OPTIONS, _init_worker, _process_batch, ingest, normalize_amazon, parse_record
+
+HEALTH = "{'asin': 'B01', 'question': 'Does this vitamin help with sleep at night?', " \
+         "'answer': 'Yes, it helps me sleep through the night.'}\n"
+OFF_TOPIC = "{'question': 'Does this case fit the new phone model?', 'answer': 'Yes it fits very well indeed.'}\n"
+
+
+@pytest.fixture(autouse=True)
+def options():
+    _init_worker(DEFAULT_OPTIONS)
+
+
+def test_parses_python_literals_and_json():
+    assert parse_record(HEALTH)["asin"] == "B01"
+    assert parse_record('{"question": "q"}')["question"] == "q"
+
+
+@pytest.mark.parametrize("line", ["[1, 2]\n", "42\n", "'text'\n", "{bad\n", "(" * 500 + "\n", "{'a': 1} + 1\n"])
+def test_unusable_lines_count_as_parse_errors(line):
+    qa_pairs, errors = _process_batch([line, HEALTH])
+    assert errors == 1
+    assert len(qa_pairs) == 1
+
+
+def test_filters_and_normalizes_records():
+    qa_pairs, errors = _process_batch([HEALTH, OFF_TOPIC])
+    assert errors == 0
+    assert qa_pairs == [{
+        "topic": "vitamins and supplements",
+        "question": "Does this vitamin help with sleep at night?",
+        "answer": "Yes, it helps me sleep through the night.",
+        "source": "Amazon QA Health and Personal Care (B01)",
+    }]
+
+
+def test_question_mark_requirement_is_optional():
+    record = parse_record(HEALTH.replace("sleep at night?", "sleep at night"))
+    assert normalize_amazon(record, DEFAULT_OPTIONS) is None
+    kept = normalize_amazon(record, {**DEFAULT_OPTIONS, "require_question_mark": False})
+    assert kept["question"] == "Does this vitamin help with sleep at night"
+
+
+def test_ingest_merges_and_removes_exact_duplicates(tmp_path):
+    amazon = tmp_path / "qa.json.gz"
+    duplicate = HEALTH.replace("sleep at night?", "Sleep at night ?")
+    with gzip.open(amazon, "wt", encoding="utf-8") as f:
+        f.writelines([HEALTH, OFF_TOPIC, "[not a record]\n", duplicate])
+    merged = tmp_path / "merged.json"
+    merged.write_text(json.dumps([{"topic": "sleep", "question": "Is melatonin safe for kids?",
+                                   "answer": "Ask a doctor first."}]), encoding="utf-8")
+    output = tmp_path / "structured_qa.json"
+
+    stats = ingest([str(amazon)], str(output), [str(merged)], workers=1, batch_size=2)
+    qa_pairs = json.loads(output.read_text(encoding="utf-8"))
+    assert [item["question"] for item in qa_pairs] == [
+        "Is melatonin safe for kids?", "Does this vitamin help with sleep at night?"]
+    assert stats["merged"] == 1
+    assert stats["amazon_lines"] == 4
+    assert stats["parse_errors"] == 1
+    assert stats["duplicates"] == 1
+    assert not (tmp_path / "structured_qa.json.tmp").exists()
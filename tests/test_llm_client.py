@@ -0,0 +1,24 @@
+import pytest
+
+from utilities import llm_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    llm_client.close_all()
+    yield
+    llm_client.close_all()
+
+
+def test_client_is_shared_per_key():
+    client = llm_client.get_client("test")
+    assert llm_client.get_client("test") is client
+    assert llm_client.get_client("other") is not client
+    assert llm_client.get_client("test", "http://localhost:1") is not client
+
+
+def test_client_timeouts_and_retries():
+    client = llm_client.get_client("test")
+    assert client.max_retries == llm_client.MAX_RETRIES
+    assert client.timeout.connect == llm_client.CONNECT_TIMEOUT
+    assert client.timeout.read == llm_client.READ_TIMEOUT
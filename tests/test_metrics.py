@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from utilities import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    yield
+    metrics.disable()
+    metrics.reset()
+    if metrics._log_handler is not None:
+        metrics.logger.removeHandler(metrics._log_handler)
+        metrics._log_handler.close()
+        metrics._log_handler = None
+
+
+def test_disabled_metrics_record_nothing():
+    with metrics.span("stage"):
+        pass
+    assert metrics.snapshot() == []
+
+
+def test_json_logs_are_written_to_stderr(capsys):
+    metrics.enable(json_logs=True)
+    metrics.observe("chat.chunks", 3, unit="chunks", user="alice")
+    record = json.loads(capsys.readouterr().err.strip())
+    assert record["metric"] == "chat.chunks" and record["value"] == 3 and record["user"] == "alice"
+
+
+def test_json_logs_are_written_to_a_file(tmp_path):
+    log_path = tmp_path / "metrics.jsonl"
+    metrics.enable(json_logs=True, log_path=str(log_path))
+    with metrics.span("rag.encode"):
+        pass
+    metrics.enable(json_logs=True, log_path=str(log_path))
+    metrics.observe("rag.encode", 0.5)
+    metrics._log_handler.flush()
+    records = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    # Enabling twice does not attach a second handler
+    assert [r["metric"] for r in records] == ["rag.encode", "rag.encode"]
+    assert metrics.snapshot()[0]["count"] == 2
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from utilities.multi_source import MultiSourceRetriever, QASource, chunk_text
+
+
+class StaticSource:
+    def __init__(self, name, hits, delay=0.0, weight=1.0, budget=1.0, min_score=0.5):
+        self.name = name
+        self.hits = hits
+        self.delay = delay
+        self.weight = weight
+        self.budget = budget
+        self.min_score = min_score
+
+    def search(self, query, top_k):
+        time.sleep(self.delay)
+        return [dict(hit, source=self.name) for hit in self.hits[:top_k]]
+
+
+def hit(question, answer, similarity):
+    return {"question": question, "answer": answer, "similarity": similarity}
+
+
+def test_multi_source_merges_normalized_scores():
+    qa = StaticSource("qa", [hit("Q1?", "A1", 0.9), hit("Q2?", "A2", 0.6)])
+    docs = StaticSource("documents", [hit("", "Excerpt", 0.95)], weight=0.5)
+    retriever = MultiSourceRetriever([qa, docs], top_k=3)
+    results = retriever.retrieve_top_questions("query")
+    assert [r["answer"] for r in results] == ["A1", "Excerpt", "A2"]
+    assert results[0]["score"] == pytest.approx(0.8) and results[0]["source"] == "qa"
+    retriever.close()
+
+
+def test_slow_source_is_dropped_and_skipped_while_busy():
+    qa = StaticSource("qa", [hit("Q1?", "A1", 0.9)])
+    slow = StaticSource("slow", [hit("", "Late", 0.99)], delay=0.3, budget=0.05)
+    retriever = MultiSourceRetriever([qa, slow])
+
+    start = time.monotonic()
+    assert [r["answer"] for r in retriever.retrieve_top_questions("q")] == ["A1"]
+    assert time.monotonic() - start < 0.25
+    # Still running from the first query: not submitted again
+    assert [r["answer"] for r in retriever.retrieve_top_questions("q")] == ["A1"]
+    retriever.close()
+
+
+def test_qa_source_wraps_rag(rag, corpus):
+    source = QASource(rag)
+    assert source.min_score == rag.min_similarity
+    hits = source.search(corpus[2]["question"], 2)
+    assert hits[0]["question"] == corpus[2]["question"] and hits[0]["source"] == "qa"
+
+
+def test_chunk_text_respects_size_and_keeps_text():
+    text = "\n".join(f"Paragraph {i}. It has two sentences!" for i in range(100))
+    chunks = chunk_text(text, chunk_size=200, overlap=40)
+    assert all(len(c) <= 200 for c in chunks)
+    assert chunks[0].startswith("Paragraph 0.")
+    assert "Paragraph 99. It has two sentences!" in chunks[-1]
+    # Every paragraph survives chunking
+    assert all(any(f"Paragraph {i}." in c for c in chunks) for i in range(100))
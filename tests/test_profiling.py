@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from utilities import profiling
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    profiling.enable(mode="cprofile", trace_memory=False, profile_dir=str(tmp_path))
+    yield
+    profiling.disable()
+
+
+def page(name, stop_early=False):
+    profiling.start_rerun(name)
+    sum(range(10000))
+    if stop_early:
+        # What st.rerun()/st.stop() do: leave the page with an exception
+        raise RuntimeError("rerun")
+    profiling.stop_rerun()
+
+
+def run_pages(*pages):
+    for name, stop_early in pages:
+        try:
+            page(name, stop_early)
+        except RuntimeError:
+            pass
+
+
+def exits():
+    return {p["name"]: p["exit"] for p in profiling.list_profiles(kind="rerun")}
+
+
+def test_rerun_is_profiled_until_stop(profiles):
+    run_pages(("pages/a.py", False))
+    assert exits() == {"pages/a.py": None}
+
+
+def test_early_exit_is_closed_by_next_rerun_and_thread_exit(profiles):
+    thread = threading.Thread(target=run_pages, args=(
+        ("pages/a.py", True), ("pages/b.py", False), ("pages/c.py", True)))
+    thread.start()
+    thread.join()
+    assert exits() == {"pages/a.py": "interrupted", "pages/b.py": None, "pages/c.py": "interrupted"}
+
+
+def test_disabled_profiling_records_nothing(profiles):
+    profiling.disable()
+    run_pages(("pages/a.py", False), ("pages/b.py", True))
+    assert exits() == {}
@@ -0,0 +1,55 @@
+from utilities.chatbot import ChatBot
+from utilities.conversation import REFERENCES_IN_CONTEXT
+from utilities.prompt_builder import PromptBuilder, estimate_tokens, reference_key
+
+
+def reference(question, answer, similarity=0.9):
+    return {"question": question, "answer": answer, "similarity": similarity}
+
+
+def test_prompt_builder_skips_references_already_in_context():
+    refs = [reference("Is coffee bad for gout?", "No."), reference("Can tea help with flu?", "Maybe.")]
+    kept, in_context = PromptBuilder().select("coffee", refs, [reference_key(refs[0])])
+    assert [r["question"] for r in kept] == ["Can tea help with flu?"]
+    assert in_context == 1
+
+
+def test_prompt_builder_drops_near_duplicates():
+    refs = [reference("Is coffee bad for gout?", "No, in moderation."),
+            reference("Is coffee bad for gout ?", "Not really.")]
+    kept = PromptBuilder().build("coffee gout", refs)
+    assert len(kept) == 1 and kept[0]["answer"] == "No, in moderation."
+
+
+def test_prompt_builder_respects_token_budget():
+    long_answer = " ".join(f"Sentence {i} about coffee and gout." for i in range(200))
+    refs = [reference(f"Question {i} about coffee?", long_answer + str(i)) for i in range(10)]
+    builder = PromptBuilder(token_budget=300, max_answer_tokens=100)
+    kept = builder.build("coffee gout", refs)
+    assert kept
+    total = sum(builder._cost(r["question"], r["answer"]) for r in kept)
+    assert total <= 300
+    assert all(estimate_tokens(r["answer"]) <= 100 for r in kept)
+
+
+def test_compress_keeps_relevant_sentences_in_order():
+    answer = "Coffee is fine. The weather is nice. Gout flares need care. Dogs bark."
+    compressed = PromptBuilder.compress(answer, {"coffee", "gout"}, budget=12)
+    assert compressed == "Coffee is fine. … Gout flares need care. …"
+
+
+def test_repeated_references_note_only_on_conversation_turns(rag, corpus, fake_client):
+    bot = ChatBot(api_key="test", model="deepseek-chat", rag=rag)
+    bot.client = fake_client
+    fake_client.n, fake_client.delay = 2, 0
+    question = corpus[3]["question"]
+
+    list(bot.generate_response(question))
+    assert bot.conversation.last_turn().references
+    list(bot.generate_response(question))
+    turn = bot.conversation.last_turn()
+    assert turn.references == []
+    assert REFERENCES_IN_CONTEXT in turn.user_content()
+    assert REFERENCES_IN_CONTEXT in fake_client.requests[-1]["messages"][-1]["content"]
+    # Stateless queries never carry the note
+    assert REFERENCES_IN_CONTEXT not in rag.rag_query("unrelated words entirely")
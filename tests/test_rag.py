@@ -0,0 +1,104 @@
+import os
+
+import faiss
+
+from benchmarks.synthetic import write_corpus
+from utilities.rag import RAG
+
+
+def test_retrieves_the_exact_question(rag, corpus):
+    results = rag.retrieve_top_questions(corpus[7]["question"])
+    assert results[0]["question"] == corpus[7]["question"]
+    assert results[0]["answer"] == corpus[7]["answer"]
+    assert results[0]["topic"] == corpus[7]["topic"]
+
+
+def test_batch_matches_single_queries(rag, corpus):
+    queries = [corpus[i]["question"] for i in (1, 12, 33)]
+    batched = rag.retrieve_top_questions_batch(queries)
+    assert batched == [rag.retrieve_top_questions(q) for q in queries]
+
+
+def test_reuses_matching_index(kb_paths, encoder, rag):
+    index_path, qa_path = kb_paths
+    mtime = os.path.getmtime(index_path)
+    RAG(index_path, qa_path, model=encoder)
+    assert os.path.getmtime(index_path) == mtime
+
+
+def test_rebuilds_index_built_with_another_encoder(kb_paths, encoder, rag):
+    index_path, qa_path = kb_paths
+    assert RAG.load_index_manifest(index_path)["encoder"] == "sentence_transformer"
+    RAG(index_path, qa_path, model=encoder, encoder="mean_pooling")
+    assert RAG.load_index_manifest(index_path)["encoder"] == "mean_pooling"
+
+
+def test_manifest_without_encoder_is_a_sentence_transformer_index(rag):
+    manifest = {k: v for k, v in rag.index_config.items() if k != "encoder"}
+    assert RAG.manifest_matches(manifest, rag.index_config)
+    assert not RAG.manifest_matches(manifest, {**rag.index_config, "encoder": "mean_pooling"})
+
+
+def test_rebuilds_legacy_index_without_manifest(kb_paths, encoder, corpus, rag):
+    index_path, qa_path = kb_paths
+    os.remove(index_path + ".manifest.json")
+    write_corpus(corpus[:41], qa_path)
+
+    reloaded = RAG(index_path, qa_path, model=encoder, top_k=50, min_similarity=0.0)
+    assert reloaded.index.ntotal == len(reloaded.qa_pairs) == 41
+    # Would raise IndexError with the stale 50-row index
+    assert len(reloaded.retrieve_top_questions(corpus[45]["question"])) == 41
+    assert RAG.load_index_manifest(index_path)["qa_sha256"] == reloaded.index_config["qa_sha256"]
+
+
+def test_rebuilds_index_whose_manifest_has_no_qa_fingerprint(kb_paths, encoder, corpus, rag):
+    index_path, qa_path = kb_paths
+    # Manifest written before the QA fingerprint was recorded
+    RAG.save_faiss_index(rag.index, index_path, {k: v for k, v in rag.index_config.items()
+                                                 if k != "qa_sha256"})
+    assert "qa_sha256" not in RAG.load_index_manifest(index_path)
+    write_corpus(corpus[:41], qa_path)
+
+    reloaded = RAG(index_path, qa_path, model=encoder)
+    assert reloaded.index.ntotal == 41
+
+
+def test_rebuilds_index_that_does_not_match_its_manifest(kb_paths, encoder, corpus, rag):
+    index_path, qa_path = kb_paths
+    # Replaced behind the manifest's back
+    faiss.write_index(RAG.build_faiss_index(rag.index.reconstruct_n(0, 10)), index_path)
+    reloaded = RAG(index_path, qa_path, model=encoder)
+    assert reloaded.index.ntotal == len(corpus)
+    RAG.check_index_manifest(reloaded.index, index_path, verify_checksum=True)
+
+
+def test_reload_rebuilds_legacy_index(kb_paths, corpus, rag):
+    index_path, qa_path = kb_paths
+    os.remove(index_path + ".manifest.json")
+    write_corpus(corpus[:30], qa_path)
+
+    assert rag.reload(background=False)
+    assert rag.index.ntotal == len(rag.qa_pairs) == 30
+    assert rag.reload_status["state"] == "reloaded"
+
+
+def test_reload_keeps_knowledge_base_when_file_is_unchanged(rag):
+    kb = rag._kb
+    assert not rag.reload(background=False)
+    assert rag._kb is kb
+
+
+def test_format_prompt_without_results_has_no_note():
+    prompt = RAG.format_prompt("Is coffee bad for gout?", [])
+    assert prompt.startswith("User query: Is coffee bad for gout?\n\nReference information:\nPlease answer")
+    assert "No new references" not in prompt
+
+
+def test_format_prompt_formats_excerpts_and_qa_pairs():
+    prompt = RAG.format_prompt("q", [
+        {"question": "Q1?", "answer": "A1.", "similarity": 0.9},
+        {"question": "", "answer": "Some document text.", "similarity": 0.8},
+    ])
+    assert "Reference 1:\nQuestion: Q1?\nAnswer: A1.\n\n" in prompt
+    assert "Reference 2:\nExcerpt: Some document text.\n\n" in prompt
+    assert "Similarity" not in prompt
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from utilities.rag import RAG
+from utilities.retrieval_service import MicroBatcher, RetrievalClient, RetrievalHTTPServer, RetrievalUnixServer
+
+
+@pytest.fixture
+def batcher(rag):
+    return MicroBatcher(rag, max_batch_size=8, max_wait_ms=20)
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_micro_batcher_returns_per_query_results(rag, corpus, batcher):
+    queries = [corpus[i]["question"] for i in range(6)]
+    futures = [batcher.submit(q, top_k=2 if i % 2 else 3) for i, q in enumerate(queries)]
+    wait(futures, timeout=10)
+    for i, (query, future) in enumerate(zip(queries, futures)):
+        expected = rag.retrieve_top_questions(query, 2 if i % 2 else 3)
+        assert [r["question"] for r in future.result()] == [r["question"] for r in expected]
+    assert batcher.stats()["mean_batch_size"] > 1
+
+
+def test_micro_batcher_fails_every_query_of_a_failed_batch():
+    class Broken:
+        top_k, min_similarity = 3, 0.5
+
+        def retrieve_top_questions_batch(self, queries, top_k, min_similarity):
+            raise RuntimeError("index unavailable")
+
+    batcher = MicroBatcher(Broken(), max_wait_ms=20)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=10)
+
+
+def test_http_client_matches_local_rag(rag, corpus, batcher):
+    server = serve(RetrievalHTTPServer(("127.0.0.1", 0), batcher))
+    try:
+        client = RetrievalClient(f"http://127.0.0.1:{server.server_address[1]}")
+        query = corpus[5]["question"]
+        assert client.retrieve_top_questions(query) == rag.retrieve_top_questions(query)
+        assert client.rag_query(query) == RAG.format_prompt(query, rag.retrieve_top_questions(query))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_unix_socket_client(tmp_path, rag, corpus, batcher):
+    path = str(tmp_path / "rag.sock")
+    server = serve(RetrievalUnixServer(path, batcher))
+    try:
+        client = RetrievalClient(f"unix://{path}")
+        queries = [corpus[1]["question"], corpus[2]["question"]]
+        assert client.retrieve_top_questions_batch(queries) == rag.retrieve_top_questions_batch(queries)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,65 @@
+import time
+
+from utilities.scheduler import PRIORITY_ANSWER, PRIORITY_SUGGESTION, RequestScheduler
+
+
+def test_limits_concurrency_and_releases_slots():
+    scheduler = RequestScheduler(max_concurrent=2)
+    tickets = [scheduler.submit("alice") for _ in range(3)]
+    assert [t.wait(0) for t in tickets] == [True, True, False]
+    assert tickets[2].position() == 1
+
+    tickets[0].release()
+    assert tickets[2].wait(0)
+    assert scheduler.stats()["active"] == 2
+
+
+def test_round_robin_between_users():
+    scheduler = RequestScheduler(max_concurrent=1)
+    blocker = scheduler.submit("blocker")
+    alice = [scheduler.submit("alice") for _ in range(3)]
+    bob = scheduler.submit("bob")
+    assert bob.position() == 2
+
+    order = []
+    current = blocker
+    for _ in range(4):
+        current.release()
+        current = next(t for t in alice + [bob] if t.state == "granted")
+        order.append("bob" if current is bob else "alice")
+    assert order == ["alice", "bob", "alice", "alice"]
+
+
+def test_answers_are_served_before_suggestions():
+    scheduler = RequestScheduler(max_concurrent=1)
+    blocker = scheduler.submit("alice")
+    suggestion = scheduler.submit("alice", PRIORITY_SUGGESTION)
+    answer = scheduler.submit("bob", PRIORITY_ANSWER)
+    blocker.release()
+    assert answer.wait(0) and not suggestion.wait(0)
+
+
+def test_suggestion_waiting_past_max_wait_is_not_starved():
+    scheduler = RequestScheduler(max_concurrent=1, max_wait=0.05)
+    current = scheduler.submit("alice")
+    suggestion = scheduler.submit("alice", PRIORITY_SUGGESTION)
+    # A steady stream of answers keeps the answer queue non-empty
+    answers = [scheduler.submit("bob") for _ in range(3)]
+    current.release()
+    assert answers[0].wait(0) and not suggestion.wait(0)
+
+    time.sleep(0.06)
+    answers[0].release()
+    assert suggestion.wait(0)
+    assert not answers[1].wait(0)
+
+
+def test_releasing_a_waiting_ticket_leaves_the_queue():
+    scheduler = RequestScheduler(max_concurrent=1)
+    blocker = scheduler.submit("alice")
+    waiting = scheduler.submit("bob")
+    waiting.release()
+    waiting.release()
+    blocker.release()
+    stats = scheduler.stats()
+    assert stats["active"] == 0 and stats["queued"]["answer"] == 0
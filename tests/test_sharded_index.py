@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from benchmarks.synthetic import write_corpus
+from utilities.rag import RAG
+from utilities.sharded_index import ShardedIndex
+
+
+def test_sharded_index_matches_flat_search(tmp_path, rag, corpus):
+    embeddings = rag.index.reconstruct_n(0, rag.index.ntotal)
+    shard_dir = str(tmp_path / "shards")
+    sharded = ShardedIndex.build(embeddings, [item["topic"] for item in corpus], shard_dir,
+                                 max_shards=64, n_probe=10, max_loaded=4)
+    assert sharded.ntotal == len(corpus)
+
+    queries = rag.generate_embeddings([corpus[i]["question"] for i in (0, 9, 21)])
+    flat_scores, flat_ids = rag.index.search(queries, 5)
+    scores, ids = sharded.search(queries, 5)
+    # One shard per topic; probing all ten is exhaustive
+    np.testing.assert_array_equal(ids, flat_ids)
+    np.testing.assert_allclose(scores, flat_scores, rtol=1e-5)
+    assert len(sharded.loaded_shards) <= 4
+
+
+def test_topics_are_merged_down_to_max_shards(tmp_path, rag, corpus):
+    embeddings = rag.index.reconstruct_n(0, rag.index.ntotal)
+    sharded = ShardedIndex.build(embeddings, [item["topic"] for item in corpus],
+                                 str(tmp_path / "shards"), max_shards=3, n_probe=1)
+    assert sharded.router.ntotal <= 3
+    # Every row lives in exactly one shard
+    rows = np.concatenate([np.load(ShardedIndex._ids_path(sharded.shard_dir, s))
+                           for s in range(sharded.router.ntotal)])
+    assert sorted(rows.tolist()) == list(range(len(corpus)))
+
+
+def test_rag_retrieves_through_shards(tmp_path, kb_paths, encoder, corpus):
+    index_path, qa_path = kb_paths
+    rag = RAG(index_path, qa_path, model=encoder, shard_dir=str(tmp_path / "shards"),
+              n_probe_shards=2, min_similarity=0.3)
+    assert isinstance(rag.index, ShardedIndex)
+    assert rag.retrieve_top_questions(corpus[17]["question"])[0]["question"] == corpus[17]["question"]
+
+
+def test_shards_of_another_qa_file_are_not_reused(tmp_path, kb_paths, encoder, corpus):
+    index_path, qa_path = kb_paths
+    shard_dir = str(tmp_path / "shards")
+    rag = RAG(index_path, qa_path, model=encoder, shard_dir=shard_dir)
+    assert rag.index.manifest["qa_sha256"] == rag.index_config["qa_sha256"]
+    assert RAG(index_path, qa_path, model=encoder, shard_dir=shard_dir).index.shard_dir == rag.index.shard_dir
+
+    # Same number of pairs, different content
+    edited = [dict(item) for item in corpus]
+    edited[0]["question"] = "A question that was rewritten?"
+    write_corpus(edited, qa_path)
+    rebuilt = RAG(index_path, qa_path, model=encoder, shard_dir=shard_dir, min_similarity=0.0)
+    assert rebuilt.index.shard_dir != rag.index.shard_dir
+    assert rebuilt.index.manifest["qa_sha256"] == rebuilt.index_config["qa_sha256"]
+    assert rebuilt.retrieve_top_questions(edited[0]["question"])[0]["question"] == edited[0]["question"]
+
+
+def test_reload_in_shard_mode_keeps_the_previous_generation(tmp_path, kb_paths, encoder, corpus):
+    index_path, qa_path = kb_paths
+    shard_dir = str(tmp_path / "shards")
+    rag = RAG(index_path, qa_path, model=encoder, shard_dir=shard_dir)
+    first = rag.index
+
+    write_corpus(corpus[:30], qa_path)
+    assert rag.reload(background=False)
+    assert rag.index.ntotal == len(rag.qa_pairs) == 30
+    # Queries still holding the old index can read its shards
+    assert os.path.isdir(first.shard_dir)
+    first.evict()
+    first.search(rag.generate_embeddings([corpus[40]["question"]]), 3)
+
+    second = rag.index
+    write_corpus(corpus[:20], qa_path)
+    assert rag.reload(background=False)
+    assert not os.path.exists(first.shard_dir)
+    assert sorted(os.listdir(shard_dir)) == sorted(
+        os.path.basename(d) for d in (second.shard_dir, rag.index.shard_dir))
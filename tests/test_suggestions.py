@@ -0,0 +1,10 @@
+from utilities.suggestions import LocalSuggestionEngine
+
+
+def test_local_suggestions_exclude_the_asked_question(rag, corpus):
+    engine = LocalSuggestionEngine(rag, min_similarity=0.0)
+    question = corpus[4]["question"]
+    suggestions = engine.suggest(question, corpus[4]["answer"], n=3)
+    assert len(suggestions) == 3
+    assert question not in suggestions
+    assert len(set(suggestions)) == 3
@@ -0,0 +1,43 @@
+import numpy as np
+
+from benchmarks.bench_rag import percentiles, recall_at_k
+from benchmarks.synthetic import HashingEncoder, generate_corpus, generate_queries
+
+
+def cosine(a, b):
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_corpus_is_deterministic_and_distinct():
+    corpus = generate_corpus(200, n_topics=20)
+    assert corpus == generate_corpus(200, n_topics=20)
+    assert len({item["question"] for item in corpus}) == 200
+    assert set(corpus[0]) == {"topic", "question", "answer", "source"}
+
+
+def test_paraphrases_stay_close_to_their_topic():
+    encoder = HashingEncoder(dim=128)
+    corpus = generate_corpus(20, n_topics=20)
+    query = generate_queries(corpus, 1)[0]
+    vectors = encoder.encode([query] + [item["question"] for item in corpus])
+    scores = [cosine(vectors[0], v) for v in vectors[1:]]
+    best = corpus[int(np.argmax(scores))]
+    subject, condition = best["topic"].split(" #")[0].split(" and ")
+    assert subject in query.lower() and condition in query.lower()
+
+
+def test_encoder_is_deterministic_and_returns_tensors():
+    texts = ["Can green tea help with gout?", "zinc"]
+    first = HashingEncoder(dim=64).encode(texts)
+    np.testing.assert_array_equal(first, HashingEncoder(dim=64).encode(texts))
+    assert tuple(HashingEncoder(dim=64).encode(texts, convert_to_tensor=True).shape) == (2, 64)
+
+
+def test_exact_index_has_full_recall(rag, encoder, corpus):
+    queries = rag.generate_embeddings(generate_queries(corpus, 10))
+    assert recall_at_k(rag, rag.index, queries, 5) == 1.0
+
+
+def test_percentiles():
+    stats = percentiles([0.001 * i for i in range(1, 101)])
+    assert stats["p50_ms"] < stats["p95_ms"] < stats["p99_ms"]
@@ -0,0 +1,189 @@
+"""
+生理指标的本地解读
+
+每项指标按成人参考范围分为五级：偏低(-2)、临界偏低(-1)、正常(0)、临界偏高(1)、偏高(2)。
+所有记录先转为 (记录数, 指标数) 的矩阵，再与阈值向量整体比较得到等级矩阵，
+因此单条记录和整段历史用同一套向量化计算。提示词里只放异常和临界的指标，
+不再把原始JSON交给模型解读。
+"""
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utilities.mongodb import CloudData
+
+# (指标, 名称, 单位, 偏低阈值, 临界偏低阈值, 临界偏高阈值, 偏高阈值, {等级: 说明})
+# 数值 < 偏低阈值 为-2，< 临界偏低阈值 为-1，>= 偏高阈值 为2，>= 临界偏高阈值 为1
+# 血压采用ESC分级：130-139/85-89为正常高值，>=140/90为高血压
+REFERENCE_RANGES = [
+    ("systolic", "systolic BP", "mmHg", 90, 90, 130, 140,
+     {-2: "hypotension", 1: "high-normal", 2: "hypertension"}),
+    ("diastolic", "diastolic BP", "mmHg", 60, 60, 85, 90,
+     {-2: "hypotension", 1: "high-normal", 2: "hypertension"}),
+    ("heart_rate", "heart rate", "bpm", 50, 60, 100, 120,
+     {-2: "bradycardia", -1: "low", 1: "tachycardia", 2: "marked tachycardia"}),
+    ("body_temp", "body temperature", "°C", 35.0, 36.0, 37.3, 38.0,
+     {-2: "hypothermia", -1: "low", 1: "low-grade fever", 2: "fever"}),
+    ("bmi", "BMI", "kg/m²", 18.5, 18.5, 25.0, 30.0,
+     {-2: "underweight", 1: "overweight", 2: "obese"}),
+    ("glucose", "glucose", "mmol/L", 3.9, 3.9, 5.6, 7.0,
+     {-2: "hypoglycaemia", 1: "prediabetic if fasting", 2: "diabetic if fasting"}),
+    ("cholesterol", "total cholesterol", "mmol/L", -np.inf, -np.inf, 5.2, 6.2,
+     {}),
+    ("hdl", "HDL", "mmol/L", 1.0, 1.0, np.inf, np.inf,
+     {}),
+]
+METRICS = [r[0] for r in REFERENCE_RANGES]
+_LOW, _BORDERLINE_LOW, _BORDERLINE_HIGH, _HIGH = (
+    np.array([r[i] for r in REFERENCE_RANGES], dtype=float) for i in (3, 4, 5, 6))
+LEVEL_NAMES = {-2: "low", -1: "borderline low", 1: "borderline high", 2: "high"}
+
+_BLOOD_PRESSURE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*$")
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def to_matrix(records):
+    """
+    把指标记录（页面保存的dict）转为 (len(records), len(METRICS)) 的float矩阵，缺失或无法解析为NaN
+    """
+    values = np.full((len(records), len(METRICS)), np.nan)
+    for row, record in enumerate(records):
+        match = _BLOOD_PRESSURE.match(str(record.get("blood_pressure", "")))
+        if match:
+            values[row, 0:2] = float(match.group(1)), float(match.group(2))
+        values[row, 2:] = [_number(record.get(metric)) for metric in METRICS[2:]]
+    return values
+
+
+def classify(values):
+    """
+    向量化地计算等级矩阵，NaN（未记录）为正常
+
+    参数:
+        values: to_matrix的结果
+
+    返回:
+        与values同形状的int8等级矩阵
+    """
+    levels = np.zeros(values.shape, dtype=np.int8)
+    levels[values >= _BORDERLINE_HIGH] = 1
+    levels[values >= _HIGH] = 2
+    levels[values < _BORDERLINE_LOW] = -1
+    levels[values < _LOW] = -2
+    return levels
+
+
+def interpret_batch(records):
+    """
+    批量解读多条记录（例如一个用户的历史或所有用户的当前指标）
+
+    返回:
+        (values, levels) 两个 (len(records), len(METRICS)) 矩阵
+    """
+    values = to_matrix(records)
+    return values, classify(values)
+
+
+def _finding(name, value, unit, level, notes):
+    note = LEVEL_NAMES[level] + (f" ({notes[level]})" if level in notes else "")
+    return f"{name} {value} {unit} {note}"
+
+
+def _worst(levels):
+    return int(levels[np.argmax(np.abs(levels))])
+
+
+def summarize(record):
+    """
+    单条记录的紧凑解读：只列出异常和临界指标，其余已记录的指标合并为一句
+    """
+    values, levels = interpret_batch([record])
+    values, levels = values[0], levels[0]
+    recorded = ~np.isnan(values)
+    if not recorded.any():
+        return ""
+    findings = []
+    # 收缩压和舒张压合并为一项，取较严重的等级
+    if recorded[:2].all() and levels[:2].any():
+        level = _worst(levels[:2])
+        notes = REFERENCE_RANGES[int(np.argmax(np.abs(levels[:2])))][7]
+        findings.append(_finding("BP", f"{values[0]:g}/{values[1]:g}", "mmHg", level, notes))
+    for i, (_, name, unit, *_, notes) in enumerate(REFERENCE_RANGES[2:], start=2):
+        if recorded[i] and levels[i]:
+            findings.append(_finding(name, f"{values[i]:g}", unit, int(levels[i]), notes))
+    if not findings:
+        return "All recorded metrics within normal range."
+    others = " Other recorded metrics normal." if (recorded[2:] & (levels[2:] == 0)).any() else ""
+    return "Flagged: " + "; ".join(findings) + "." + others
+
+
+def summarize_history(records):
+    """
+    最近几次记录中各指标超出范围的次数，只列出至少超出一次的指标
+    """
+    if len(records) < 2:
+        return ""
+    _, levels = interpret_batch(records)
+    high = (levels > 0).sum(axis=0)
+    low = (levels < 0).sum(axis=0)
+    trends = []
+    for i, (_, name, *_) in enumerate(REFERENCE_RANGES):
+        if high[i]:
+            trends.append(f"{name} high {high[i]}/{len(records)}")
+        if low[i]:
+            trends.append(f"{name} low {low[i]}/{len(records)}")
+    if not trends:
+        return ""
+    return "Recent readings: " + ", ".join(trends) + "."
+
+
+class BiomarkerStore:
+    """
+    按用户名存取生理指标，并在会话内缓存数据和解读后的提示词片段
+    """
+
+    def __init__(self, cd: CloudData, history_limit: int = 10) -> None:
+        """
+        参数:
+            cd: 数据库连接
+            history_limit: 提示词中参与趋势统计的最近记录数
+        """
+        self.cd = cd
+        self.history_limit = history_limit
+        self._data = {}
+        self._fragments = {}
+
+    def get(self, user_name: str) -> dict:
+        if user_name not in self._data:
+            self._data[user_name] = self.cd.get_biomarker(user_name)
+        return self._data[user_name]
+
+    def save(self, user_name: str, biomarker: dict) -> None:
+        self.cd.update_biomarker(user_name, biomarker)
+        self.cd.insert_biomarker_history(
+            user_name, {**biomarker, "timestamp": datetime.now(timezone.utc)})
+        self._data[user_name] = dict(biomarker)
+        self._fragments.pop(user_name, None)
+
+    def history(self, user_name: str) -> list[dict]:
+        """
+        最近的指标记录，从新到旧
+        """
+        return self.cd.get_biomarker_history(user_name, self.history_limit)
+
+    def prompt_fragment(self, user_name: str) -> str:
+        """
+        返回本地解读后的指标摘要（异常/临界项和历史趋势），只在数据变化后重新计算
+        """
+        if user_name not in self._fragments:
+            fragment = summarize(self.get(user_name))
+            trend = summarize_history(self.history(user_name))
+            self._fragments[user_name] = f"{fragment} {trend}".strip()
+        return self._fragments[user_name]
@@ -1,8 +1,18 @@
-import openai
-from openai import OpenAI
 from typing import Iterator, Dict, Any
 from utilities.rag import RAG, NextQuestionGenerator
+from utilities.biomarker import BiomarkerStore
+from utilities.conversation import Conversation, Turn
+from utilities.history import HistoryWriter
+from utilities.prompt_builder import PromptBuilder
+from utilities.scheduler import PRIORITY_ANSWER, scheduler
+from utilities.suggestions import LocalSuggestionEngine
+from utilities.llm_client import DEFAULT_BASE_URL, get_client
+from utilities import metrics
 import json
+import threading
+import time
+import weakref
+from collections import deque
 
 """
 The response example for deepseek-reasoner:
@@ -42,29 +52,279 @@ The response example for deepseek-reasoner:
 """
 
 
+FOLLOW_UP_START = "<<<FOLLOW_UPS>>>"
+FOLLOW_UP_END = "<<<END>>>"
+FOLLOW_UP_INSTRUCTION = (
+    "\n\nAfter your answer, append exactly 3 short follow-up questions the user might ask next, "
+    f"as a JSON array of strings between the markers {FOLLOW_UP_START} and {FOLLOW_UP_END}, e.g.\n"
+    f'{FOLLOW_UP_START}\n["First question?", "Second question?", "Third question?"]\n{FOLLOW_UP_END}'
+)
+
+
+class FollowUpTrailerParser:
+    """
+    Incrementally strips the follow-up trailer from streamed answer content.
+
+    Text that might be the beginning of FOLLOW_UP_START is held back until it
+    is disambiguated, so the marker never reaches the display.
+    """
+
+    def __init__(self) -> None:
+        self._pending = ""
+        self._trailer = None
+
+    def feed(self, text: str) -> str:
+        if self._trailer is not None:
+            self._trailer += text
+            return ""
+        self._pending += text
+        idx = self._pending.find(FOLLOW_UP_START)
+        if idx >= 0:
+            visible = self._pending[:idx]
+            self._trailer = self._pending[idx + len(FOLLOW_UP_START):]
+            self._pending = ""
+            return visible
+        # Hold back the longest suffix that is a prefix of the marker
+        keep = 0
+        for n in range(min(len(self._pending), len(FOLLOW_UP_START) - 1), 0, -1):
+            if FOLLOW_UP_START.startswith(self._pending[-n:]):
+                keep = n
+                break
+        visible = self._pending[:len(self._pending) - keep]
+        self._pending = self._pending[len(self._pending) - keep:]
+        return visible
+
+    def finish(self) -> str:
+        """
+        Flush held-back text once the stream has ended without a trailer
+        """
+        visible, self._pending = self._pending, ""
+        return visible if self._trailer is None else ""
+
+    def suggestions(self) -> list[str] | None:
+        """
+        Parsed follow-up questions, or None if the trailer is missing or malformed
+        """
+        if self._trailer is None:
+            return None
+        raw = self._trailer.split(FOLLOW_UP_END)[0].strip()
+        try:
+            questions = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(questions, list):
+            return None
+        questions = [q.strip() for q in questions if isinstance(q, str) and q.strip()]
+        return questions or None
+
+
+class AnswerState:
+    """
+    State of one turn's answer stream. Kept per turn so that a cancelled
+    stream still winding down on another thread never touches the response
+    or abort flag of the turn that replaced it.
+    """
+
+    def __init__(self) -> None:
+        self.response = None
+        self.aborted = False
+        self.last_activity = time.monotonic()
+        self.finished = threading.Event()
+        self._abort_listeners = []
+
+    def on_abort(self, callback) -> None:
+        self._abort_listeners.append(callback)
+
+    def abort(self) -> None:
+        """
+        Stop the stream: the generator exits at its next check and reading
+        from the closed response fails inside it instead of blocking
+        """
+        self.aborted = True
+        response = self.response
+        if response is not None:
+            response.close()
+        for callback in self._abort_listeners:
+            callback()
+
+
+class AnswerStream:
+    """
+    Iterator over the chunks of one answer, carrying that turn's AnswerState
+    """
+
+    def __init__(self, generator: Iterator[Dict[str, str]], state: AnswerState) -> None:
+        self._generator = generator
+        self.state = state
+
+    def __iter__(self) -> "AnswerStream":
+        return self
+
+    def __next__(self) -> Dict[str, str]:
+        return next(self._generator)
+
+    def close(self) -> None:
+        self._generator.close()
+
+
+class StreamReaper:
+    """
+    Background thread that closes the HTTP response of answer streams nobody
+    has read from for longer than the bot's stream_idle_timeout (e.g. the
+    user navigated away mid-answer), so their pooled connection is returned
+    and server-side generation stops.
+    """
+
+    def __init__(self, interval: float = 5.0) -> None:
+        self.interval = interval
+        self._bots = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, bot: "ChatBot") -> None:
+        with self._lock:
+            self._bots.add(bot)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="chat-stream-reaper", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                bots = list(self._bots)
+            now = time.monotonic()
+            for bot in bots:
+                state = bot._active_state
+                if state is not None and state.response is not None \
+                        and now - state.last_activity > bot.stream_idle_timeout:
+                    state.abort()
+
+
+_reaper = StreamReaper()
+
+
+class BufferedStream:
+    """
+    Drains a ChatBot answer stream on a background producer thread into a
+    bounded buffer, so network reads keep up with the server regardless of
+    how often the UI reruns. The UI only calls drain().
+
+    When the buffer is full for longer than stall_timeout (nobody is reading
+    any more), the producer closes the stream like the reaper would.
+    """
+
+    def __init__(self, stream: Iterator[Dict[str, str]], capacity: int = 1024,
+                 stall_timeout: float = 60.0) -> None:
+        self._stream = stream
+        self._buffer = deque()
+        self._capacity = capacity
+        self._stall_timeout = stall_timeout
+        self._cond = threading.Condition()
+        self._done = False
+        self._closed = False
+        self.error = None
+        # Cancelling the turn must also wake a producer waiting for buffer space
+        state = getattr(stream, "state", None)
+        if state is not None:
+            state.on_abort(self.close)
+        self._thread = threading.Thread(target=self._produce, name="chat-stream-producer", daemon=True)
+        self._thread.start()
+
+    def _produce(self) -> None:
+        try:
+            for chunk in self._stream:
+                with self._cond:
+                    if not self._cond.wait_for(
+                            lambda: self._closed or len(self._buffer) < self._capacity,
+                            self._stall_timeout) or self._closed:
+                        break
+                    self._buffer.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            # Racing a cancel() that closed the stream under us is not an error
+            if not self._closed:
+                self.error = e
+        finally:
+            # Finalizes the generator (records the turn, frees the scheduler slot)
+            # when we stopped early; a no-op once it is exhausted
+            try:
+                self._stream.close()
+            except ValueError:
+                pass
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> list[Dict[str, str]]:
+        """
+        Wait up to `timeout` seconds (less if the stream ends), then return
+        every buffered chunk
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._done, timeout)
+            chunks = list(self._buffer)
+            self._buffer.clear()
+            self._cond.notify_all()
+            return chunks
+
+    @property
+    def finished(self) -> bool:
+        """
+        The stream has ended and every chunk has been drained
+        """
+        with self._cond:
+            return self._done and not self._buffer
+
+    def close(self) -> None:
+        """
+        Stop producing; the producer thread finalizes the stream
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
 class ChatBot:
     def __init__(
         self,
         api_key: str = "",
         init_prompt: str = "",
         model: str = "deepseek-reasoner",
-        api_base: str = "https://api.deepseek.com",
+        api_base: str = DEFAULT_BASE_URL,
         rag: RAG = None,
-        biomarker_path="user_data/biomarker.json"
+        biomarker_store: BiomarkerStore = None,
+        user_name: str = "",
+        stream_idle_timeout: float = 60.0,
+        inline_suggestions: bool = False,
+        max_turns: int = 50,
+        context_turns: int = 10,
+        history: HistoryWriter = None,
+        suggestion_engine: LocalSuggestionEngine = None,
+        prompt_builder: PromptBuilder = None,
+        retriever: Any = None
     ) -> None:
-        self.client = OpenAI(
-            base_url=api_base,
-            api_key=api_key
-        )
+        self.api_base = api_base
+        self.client = get_client(api_key, api_base)
         self.init_prompt = init_prompt
         self.model = model
-        self.messages = [{
-            "role": "system",
-            "content": init_prompt
-        }]
-        self.abort_generation = False
+        self.conversation = Conversation(init_prompt, max_turns, context_turns)
+        self.stream_idle_timeout = stream_idle_timeout
+        # Ask for follow-up questions in the answer itself instead of a second request
+        self.inline_suggestions = inline_suggestions
+        self._suggestions = None
+        self._active_stream = None
+        self._active_state = None
         self.rag = rag
-        self.biomarker_path = biomarker_path
+        # Where turn references come from, e.g. a MultiSourceRetriever; defaults to the QA index
+        self.retriever = retriever or rag
+        self.biomarker_store = biomarker_store
+        self.user_name = user_name
+        self.history = history
+        # Knowledge-base follow-ups are ready as soon as the answer ends; the LLM only refines them
+        self.suggestion_engine = suggestion_engine
+        self.prompt_builder = prompt_builder or PromptBuilder()
         self.nq = NextQuestionGenerator(
             api_key=api_key, base_url=api_base, model="deepseek-chat")
 
@@ -82,86 +342,180 @@ class ChatBot:
         else:
             raise ValueError()
 
-    def load_json(self, filename):
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.dumps(json.load(f), indent=2)
-        except FileNotFoundError:
-            print(f"文件 {filename} 不存在")
-            return {}
-        except json.JSONDecodeError:
-            print("JSON格式错误")
-            return {}
-
-    def _chat(self, human_input: str, use_rag: bool = True) -> Iterator[Dict[str, str]]:
-        self.abort_generation = False
-        self.messages.append({
-            "role": "user",
-            "content": human_input
-        })
-        full_response = ""
-        full_reasoning = ""
+    def _chat(self, turn: Turn, state: AnswerState) -> Iterator[Dict[str, str]]:
+        start = time.perf_counter()
+        chunk_count = 0
+        response = None
+        state.last_activity = time.monotonic()
+        trailer = FollowUpTrailerParser() if self.inline_suggestions else None
+        # The follow-up instruction is only sent with this request, never stored in history
+        request_messages = self.conversation.api_messages(
+            FOLLOW_UP_INSTRUCTION if trailer is not None else "")
+        ticket = scheduler.submit(self._scheduler_user(), PRIORITY_ANSWER)
 
         try:
+            # While waiting for a slot, report the queue position instead of content
+            while not ticket.wait(0.25):
+                if state.aborted:
+                    return
+                yield {"queue_position": ticket.position()}
+                state.last_activity = time.monotonic()
+
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=self.messages,
+                messages=request_messages,
                 stream=True
             )
+            state.response = response
 
             for chunk in response:
-                if self.abort_generation:
+                if state.aborted:
                     break
+                if chunk_count == 0:
+                    metrics.observe("chat.ttft", time.perf_counter() - start, model=self.model)
+                chunk_count += 1
 
                 parsed = self._parse_chunk(chunk)
+                if trailer is not None and parsed.get("content"):
+                    parsed["content"] = trailer.feed(parsed["content"]) or None
                 if parsed.get("content"):
-                    full_response += parsed["content"]
+                    turn.answer += parsed["content"]
                 if parsed.get("reasoning"):
-                    full_reasoning += parsed["reasoning"]
+                    turn.reasoning += parsed["reasoning"]
 
                 yield parsed
+                state.last_activity = time.monotonic()
 
-            if not self.abort_generation:
-                self.messages.append({
-                    "role": "assistant",
-                    "content": full_response,
-                })
-                self.messages = self.messages[-20:]
+            if trailer is not None and not state.aborted:
+                tail = trailer.finish()
+                self._suggestions = trailer.suggestions()
+                if tail:
+                    turn.answer += tail
+                    yield {"content": tail, "reasoning": None}
+
+        except Exception:
+            # Reading from a stream closed by cancel() or the reaper is an abort, not an error
+            if not state.aborted:
+                raise
 
         finally:
-            self.abort_generation = False
+            # Closing the response returns its connection to the pool and
+            # stops server-side generation when the stream was not exhausted
+            if response is not None:
+                response.close()
+            ticket.release()
+            self.conversation.end_turn(turn)
+            if turn.complete and self.history is not None and self.user_name:
+                self.history.record(self.user_name, self.conversation.id, turn)
+            metrics.observe("chat.total", time.perf_counter() - start, model=self.model)
+            metrics.observe("chat.chunks", chunk_count, unit="chunks",
+                            buckets=metrics.COUNT_BUCKETS, model=self.model)
+            state.finished.set()
 
-    def generate_response(self, human_input: str, use_rag: bool = True) -> Iterator[Dict[str, str]]:
-        if use_rag:
-            human_input = self.rag.rag_query(human_input)
-        return self._chat(human_input, use_rag)
+    def _scheduler_user(self) -> str:
+        # Sessions without a user name are still queued fairly against each other
+        return self.user_name or f"session-{id(self)}"
 
-    def generate_response_with_biomarker(self, human_input: str, use_rag: bool = True) -> Iterator[Dict[str, str]]:
+    def _start_turn(self, human_input: str, use_rag: bool, context: str = "") -> AnswerStream:
+        self.cancel()
+        self._suggestions = None
+        references = None
+        in_context = 0
         if use_rag:
-            human_input = self.rag.rag_query(human_input)
-        biomarker = self.load_json(self.biomarker_path)
-        human_input += ("\n Except those reference, the following is some of the health metric of the user. I hope you can give more specific answer based on that. \n" + biomarker)
-        return self._chat(human_input, use_rag)
-
-    def generate_nq(self) -> list[str]:
-        query = self.messages[-2].get("content")
-        answer = self.messages[-1].get("content")
+            references, in_context = self.prompt_builder.select(
+                human_input, self.retriever.retrieve_top_questions(human_input),
+                self.conversation.context_references())
+        turn = self.conversation.begin(human_input, references, context, in_context > 0)
+        state = AnswerState()
+        stream = AnswerStream(self._chat(turn, state), state)
+        self._active_stream, self._active_state = stream, state
+        _reaper.watch(self)
+        return stream
+
+    def cancel(self, timeout: float = 5.0) -> None:
+        """
+        Stop the in-flight answer stream, if any: close the HTTP response and
+        finalize the generator so its partial output is kept in the conversation.
+        Returns once the stream has wound down (or after `timeout` seconds).
+        """
+        stream, state = self._active_stream, self._active_state
+        self._active_stream = self._active_state = None
+        if stream is None:
+            return
+        state.abort()
+        try:
+            stream.close()
+        except ValueError:
+            # Being iterated on another thread (e.g. a BufferedStream producer):
+            # it stops at the next chunk, wait until it has recorded its turn
+            state.finished.wait(timeout)
+            return
+        # A stream that was never started has no finally block to close its turn
+        self.conversation.end_turn()
+
+    def generate_response(self, human_input: str, use_rag: bool = True) -> AnswerStream:
+        return self._start_turn(human_input, use_rag)
+
+    def generate_response_with_biomarker(self, human_input: str, use_rag: bool = True) -> AnswerStream:
+        biomarker = self.biomarker_store.prompt_fragment(self.user_name)
+        context = ("\nThe user's health metrics, already checked against adult reference ranges. "
+                   "Take them into account where relevant:\n" + biomarker) if biomarker else ""
+        return self._start_turn(human_input, use_rag, context)
+
+    def generate_nq(self, refine: bool = False) -> list[str]:
+        """
+        Follow-up questions for the last turn: parsed from the answer trailer, picked
+        from the knowledge base, or (when refining or nothing local fits) from the LLM
+        """
+        if self._suggestions and not refine:
+            return self._suggestions
+        turn = self.conversation.last_turn()
+        if turn is None:
+            return []
+        local = []
+        if self.suggestion_engine is not None:
+            with metrics.span("chat.suggest_local"):
+                local = self.suggestion_engine.suggest(
+                    turn.query, turn.answer, asked=[t.query for t in self.conversation.turns])
+            if local and not refine:
+                self._suggestions = local
+                return local
         result_nq = self.nq.generate_next_questions(
-            query, answer)
+            turn.query, turn.answer, user=self._scheduler_user(), candidates=local)
+        self._suggestions = result_nq
         return result_nq
 
+    def restore_history(self, limit: int = 20) -> None:
+        """
+        Reload the user's most recent conversation, e.g. after a page refresh
+        """
+        if self.history is None or not self.user_name:
+            return
+        # Turns still waiting in the write-behind buffer must be stored first
+        self.history.flush(timeout=5.0)
+        self.conversation.restore(self.history.cd.get_recent_history(self.user_name, limit))
+
     def set_api_key(self, api_key: str) -> None:
-        openai.api_key = api_key
-        self.client = OpenAI(
-            base_url="https://api.deepseek.com",
-            api_key=openai.api_key
-        )
+        self.client = get_client(api_key, self.api_base)
+        self.nq.client = get_client(api_key, self.nq.base_url)
 
     def reset(self) -> None:
-        self.messages = [{
-            "role": "system",
-            "content": self.init_prompt
-        }]
+        self.cancel()
+        self._suggestions = None
+        self.conversation.clear()
 
     def __str__(self) -> str:
         return "Online Health Science Knowledge Chatbot"
+
+
+def cancel_unfinished_answer(session_state) -> None:
+    """
+    Cancel the answer stream left running by the chat page.
+
+    Called at the top of every other page: leaving the chat page mid-answer
+    must not keep the response (and its connection) open.
+    """
+    if session_state.get("current_stream") is None:
+        return
+    session_state.chat_bot.cancel()
+    session_state.update(current_stream=None, is_responding=False, is_idle=True)
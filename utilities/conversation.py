@@ -0,0 +1,168 @@
+"""
+Turn-based conversation store shared by ChatBot and the chat page.
+
+Every turn keeps the raw user query, what was added to it for the model
+(retrieved references and user context), the model's reasoning and its
+answer exactly once. The API payload and the chat display are derived from
+the turns on demand instead of being kept as two parallel message lists.
+"""
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from utilities.prompt_builder import reference_key
+from utilities.rag import RAG
+
+REFERENCES_IN_CONTEXT = "No new references; those given earlier in this conversation may still apply."
+
+
+@dataclass
+class Turn:
+    query: str
+    # Retrieved references, None when RAG was not used for this turn
+    references: Optional[List[Dict[str, Any]]] = None
+    # Retrieved references were left out because earlier turns in the context already carry them
+    references_in_context: bool = False
+    # Extra user context appended to the prompt (e.g. biomarkers)
+    context: str = ""
+    reasoning: str = ""
+    answer: str = ""
+    complete: bool = False
+
+    def user_content(self) -> str:
+        """
+        The user message as sent to the model
+        """
+        if self.references is None:
+            content = self.query
+        else:
+            note = REFERENCES_IN_CONTEXT if self.references_in_context and not self.references else ""
+            content = RAG.format_prompt(self.query, self.references, note)
+        return content + self.context
+
+    def compact(self) -> None:
+        """
+        Drop the augmentation once the turn has left the context window
+        """
+        self.references = None
+        self.references_in_context = False
+        self.context = ""
+
+
+class Conversation:
+    def __init__(self, system_prompt: str = "", max_turns: int = 50, context_turns: int = 10) -> None:
+        """
+        Args:
+            system_prompt: system message sent first with every request
+            max_turns: turns kept per session, older ones are dropped
+            context_turns: most recent turns sent to the model
+        """
+        self.system_prompt = system_prompt
+        self.max_turns = max_turns
+        self.context_turns = context_turns
+        self.turns: List[Turn] = []
+        self.id = uuid.uuid4().hex
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def pending(self) -> Optional[Turn]:
+        """
+        The turn currently being answered, if any
+        """
+        if self.turns and not self.turns[-1].complete:
+            return self.turns[-1]
+        return None
+
+    def last_turn(self) -> Optional[Turn]:
+        """
+        The most recent answered turn
+        """
+        for turn in reversed(self.turns):
+            if turn.complete:
+                return turn
+        return None
+
+    def context_references(self) -> List[str]:
+        """
+        reference_key() of the references a new turn would share its context window with
+        """
+        if self.context_turns <= 1:
+            return []
+        return [reference_key(r) for turn in self.turns[-(self.context_turns - 1):]
+                if turn.complete and turn.references for r in turn.references]
+
+    def begin(self, query: str, references: Optional[List[Dict[str, Any]]] = None,
+              context: str = "", references_in_context: bool = False) -> Turn:
+        self.end_turn()
+        turn = Turn(query=query, references=references, context=context,
+                    references_in_context=references_in_context)
+        self.turns.append(turn)
+        return turn
+
+    def end_turn(self, turn: Optional[Turn] = None) -> None:
+        """
+        Close a turn (the pending one by default). Partial answers are kept,
+        a turn that received no answer at all is dropped so the history
+        stays strictly user/assistant paired. Safe to call more than once.
+        """
+        turn = turn or self.pending
+        if turn is None or turn.complete or not any(t is turn for t in self.turns):
+            return
+        if turn.answer:
+            turn.complete = True
+            self._trim()
+        else:
+            self.turns = [t for t in self.turns if t is not turn]
+
+    def _trim(self) -> None:
+        del self.turns[:-self.max_turns]
+        for turn in self.turns[:-self.context_turns]:
+            turn.compact()
+
+    def clear(self) -> None:
+        self.turns = []
+        self.id = uuid.uuid4().hex
+
+    def restore(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Replace the turns with the most recent stored conversation.
+        `records` are history documents, newest first.
+        """
+        if not records:
+            return
+        self.id = records[0]["conversation_id"]
+        self.turns = [
+            Turn(query=r["query"], reasoning=r.get("reasoning", ""), answer=r["answer"], complete=True)
+            for r in reversed(records) if r["conversation_id"] == self.id
+        ]
+        self._trim()
+
+    def api_messages(self, instruction: str = "") -> List[Dict[str, str]]:
+        """
+        Messages for the chat completions API. `instruction` is appended to
+        the pending user message for this request only.
+        """
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for turn in self.turns[-self.context_turns:]:
+            if turn.complete:
+                messages.append({"role": "user", "content": turn.user_content()})
+                messages.append({"role": "assistant", "content": turn.answer})
+            elif turn is self.pending:
+                messages.append({"role": "user", "content": turn.user_content() + instruction})
+        return messages
+
+    def display_messages(self) -> List[Dict[str, str]]:
+        """
+        Entries for the chat page: the raw query, then the reasoning (if any)
+        and the answer of each turn
+        """
+        entries = []
+        for turn in self.turns:
+            entries.append({"role": "user", "type": "content", "content": turn.query})
+            if turn.reasoning:
+                entries.append({"role": "assistant", "type": "reasoning", "content": turn.reasoning})
+            if turn.answer or not turn.complete:
+                entries.append({"role": "assistant", "type": "content", "content": turn.answer})
+        return entries
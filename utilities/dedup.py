@@ -0,0 +1,131 @@
+import argparse
+import json
+
+import faiss
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+from utilities.rag import RAG
+
+
+def find_duplicate_clusters(embeddings, threshold=0.92, order=None, batch_size=1024):
+    """
+    用FAISS范围搜索把相似度高于阈值的问题聚成簇
+
+    采用贪心的"领头者"聚类：按order顺序遍历，尚未归簇的条目成为新簇的代表，
+    其所有未归簇且相似度超过阈值的邻居并入该簇。这样不会像连通分量那样
+    因传递关系把不相似的问题串到一起。
+
+    参数:
+        embeddings: 归一化后的嵌入矩阵 (n, d)
+        threshold: 判定为重复的最小余弦相似度
+        order: 选择代表的优先顺序（下标列表），为None时按原顺序
+        batch_size: 每批范围搜索的查询数量，用于限制内存
+
+    返回:
+        簇列表，每个簇为 (代表下标, [重复项下标...])
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    n = embeddings.shape[0]
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+
+    neighbours = [None] * n
+    for start in range(0, n, batch_size):
+        lims, _, ids = index.range_search(
+            embeddings[start:start + batch_size], threshold)
+        for i in range(len(lims) - 1):
+            neighbours[start + i] = ids[lims[i]:lims[i + 1]]
+
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+    for leader in (order if order is not None else range(n)):
+        if assigned[leader]:
+            continue
+        assigned[leader] = True
+        members = [int(j) for j in neighbours[leader] if not assigned[j]]
+        assigned[members] = True
+        clusters.append((int(leader), members))
+    return clusters
+
+
+def deduplicate_qa(qa_pairs, embeddings, threshold=0.92):
+    """
+    对问答对按问题嵌入去重，每个簇只保留一个代表问答对
+
+    代表优先选择答案最长（信息量最大）的问答对，保留结果维持原有顺序。
+
+    参数:
+        qa_pairs: 问答对列表
+        embeddings: 与qa_pairs一一对应的归一化问题嵌入
+        threshold: 判定为重复的最小余弦相似度
+
+    返回:
+        (去重后的问答对列表, 去重报告dict)
+    """
+    order = sorted(range(len(qa_pairs)),
+                   key=lambda i: -len(qa_pairs[i].get("answer", "")))
+    clusters = find_duplicate_clusters(embeddings, threshold, order=order)
+
+    keep = sorted(leader for leader, _ in clusters)
+    report = {
+        "threshold": threshold,
+        "total": len(qa_pairs),
+        "kept": len(keep),
+        "removed": len(qa_pairs) - len(keep),
+        "clusters": [
+            {
+                "canonical": qa_pairs[leader]["question"],
+                "duplicates": [qa_pairs[j]["question"] for j in members],
+            }
+            for leader, members in clusters if members
+        ],
+    }
+    return [qa_pairs[i] for i in keep], report
+
+
+def deduplicate_with_rag(rag, qa_pairs, threshold=0.92):
+    """
+    使用RAG实例自身的编码器对问答对去重，保证与检索时的向量空间一致
+    """
+    embeddings = rag.generate_embeddings(
+        [item["question"] for item in qa_pairs])
+    return deduplicate_qa(qa_pairs, embeddings, threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove near-duplicate questions from a QA file before indexing")
+    parser.add_argument("--input", default="traing_data/structured_qa.json")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--report", default=None,
+                        help="optional path of the JSON dedup report")
+    parser.add_argument("--threshold", type=float, default=0.92)
+    parser.add_argument("--model", default="paraphrase-MiniLM-L6-v2",
+                        help="must match the model_name used by RAG")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        qa_pairs = json.load(f)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = SentenceTransformer(args.model).to(device)
+    embeddings = RAG.encode_texts(
+        model, [item["question"] for item in qa_pairs], device)
+
+    kept, report = deduplicate_qa(qa_pairs, embeddings, args.threshold)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(kept, f, indent=2, ensure_ascii=False)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"Kept {report['kept']} of {report['total']} QA pairs "
+          f"({report['removed']} near-duplicates removed, threshold {args.threshold})")
+    print("Delete the old FAISS index so RAG rebuilds it from the new QA file.")
+
+
+if __name__ == "__main__":
+    main()
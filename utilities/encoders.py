@@ -0,0 +1,82 @@
+"""
+RAG可选的文本编码器
+
+RAG默认使用SentenceTransformer；MeanPoolingEncoder把任意HuggingFace编码器
+（如BioBERT）包装成相同的encode接口，按批次填充编码并做attention mask加权的平均池化。
+"""
+import torch
+
+BIOBERT_MODEL = "monologg/biobert_v1.1_pubmed"
+
+ENCODERS = ("sentence_transformer", "mean_pooling")
+
+
+class MeanPoolingEncoder:
+    def __init__(self, model_name=BIOBERT_MODEL, batch_size=32, max_length=256, device=None):
+        """
+        参数:
+            model_name: HuggingFace模型名称或本地路径
+            batch_size: 每批编码的文本数量
+            max_length: 截断长度（token数）
+            device: 运行设备，为None时自动选择GPU或CPU
+        """
+        # transformers只在使用该编码器时才需要
+        from transformers import AutoModel, AutoTokenizer
+
+        self.device = torch.device(device) if device is not None else torch.device(
+            "cuda" if torch.cuda.is_available() else "cpu")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.config.hidden_size
+
+    def to(self, device):
+        self.device = torch.device(device)
+        self.model.to(self.device)
+        return self
+
+    @torch.no_grad()
+    def encode(self, texts, convert_to_tensor=False, device=None, batch_size=None):
+        """
+        编码文本列表，返回(len(texts), hidden_size)的向量（未归一化）
+
+        按长度排序后分批，同一批内只填充到该批最长的文本，减少无效计算。
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        device = torch.device(device) if device is not None else self.device
+        if device != self.device:
+            self.to(device)
+        batch_size = batch_size or self.batch_size
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = torch.empty(
+            (len(texts), self.get_sentence_embedding_dimension()), device=self.device)
+        for start in range(0, len(order), batch_size):
+            batch_ids = order[start:start + batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in batch_ids], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="pt").to(self.device)
+            hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            embeddings[torch.tensor(batch_ids, device=self.device)] = pooled
+
+        if convert_to_tensor:
+            return embeddings
+        return embeddings.cpu().numpy()
+
+
+def load_encoder(encoder, model_name, device):
+    """
+    按名称加载编码器，encoder为ENCODERS之一
+    """
+    if encoder == "sentence_transformer":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name).to(device)
+    if encoder == "mean_pooling":
+        return MeanPoolingEncoder(model_name, device=device)
+    raise ValueError(f"Unknown encoder: {encoder}")
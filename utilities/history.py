@@ -0,0 +1,129 @@
+"""
+聊天记录的异步持久化（write-behind）
+
+ChatBot每答完一轮就调用HistoryWriter.record()，只把记录放进内存队列后立即返回；
+后台线程按数量（max_batch）或时间（flush_interval）攒批，再用一次insert_many
+写入CloudData的history集合，聊天流程从不等待数据库写入。
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from utilities import metrics, profiling
+from utilities.conversation import Turn
+from utilities.mongodb import CloudData
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class HistoryWriter:
+    def __init__(self, cd: CloudData, max_batch: int = 50, flush_interval: float = 2.0,
+                 max_queue: int = 10000) -> None:
+        """
+        参数:
+            cd: 数据库连接
+            max_batch: 攒够多少条记录立即写入
+            flush_interval: 第一条记录入队后最多等待多少秒再写入
+            max_queue: 队列上限，数据库长时间不可用时丢弃新记录而不是无限占用内存
+        """
+        self.cd = cd
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush, 5.0)
+
+    def record(self, user_name: str, conversation_id: str, turn: Turn) -> None:
+        """
+        记录一轮已完成的对话，不阻塞
+        """
+        doc = {
+            "name": user_name,
+            "conversation_id": conversation_id,
+            "timestamp": datetime.now(timezone.utc),
+            "query": turn.query,
+            "reasoning": turn.reasoning,
+            "answer": turn.answer,
+        }
+        try:
+            self._queue.put_nowait(doc)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待此前入队的记录全部写入（或写入失败被放弃），返回是否在超时前完成。
+        队列已满时入队也计入超时，到时仍放不进去返回False
+        """
+        request = _FlushRequest()
+        start = time.monotonic()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        if timeout is not None:
+            timeout = max(timeout - (time.monotonic() - start), 0)
+        return request.done.wait(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = []
+            waiters = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.done.set()
+
+    @profiling.profiled("history.write")
+    def _write(self, batch: list) -> None:
+        for attempt in range(3):
+            try:
+                with metrics.span("history.write"):
+                    self.cd.insert_history(batch)
+                self.written += len(batch)
+                metrics.observe("history.batch", len(batch), unit="records",
+                                buckets=metrics.COUNT_BUCKETS)
+                return
+            except Exception as e:
+                print(f"History write failed ({attempt + 1}/3): {e}")
+                time.sleep(0.5 * 2 ** attempt)
+        self.dropped += len(batch)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer(cd: CloudData) -> HistoryWriter:
+    """
+    进程内共享的HistoryWriter，所有会话共用一个后台线程
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter(cd)
+        return _writer
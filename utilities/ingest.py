@@ -0,0 +1,302 @@
+"""
+从原始数据重建问答知识库（structured_qa.json）
+
+    python -m utilities.ingest --amazon QA_Health_and_Personal_Care.json.gz \\
+        --merge health_qa_full_dataset.json --output traing_data/structured_qa.json
+
+主进程逐行解压读取gzip，把原始行按批交给工作进程解析、过滤和规范化，
+同时在途的批次数有上限，内存占用与文件大小无关；结果按输入顺序边收边写，
+问题完全相同（忽略大小写和标点）的问答对只保留第一条。--merge的文件
+（如data_cleaning_updated.py生成的healthline问答）先写入，遇到重复时优先保留。
+"""
+import argparse
+import ast
+import gzip
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+
+
+# 健康主题 -> 关键词；Amazon问题命中任一关键词才保留，命中的主题作为topic
+HEALTH_TOPICS = {
+    "vitamins and supplements": ["vitamin", "supplement", "multivitamin", "probiotic", "omega",
+                                 "fish oil", "magnesium", "zinc", "calcium", "iron", "collagen",
+                                 "melatonin", "biotin", "protein powder"],
+    "pain and inflammation": ["pain", "ache", "arthritis", "joint", "inflammation", "headache",
+                              "migraine", "sore", "cramp", "back pain"],
+    "skin care": ["skin", "acne", "eczema", "rash", "psoriasis", "sunscreen", "itch", "wound",
+                  "scar", "dermatitis"],
+    "sleep": ["sleep", "insomnia", "snore", "snoring", "apnea"],
+    "digestion": ["digest", "stomach", "constipation", "diarrhea", "bloating", "reflux",
+                  "heartburn", "fiber", "gut", "laxative"],
+    "heart and blood": ["blood pressure", "cholesterol", "heart", "circulation", "pulse",
+                        "hypertension", "blood sugar", "glucose", "diabetes", "diabetic"],
+    "allergies and immunity": ["allergy", "allergic", "immune", "common cold", "flu", "cough",
+                               "sinus", "congestion"],
+    "weight and diet": ["weight", "diet", "calorie", "appetite", "metabolism", "keto", "fat burn"],
+    "medication and safety": ["medication", "medicine", "dose", "dosage", "side effect",
+                              "pregnan", "doctor", "prescription", "interact"],
+    "mental health": ["anxiety", "stress", "depression", "mood", "focus", "memory loss"],
+}
+_TOPIC_PATTERNS = [(topic, re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")", re.I))
+                   for topic, keywords in HEALTH_TOPICS.items()]
+DEFAULT_TOPIC = "health and personal care"
+
+_URL = re.compile(r"https?://\S+")
+_SPACE = re.compile(r"\s+")
+_KEY = re.compile(r"[^0-9a-z]+")
+
+DEFAULT_OPTIONS = {
+    "health_filter": True,
+    "require_question_mark": True,
+    "min_question_chars": 15,
+    "min_answer_words": 5,
+    "max_answer_chars": 2000,
+}
+
+# 工作进程中的过滤参数，由_init_worker设置
+_options = {}
+
+
+def iter_lines(path):
+    """
+    逐行读取（.gz文件边解压边读），不一次性载入内存
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def parse_record(line):
+    """
+    解析一行记录；McAuley的Amazon数据是Python字面量（单引号）而非严格JSON。
+    无法解析或不是dict时抛出ValueError
+    """
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        try:
+            record = ast.literal_eval(line)
+        except (SyntaxError, TypeError, AttributeError, MemoryError, RecursionError) as e:
+            raise ValueError(f"unparsable record: {e}") from e
+    if not isinstance(record, dict):
+        raise ValueError(f"record is a {type(record).__name__}, not a dict")
+    return record
+
+
+def clean_text(text):
+    text = html.unescape(text)
+    text = _URL.sub("", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def classify(text):
+    for topic, pattern in _TOPIC_PATTERNS:
+        if pattern.search(text):
+            return topic
+    return None
+
+
+def normalize_amazon(record, options):
+    """
+    Amazon问答记录 -> 知识库问答对，不符合条件时返回None
+    """
+    question = record.get("question")
+    answer = record.get("answer")
+    if not isinstance(question, str) or not isinstance(answer, str):
+        return None
+    question = clean_text(question)
+    answer = clean_text(answer)
+    if len(question) < options["min_question_chars"]:
+        return None
+    if options["require_question_mark"] and not question.endswith("?"):
+        return None
+    if len(answer.split()) < options["min_answer_words"] or len(answer) > options["max_answer_chars"]:
+        return None
+    topic = classify(question + " " + answer)
+    if topic is None:
+        if options["health_filter"]:
+            return None
+        topic = DEFAULT_TOPIC
+    return {
+        "topic": topic,
+        "question": question,
+        "answer": answer,
+        "source": f"Amazon QA Health and Personal Care ({record.get('asin', 'unknown')})",
+    }
+
+
+def _init_worker(options):
+    _options.update(options)
+
+
+def _process_batch(lines):
+    qa_pairs = []
+    errors = 0
+    for line in lines:
+        try:
+            item = normalize_amazon(parse_record(line), _options)
+        except ValueError:
+            errors += 1
+            continue
+        if item is not None:
+            qa_pairs.append(item)
+    return qa_pairs, errors
+
+
+def _batches(lines, batch_size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def question_key(question):
+    """
+    忽略大小写和标点后的问题指纹，用于精确去重（只保存8字节摘要）
+    """
+    normalized = _KEY.sub(" ", question.lower()).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+
+class QAWriter:
+    """
+    流式写出RAG加载的JSON列表格式，写完后原子替换目标文件
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.tmp_path = output_path + ".tmp"
+        self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self._file.write("[")
+        self._seen = set()
+        self.written = 0
+        self.duplicates = 0
+
+    def write(self, item):
+        key = question_key(item["question"])
+        if key in self._seen:
+            self.duplicates += 1
+            return
+        self._seen.add(key)
+        self._file.write(",\n  " if self.written else "\n  ")
+        self._file.write(json.dumps(item, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+        self.written += 1
+
+    def close(self):
+        self._file.write("\n]" if self.written else "]")
+        self._file.close()
+        os.replace(self.tmp_path, self.output_path)
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.tmp_path)
+
+
+def ingest(amazon_paths, output_path, merge_paths=(), workers=None, batch_size=2000, **options):
+    """
+    解析、过滤、规范化并写出问答知识库
+
+    参数:
+        amazon_paths: Amazon问答dump（.json.gz或.json，每行一条记录）
+        output_path: 输出的structured_qa.json
+        merge_paths: 已是知识库格式的JSON列表文件，先于Amazon数据写入
+        workers: 工作进程数，默认CPU核数
+        batch_size: 每批交给工作进程的行数
+        options: 过滤参数，见DEFAULT_OPTIONS
+
+    返回:
+        统计信息dict
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    workers = workers or os.cpu_count() or 1
+    stats = {"merged": 0, "amazon_lines": 0, "amazon_kept": 0, "parse_errors": 0}
+    writer = QAWriter(output_path)
+    try:
+        for path in merge_paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for item in json.load(f):
+                    if item.get("question") and item.get("answer"):
+                        writer.write({**item, "question": clean_text(item["question"]),
+                                      "answer": clean_text(item["answer"])})
+                        stats["merged"] += 1
+
+        batches = (batch for path in amazon_paths for batch in _batches(iter_lines(path), batch_size))
+        if workers == 1:
+            # 单核时直接在主进程处理，省去进程间传输
+            _init_worker(options)
+            for batch in batches:
+                stats["amazon_lines"] += len(batch)
+                _collect(_process_batch(batch), writer, stats)
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(options,)) as pool:
+                # 最多workers*2批在途，解压读取不会跑到处理前面太远
+                pending = deque()
+                for batch in batches:
+                    stats["amazon_lines"] += len(batch)
+                    pending.append(pool.apply_async(_process_batch, (batch,)))
+                    if len(pending) >= workers * 2:
+                        _collect(pending.popleft().get(), writer, stats)
+                while pending:
+                    _collect(pending.popleft().get(), writer, stats)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    stats.update(written=writer.written, duplicates=writer.duplicates)
+    return stats
+
+
+def _collect(result, writer, stats):
+    qa_pairs, errors = result
+    stats["parse_errors"] += errors
+    stats["amazon_kept"] += len(qa_pairs)
+    for item in qa_pairs:
+        writer.write(item)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the QA knowledge base from the Amazon health QA dump and generated QA files")
+    parser.add_argument("--amazon", nargs="*", default=["QA_Health_and_Personal_Care.json.gz"],
+                        help="Amazon QA dumps, one record per line (.json.gz or .json)")
+    parser.add_argument("--merge", nargs="*", default=[],
+                        help="QA files already in structured_qa.json format (e.g. healthline QA), kept first")
+    parser.add_argument("--output", default="traing_data/structured_qa.json")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--no-health-filter", action="store_true",
+                        help="keep Amazon questions that mention no health topic")
+    parser.add_argument("--no-require-question-mark", action="store_true",
+                        help="keep Amazon questions that do not end with a question mark")
+    parser.add_argument("--min-question-chars", type=int, default=DEFAULT_OPTIONS["min_question_chars"])
+    parser.add_argument("--min-answer-words", type=int, default=DEFAULT_OPTIONS["min_answer_words"])
+    parser.add_argument("--max-answer-chars", type=int, default=DEFAULT_OPTIONS["max_answer_chars"])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = ingest(args.amazon, args.output, args.merge, workers=args.workers, batch_size=args.batch_size,
+                   health_filter=not args.no_health_filter,
+                   require_question_mark=not args.no_require_question_mark,
+                   min_question_chars=args.min_question_chars,
+                   min_answer_words=args.min_answer_words, max_answer_chars=args.max_answer_chars)
+    print(f"Wrote {stats['written']} QA pairs to {args.output} in {time.perf_counter() - start:.1f}s "
+          f"({stats['merged']} merged, {stats['amazon_kept']} of {stats['amazon_lines']} Amazon records kept, "
+          f"{stats['duplicates']} exact duplicates, {stats['parse_errors']} unparsable lines)")
+    print("Run python -m utilities.dedup to remove near-duplicates; "
+          "the FAISS index is rebuilt automatically because the QA file changed.")
+
+
+if __name__ == "__main__":
+    main()
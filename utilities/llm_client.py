@@ -0,0 +1,63 @@
+"""
+进程内共享的LLM客户端
+
+所有调用DeepSeek/OpenAI兼容接口的地方（ChatBot、NextQuestionGenerator、
+QA生成脚本）都通过get_client获取客户端：相同(base_url, api_key)复用同一个
+OpenAI实例及其连接池，长连接可跨会话复用，省去每个会话重新TLS握手的开销，
+同时限制了进程内的总连接数。
+"""
+import threading
+
+from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, OpenAI, Timeout
+
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+# 连接池与超时设置
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 60.0
+CONNECT_TIMEOUT = 5.0
+# 流式响应中两个chunk之间的最长等待时间，推理模型首token可能较慢
+READ_TIMEOUT = 120.0
+WRITE_TIMEOUT = 10.0
+POOL_TIMEOUT = 10.0
+# openai库对连接错误、408/409/429/5xx做指数退避重试
+MAX_RETRIES = 2
+
+# 连接池参数用openai所依赖HTTP库自己的Limits类型，不直接依赖httpx
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(api_key: str, base_url: str = DEFAULT_BASE_URL) -> OpenAI:
+    """
+    返回(base_url, api_key)对应的共享客户端，不存在时创建
+    """
+    key = (base_url, api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = DefaultHttpxClient(
+                limits=Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY))
+            client = OpenAI(api_key=api_key, base_url=base_url,
+                            http_client=http_client, max_retries=MAX_RETRIES,
+                            timeout=Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT,
+                                            write=WRITE_TIMEOUT, pool=POOL_TIMEOUT))
+            _clients[key] = client
+        return client
+
+
+def close_all() -> None:
+    """
+    关闭所有共享客户端（测试或进程退出时使用）
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
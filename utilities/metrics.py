@@ -0,0 +1,250 @@
+"""
+轻量的分阶段耗时统计
+
+用法:
+    with metrics.span("rag.encode"):
+        ...
+    @metrics.timed("mongo.get_data")
+    def _get_data(...): ...
+    metrics.observe("chat.chunks", n, unit="chunks", buckets=metrics.COUNT_BUCKETS)
+
+默认关闭（环境变量 HEALTHBOT_METRICS=1 或调用 enable() 开启）。JSON日志默认写到
+stderr，设置环境变量 HEALTHBOT_METRICS_LOG 时写入该文件。关闭时 span()
+返回共享的空上下文管理器、observe() 直接返回，开销接近于零。
+所有指标在进程内共享，导出为Prometheus文本格式或结构化JSON日志。
+"""
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger("healthbot.metrics")
+logger.setLevel(logging.INFO)
+
+_enabled = os.environ.get("HEALTHBOT_METRICS", "") not in ("", "0", "false")
+_json_logs = False
+_log_handler = None
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """
+    Prometheus风格的累积分桶直方图，另保留最近的样本用于计算分位数
+    """
+
+    def __init__(self, name, unit="seconds", buckets=SECONDS_BUCKETS, window=2048):
+        self.name = name
+        self.unit = unit
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.recent.append(value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            recent = np.asarray(self.recent, dtype="float64")
+            cumulative = np.cumsum(self.counts).tolist()
+            count, total = self.count, self.sum
+        summary = {"name": self.name, "unit": self.unit, "count": count, "sum": total,
+                   "buckets": list(zip(self.buckets, cumulative))}
+        if recent.size:
+            summary.update({"p50": float(np.percentile(recent, 50)),
+                            "p95": float(np.percentile(recent, 95)),
+                            "p99": float(np.percentile(recent, 99)),
+                            "max": float(recent.max())})
+        return summary
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        observe(self.name, time.perf_counter() - self.start, **self.attrs)
+        return False
+
+
+def _attach_log_handler(log_path=None):
+    """
+    给 healthbot.metrics 日志挂上输出：log_path（或环境变量 HEALTHBOT_METRICS_LOG）
+    指定时写文件，否则写stderr。只挂一次，不再向根日志传播以免重复输出
+    """
+    global _log_handler
+    log_path = log_path or os.environ.get("HEALTHBOT_METRICS_LOG") or None
+    if _log_handler is not None:
+        if getattr(_log_handler, "baseFilename", None) == (log_path and os.path.abspath(log_path)):
+            return
+        logger.removeHandler(_log_handler)
+        _log_handler.close()
+    if log_path:
+        _log_handler = logging.FileHandler(log_path, encoding="utf-8")
+    else:
+        _log_handler = logging.StreamHandler(sys.stderr)
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
+
+
+def enable(json_logs=False, log_path=None):
+    """
+    开启统计；json_logs为True时每个样本同时以一行JSON写入 healthbot.metrics 日志，
+    输出到log_path（默认stderr）
+    """
+    global _enabled, _json_logs
+    if json_logs:
+        _attach_log_handler(log_path)
+    _enabled = True
+    _json_logs = json_logs
+
+
+def disable():
+    global _enabled, _json_logs
+    _enabled = False
+    _json_logs = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _registry_lock:
+        _histograms.clear()
+
+
+def _histogram(name, unit, buckets):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(name, Histogram(name, unit, buckets))
+    return histogram
+
+
+def observe(name, value, unit="seconds", buckets=SECONDS_BUCKETS, **attrs):
+    """
+    记录一个样本，未开启时不做任何事
+    """
+    if not _enabled:
+        return
+    _histogram(name, unit, buckets).observe(value)
+    if _json_logs:
+        logger.info(json.dumps({"ts": time.time(), "metric": name, "unit": unit,
+                                "value": value, **attrs}, ensure_ascii=False))
+
+
+def span(name, **attrs):
+    """
+    计时上下文管理器，退出时把耗时（秒）记入名为name的直方图
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, attrs)
+
+
+def timed(name):
+    """
+    函数装饰器版本的span
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    返回所有直方图的汇总（计数、总和、分桶和最近样本的p50/p95/p99）
+    """
+    with _registry_lock:
+        histograms = list(_histograms.values())
+    return [h.snapshot() for h in sorted(histograms, key=lambda h: h.name)]
+
+
+def _metric_name(name, unit):
+    return "healthbot_" + "".join(c if c.isalnum() else "_" for c in name) + "_" + unit
+
+
+def prometheus_text():
+    """
+    以Prometheus文本格式导出所有直方图
+    """
+    lines = []
+    for summary in snapshot():
+        metric = _metric_name(summary["name"], summary["unit"])
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, cumulative in summary["buckets"]:
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {summary["count"]}')
+        lines.append(f"{metric}_sum {summary['sum']}")
+        lines.append(f"{metric}_count {summary['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_prometheus(port=9108, host="127.0.0.1"):
+    """
+    在后台线程启动一个供Prometheus抓取的HTTP端点
+    """
+    server = ThreadingHTTPServer((host, port), _PrometheusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,8 +1,10 @@
 import json
 
+from pymongo import ASCENDING, DESCENDING
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 import re
+from utilities import metrics
 
 
 class CloudData():
@@ -18,6 +20,8 @@ class CloudData():
             print(e)
 
         self.db = self.client['stat7008_database']
+        self._history_indexed = False
+        self._biomarker_history_indexed = False
 
     # def test_get_data(self) -> dict:
     #     # Get the collection
@@ -28,6 +32,7 @@ class CloudData():
 
     #     return data
 
+    @metrics.timed("mongo.get_data")
     def _get_data(self, collection_name: str, query: dict) -> dict:
         # Get the collection
         collection = self.db[collection_name]
@@ -37,12 +42,14 @@ class CloudData():
 
         return data
 
+    @metrics.timed("mongo.get_all_data")
     def _get_all_data(self, collection_name: str) -> list:
         collection = self.db[collection_name]
         all_documents = collection.find({})
         data = list(all_documents)
         return data
 
+    @metrics.timed("mongo.insert_data")
     def _insert_data(self, collection_name: str, data: dict) -> None:
         # Get the collection
         collection = self.db[collection_name]
@@ -53,6 +60,7 @@ class CloudData():
         data = self._get_data('settings', {"name": "settings"})
         return data['settings']
 
+    @metrics.timed("mongo.update_settings")
     def update_settings(self, settings: dict) -> None:
         assert len(settings) == 2
         assert "init_prompt" in settings
@@ -89,8 +97,11 @@ class CloudData():
 
         return [True, "User added successfully"]
 
+    @metrics.timed("mongo.delete_user")
     def delete_user(self, user_name: str) -> None:
         self.db['users'].delete_one({"name": user_name})
+        self.db['history'].delete_many({"name": user_name})
+        self.db['biomarker_history'].delete_many({"name": user_name})
 
     def user_login(self, user_name: str, user_pwd: str) -> list[bool, str]:
         user = self.get_user(user_name)
@@ -110,5 +121,60 @@ class CloudData():
             return [False, "Email incorrect"]
         return [True, f"Your password is {user['password']}"]
 
+    def get_biomarker(self, user_name: str) -> dict:
+        data = self._get_data('biomarkers', {"name": user_name})
+        if data is None:
+            return {}
+        return data['biomarker']
+
+    @metrics.timed("mongo.update_biomarker")
+    def update_biomarker(self, user_name: str, biomarker: dict) -> None:
+        self.db['biomarkers'].replace_one(
+            {"name": user_name},
+            {"name": user_name, "biomarker": biomarker},
+            upsert=True)
+
+    @metrics.timed("mongo.insert_biomarker_history")
+    def insert_biomarker_history(self, user_name: str, record: dict) -> None:
+        self.db['biomarker_history'].insert_one({"name": user_name, **record})
+
+    def get_biomarker_history(self, user_name: str, limit: int = 10) -> list[dict]:
+        """
+        Return up to `limit` saved biomarker records of a user, newest first
+        """
+        collection = self.db['biomarker_history']
+        if not self._biomarker_history_indexed:
+            collection.create_index([("name", ASCENDING), ("timestamp", DESCENDING)])
+            self._biomarker_history_indexed = True
+        cursor = collection.find({"name": user_name}, {"_id": 0, "name": 0}) \
+            .sort("timestamp", DESCENDING).limit(limit)
+        return list(cursor)
+
+    def _history(self):
+        collection = self.db['history']
+        if not self._history_indexed:
+            # Serves both the per-user recency query and its keyset pagination
+            collection.create_index([("name", ASCENDING), ("timestamp", DESCENDING)])
+            self._history_indexed = True
+        return collection
+
+    @metrics.timed("mongo.insert_history")
+    def insert_history(self, records: list[dict]) -> None:
+        self._history().insert_many(records, ordered=False)
+
+    @metrics.timed("mongo.get_recent_history")
+    def get_recent_history(self, user_name: str, limit: int = 20, before=None) -> list[dict]:
+        """
+        Return up to `limit` chat turns of a user, newest first. Pass the
+        timestamp of the oldest turn already loaded as `before` to get the
+        next page.
+        """
+        query = {"name": user_name}
+        if before is not None:
+            query["timestamp"] = {"$lt": before}
+        cursor = self._history().find(query, {"_id": 0}) \
+            .sort("timestamp", DESCENDING).limit(limit)
+        return list(cursor)
+
     def __del__(self) -> None:
         self.client.close()
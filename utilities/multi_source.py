@@ -0,0 +1,272 @@
+"""
+多知识源并行检索
+
+MultiSourceRetriever把一个查询同时发给多个检索源（问答对、文档分块等），
+在线程池中并行执行。每个源有自己的延迟预算，超时的源本轮直接放弃（上一次仍未
+返回的源也不再重复提交），因此慢的或尚未加载完的源不会拖慢回答。各源的分数先按
+自身阈值归一化到[0, 1]再乘以权重，合并后取前top_k个，结果格式与
+RAG.retrieve_top_questions一致，可直接作为ChatBot的检索器。
+
+文档库由 python -m utilities.multi_source 从文本/JSON文件构建：
+    python -m utilities.multi_source docs/*.txt --index traing_data/doc_chunks.index \\
+        --chunks traing_data/doc_chunks.json
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+import torch
+
+from utilities import metrics
+from utilities.encoders import load_encoder
+from utilities.rag import RAG
+
+
+class QASource:
+    """
+    问答对检索源，包装RAG或RetrievalClient
+    """
+
+    def __init__(self, rag, name="qa", weight=1.0, budget=1.0, min_score=None):
+        """
+        参数:
+            rag: RAG或RetrievalClient
+            name: 源名称，写入结果的source字段
+            weight: 合并时的分数权重
+            budget: 延迟预算（秒）
+            min_score: 相似度阈值，为None时使用rag的默认值
+        """
+        self.rag = rag
+        self.name = name
+        self.weight = weight
+        self.budget = budget
+        self.min_score = min_score if min_score is not None else (getattr(rag, "min_similarity", None) or 0.0)
+
+    def search(self, query, top_k):
+        hits = self.rag.retrieve_top_questions(query, top_k, self.min_score)
+        return [{**hit, "source": self.name} for hit in hits]
+
+
+class DocumentSource:
+    """
+    文档分块检索源：归一化向量的IndexFlatIP + 分块文本（JSON列表，每项含text和title）
+
+    索引在后台线程中加载，加载完成前的查询在预算内等不到结果即被放弃。
+    结果的question为空，answer为分块文本，RAG.format_prompt会按摘录格式输出。
+    """
+
+    def __init__(self, index_path, chunks_path, embed, name="documents", weight=0.8, budget=0.3,
+                 min_score=0.5):
+        """
+        参数:
+            index_path: FAISS索引路径
+            chunks_path: 分块文本路径
+            embed: 文本列表 -> 归一化向量矩阵，通常是RAG.generate_embeddings（与构建时同一编码器）
+            name, weight, budget, min_score: 同QASource
+        """
+        self.index_path = index_path
+        self.chunks_path = chunks_path
+        self.embed = embed
+        self.name = name
+        self.weight = weight
+        self.budget = budget
+        self.min_score = min_score
+        self.index = None
+        self.chunks = None
+        self._loaded = threading.Event()
+        threading.Thread(target=self._load, name=f"load-{name}", daemon=True).start()
+
+    def _load(self):
+        try:
+            with metrics.span("retrieval.load", source=self.name):
+                self.index = RAG.load_faiss_index(self.index_path)
+                with open(self.chunks_path, "r", encoding="utf-8") as f:
+                    self.chunks = json.load(f)
+        except Exception as e:
+            print(f"加载文档库 {self.name} 失败: {e}")
+        finally:
+            self._loaded.set()
+
+    def search(self, query, top_k):
+        self._loaded.wait()
+        if self.index is None:
+            return []
+        distances, indices = self.index.search(self.embed([query]), top_k)
+        return [{"question": "", "answer": self.chunks[idx]["text"],
+                 "topic": self.chunks[idx].get("title", ""),
+                 "similarity": float(score), "source": self.name}
+                for score, idx in zip(distances[0], indices[0])
+                if idx >= 0 and score >= self.min_score]
+
+    @staticmethod
+    def build(chunks, index_path, chunks_path, embed, batch_size=256):
+        """
+        编码分块并保存索引和分块文本
+
+        参数:
+            chunks: [{"text": ..., "title": ...}, ...]
+            embed: 同__init__
+            batch_size: 每次编码的分块数量
+        """
+        embeddings = np.concatenate([
+            embed([c["text"] for c in chunks[i:i + batch_size]])
+            for i in range(0, len(chunks), batch_size)
+        ])
+        RAG.save_faiss_index(RAG.build_faiss_index(embeddings), index_path)
+        tmp_path = chunks_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        os.replace(tmp_path, chunks_path)
+
+
+# 在换行之后、句末标点之后切开，空白留在下一段开头
+_BREAKS = re.compile(r"(?<=\n)|(?<=[.?!。？！])(?=\s)")
+
+
+def chunk_text(text, chunk_size=1000, overlap=100):
+    """
+    按段落、换行和句末标点切分文本，每块不超过chunk_size个字符，相邻块重叠约overlap个字符
+    （与RAG_embedding.ipynb中RecursiveCharacterTextSplitter的参数一致）
+    """
+    pieces = [p for p in _BREAKS.split(text) if p]
+    chunks = []
+    current = ""
+    for piece in pieces:
+        # 单段超长时按字符硬切
+        while len(piece) > chunk_size:
+            if current.strip():
+                chunks.append(current.strip())
+                current = ""
+            chunks.append(piece[:chunk_size].strip())
+            piece = piece[chunk_size - overlap:]
+        if len(current) + len(piece) > chunk_size and current.strip():
+            chunks.append(current.strip())
+            current = current[-overlap:] if overlap else ""
+        current += piece
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+class MultiSourceRetriever:
+    def __init__(self, sources, top_k=3, max_workers=None):
+        """
+        参数:
+            sources: 检索源列表（QASource、DocumentSource或实现了name/weight/budget/min_score/search的对象）
+            top_k: 合并后返回的结果数量
+            max_workers: 线程池大小，默认每个源两个线程
+        """
+        self.sources = sources
+        self.top_k = top_k
+        self._executor = ThreadPoolExecutor(max_workers or 2 * len(sources),
+                                            thread_name_prefix="retrieval")
+        # 源名称 -> 超时后仍在执行的请求
+        self._busy = {}
+        self._lock = threading.Lock()
+
+    def _search(self, source, query, top_k):
+        start = time.perf_counter()
+        try:
+            return source.search(query, top_k)
+        finally:
+            metrics.observe("retrieval.source", time.perf_counter() - start, source=source.name)
+
+    def _drop(self, source, reason):
+        metrics.observe("retrieval.dropped", 1, unit="sources", buckets=metrics.COUNT_BUCKETS,
+                        source=source.name, reason=reason)
+
+    @staticmethod
+    def normalize(source, hits):
+        """
+        把源自身阈值映射为0、满分映射为1，再乘以源权重
+        """
+        span = max(1.0 - source.min_score, 1e-6)
+        for hit in hits:
+            hit["score"] = source.weight * min(max((hit["similarity"] - source.min_score) / span, 0.0), 1.0)
+        return hits
+
+    def retrieve_top_questions(self, query, top_k=None, min_similarity=None):
+        """
+        并行检索所有源并合并结果（min_similarity仅为与RAG接口一致，阈值由各源的min_score决定）
+        """
+        top_k = top_k if top_k is not None else self.top_k
+        start = time.monotonic()
+        futures = []
+        with self._lock:
+            for source in self.sources:
+                busy = self._busy.get(source.name)
+                if busy is not None and not busy.done():
+                    self._drop(source, "busy")
+                    continue
+                self._busy.pop(source.name, None)
+                futures.append((source, self._executor.submit(self._search, source, query, top_k)))
+
+        merged = []
+        with metrics.span("retrieval.fanout"):
+            for source, future in futures:
+                remaining = start + source.budget - time.monotonic()
+                try:
+                    hits = future.result(timeout=max(remaining, 0))
+                except TimeoutError:
+                    with self._lock:
+                        self._busy[source.name] = future
+                    self._drop(source, "timeout")
+                    continue
+                except Exception as e:
+                    print(f"检索源 {source.name} 失败: {e}")
+                    self._drop(source, "error")
+                    continue
+                merged.extend(self.normalize(source, hits))
+
+        merged.sort(key=lambda hit: hit["score"], reverse=True)
+        results = []
+        for hit in merged:
+            if any(hit["answer"] == other["answer"] for other in results):
+                continue
+            results.append(hit)
+            if len(results) == top_k:
+                break
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the document chunk store used by DocumentSource")
+    parser.add_argument("inputs", nargs="+",
+                        help="text files, or JSON files with a list of {'title', 'text'} documents")
+    parser.add_argument("--index", default="traing_data/doc_chunks.index")
+    parser.add_argument("--chunks", default="traing_data/doc_chunks.json")
+    parser.add_argument("--model", default="paraphrase-MiniLM-L6-v2",
+                        help="must match the encoder of the RAG whose generate_embeddings queries it")
+    parser.add_argument("--encoder", default="sentence_transformer")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    documents = []
+    for path in args.inputs:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                documents.extend(json.load(f))
+            else:
+                documents.append({"title": os.path.basename(path), "text": f.read()})
+    chunks = [{"title": doc.get("title", ""), "text": text}
+              for doc in documents
+              for text in chunk_text(doc["text"], args.chunk_size, args.overlap)]
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = load_encoder(args.encoder, args.model, device)
+    DocumentSource.build(chunks, args.index, args.chunks,
+                         lambda texts: RAG.encode_texts(model, texts, device))
+    print(f"{len(chunks)} chunks from {len(documents)} documents saved to {args.index}")
+
+
+if __name__ == "__main__":
+    main()
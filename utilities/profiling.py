@@ -0,0 +1,326 @@
+"""
+按次rerun的性能剖析（默认关闭）
+
+用法:
+    profiling.start_rerun("pages/chatbot.py")  # 页面开头
+    ...
+    profiling.stop_rerun()                     # 页面末尾
+    @profiling.profiled("rag.retrieve")
+    def retrieve_top_questions_batch(...): ...
+
+管理员在Admin页开启后，每次页面执行（以及不在页面线程中执行的被装饰函数）会用
+cProfile（确定性）或采样剖析器记录一次，并可选地对比前后的tracemalloc快照找出
+分配最多的代码位置。结果保存在 HEALTHBOT_PROFILE_DIR（默认 profiles/）：
+    <时间>-<名称>.json       摘要：耗时、最耗时函数、分配最多的位置
+    <时间>-<名称>.prof       cProfile结果，可用 snakeviz / pstats 查看
+    <时间>-<名称>.collapsed  采样结果，折叠栈格式，可用 speedscope / flamegraph.pl 查看
+页面因st.rerun()、st.switch_page()、st.stop()或异常提前结束、没有执行到stop_rerun()时，
+剖析在同一线程下一次start_rerun()或脚本线程退出时结束，结果记为interrupted。
+关闭时 start_rerun() 只多一次布尔判断，被装饰函数同样如此。
+"""
+import cProfile
+import functools
+import glob
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+
+MODES = ("cprofile", "sampling")
+
+_enabled = False
+_mode = "cprofile"
+_trace_memory = False
+_sample_interval = 0.005
+_profile_dir = os.environ.get("HEALTHBOT_PROFILE_DIR", "profiles")
+_max_profiles = 500
+_local = threading.local()
+
+
+class _NullProfile:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PROFILE = _NullProfile()
+
+
+def enable(mode="cprofile", trace_memory=True, sample_interval=0.005, profile_dir=None):
+    """
+    开启剖析
+
+    参数:
+        mode: "cprofile"（确定性，开销较大但有调用次数）或"sampling"（按间隔采样调用栈）
+        trace_memory: 是否用tracemalloc记录每次执行中分配最多的位置
+        sample_interval: 采样间隔（秒）
+        profile_dir: 结果保存目录
+    """
+    global _enabled, _mode, _trace_memory, _sample_interval, _profile_dir
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode: {mode}")
+    _mode = mode
+    _trace_memory = trace_memory
+    _sample_interval = sample_interval
+    if profile_dir is not None:
+        _profile_dir = profile_dir
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _enabled
+
+
+def settings():
+    return {"mode": _mode, "trace_memory": _trace_memory,
+            "sample_interval": _sample_interval, "profile_dir": _profile_dir}
+
+
+class _Sampler:
+    """
+    后台线程定期读取目标线程的调用栈，统计折叠栈出现次数
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class _Profile:
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self):
+        _local.active = True
+        self.mode = _mode
+        self.snapshot = _take_snapshot() if _trace_memory and tracemalloc.is_tracing() else None
+        self.started = time.time()
+        self.start = time.perf_counter()
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = _Sampler(threading.get_ident(), _sample_interval)
+            self.profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop(exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    def stop(self, exit=None):
+        duration = time.perf_counter() - self.start
+        if self.mode == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        _local.active = False
+        try:
+            self._save(duration, exit)
+        except Exception as e:
+            print(f"Saving profile failed: {e}")
+
+    def _save(self, duration, exit):
+        os.makedirs(_profile_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.name).strip("_")
+        stem = os.path.join(_profile_dir, time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+                            + f"-{int(self.started * 1000) % 1000:03d}-{slug}")
+        summary = {
+            "name": self.name,
+            "kind": self.kind,
+            "mode": self.mode,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": round(duration * 1000, 2),
+            # 正常结束为None；页面提前结束为interrupted，被装饰函数抛出异常时为异常类型
+            "exit": exit,
+        }
+        if self.mode == "cprofile":
+            summary["profile_file"] = stem + ".prof"
+            self.profiler.dump_stats(summary["profile_file"])
+            summary["top_functions"] = _top_functions(self.profiler)
+        else:
+            summary["profile_file"] = stem + ".collapsed"
+            with open(summary["profile_file"], "w", encoding="utf-8") as f:
+                for stack, count in self.profiler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            summary["top_functions"] = _top_sampled(self.profiler.stacks, self.profiler.interval)
+        if self.snapshot is not None and tracemalloc.is_tracing():
+            diff = _take_snapshot().compare_to(self.snapshot, "lineno")
+            summary["top_allocations"] = [
+                {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+                for stat in sorted(diff, key=lambda s: s.size_diff, reverse=True)[:10]
+                if stat.size_diff > 0
+            ]
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        _prune()
+
+
+def _take_snapshot():
+    # 排除剖析器自身和tracemalloc的分配
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+
+def _top_functions(profiler, n=15):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({func})", "calls": nc,
+                     "tottime_ms": round(tt * 1000, 2), "cumtime_ms": round(ct * 1000, 2)})
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+    return rows[:n]
+
+
+def _top_sampled(stacks, interval, n=15):
+    inclusive = Counter()
+    own = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    return [{"function": frame, "self_ms": round(own[frame] * interval * 1000, 1),
+             "total_ms": round(count * interval * 1000, 1)}
+            for frame, count in inclusive.most_common(n)]
+
+
+def _prune():
+    summaries = sorted(glob.glob(os.path.join(_profile_dir, "*.json")))
+    for path in summaries[:-_max_profiles]:
+        stem = path[:-len(".json")]
+        for ext in (".json", ".prof", ".collapsed"):
+            if os.path.exists(stem + ext):
+                os.remove(stem + ext)
+
+
+def profile_rerun(name):
+    """
+    剖析一次页面执行；未开启或当前线程已在剖析中时返回空上下文管理器
+    """
+    if not _enabled or getattr(_local, "active", False):
+        return _NULL_PROFILE
+    return _Profile(name, "rerun")
+
+
+class _OpenRerun:
+    """
+    当前线程中尚未结束的页面剖析；只由_local引用，脚本线程退出时被回收，剖析随之结束
+    """
+
+    def __init__(self, profile):
+        self._profile = profile
+        self._finalizer = weakref.finalize(self, profile.stop, "interrupted")
+
+    def stop(self):
+        if self._finalizer.detach() is not None:
+            self._profile.stop()
+
+    def interrupt(self):
+        self._finalizer()
+
+
+def start_rerun(name):
+    """
+    在页面开头调用，剖析本次页面执行直到stop_rerun()。未开启时直接返回
+    """
+    previous = getattr(_local, "rerun", None)
+    if previous is not None:
+        # 上一次执行没有走到stop_rerun()（st.rerun()等）
+        _local.rerun = None
+        previous.interrupt()
+    if not _enabled or getattr(_local, "active", False):
+        return
+    profile = _Profile(name, "rerun")
+    profile.__enter__()
+    _local.rerun = _OpenRerun(profile)
+
+
+def stop_rerun():
+    """
+    在页面末尾调用，结束并保存start_rerun()开始的剖析
+    """
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        _local.rerun = None
+        rerun.stop()
+
+
+def profiled(name):
+    """
+    剖析被装饰函数的单次调用；在页面执行中调用时已包含在该页面的结果里，不单独记录
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled or getattr(_local, "active", False):
+                return func(*args, **kwargs)
+            with _Profile(name, "call"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def list_profiles(kind=None, limit=50):
+    """
+    读取保存的摘要，按耗时从高到低排序
+    """
+    summaries = []
+    for path in glob.glob(os.path.join(_profile_dir, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if kind is None or summary.get("kind") == kind:
+            summaries.append(summary)
+    summaries.sort(key=lambda s: s["duration_ms"], reverse=True)
+    return summaries[:limit]
+
+
+def clear_profiles():
+    for pattern in ("*.json", "*.prof", "*.collapsed"):
+        for path in glob.glob(os.path.join(_profile_dir, pattern)):
+            os.remove(path)
@@ -0,0 +1,158 @@
+"""
+Reference selection for RAG prompts under a per-turn token budget.
+
+Retrieved QA pairs pass through PromptBuilder.build() before they are stored
+on a turn, so the prompt sent for that turn (and resent with every later
+request while the turn is in the context window) only carries:
+
+- references that are not already visible earlier in the context window,
+- one copy of near-identical references (the most similar one wins),
+- answers cut down to their sentences most relevant to the query,
+- as many references as fit in the token budget.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+from utilities import metrics
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE = re.compile(r"(?<=[.!?。！？])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be can do does for from have how i if in is it my of on or "
+    "should that the this to was what when which who why will with you your".split())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer, using DeepSeek's published ratios:
+    about 0.3 tokens per ASCII character and 0.6 per other (e.g. Chinese) character
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return int(0.3 * ascii_chars + 0.6 * (len(text) - ascii_chars)) + 1
+
+
+def reference_key(reference: Dict[str, Any]) -> str:
+    # Document excerpts have no question and are identified by their text
+    return " ".join((reference["question"] or reference["answer"][:200]).lower().split())
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall(text.lower())) - _STOPWORDS
+
+
+def _overlap(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class PromptBuilder:
+    # Per-reference framing in RAG.format_prompt ("Reference n:", "Question:", "Answer:")
+    REFERENCE_OVERHEAD = 8
+
+    def __init__(self, token_budget: int = 600, max_answer_tokens: int = 200,
+                 min_answer_tokens: int = 30, duplicate_overlap: float = 0.8) -> None:
+        """
+        Args:
+            token_budget: tokens allowed for all references of one turn
+            max_answer_tokens: longer answers are reduced to their most relevant sentences
+            min_answer_tokens: a reference whose answer would have to be cut below this is dropped
+            duplicate_overlap: word overlap (Jaccard) above which two references count as the same
+        """
+        self.token_budget = token_budget
+        self.max_answer_tokens = max_answer_tokens
+        self.min_answer_tokens = min_answer_tokens
+        self.duplicate_overlap = duplicate_overlap
+
+    def build(self, query: str, references: List[Dict[str, Any]],
+              seen: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Select and compress references for one turn.
+
+        Args:
+            query: the user query
+            references: retrieved QA pairs, most similar first
+            seen: reference_key() of references already in the context window
+
+        Returns:
+            New reference dicts; the input is not modified
+        """
+        return self.select(query, references, seen)[0]
+
+    def select(self, query: str, references: List[Dict[str, Any]],
+               seen: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Like build(), also returning how many references were skipped because
+        they (or a near-duplicate) are already in the context window
+        """
+        seen = set(seen)
+        query_words = _words(query)
+        kept: List[Dict[str, Any]] = []
+        # Near-duplicates of references already in the context are skipped too
+        seen_words: List[set] = [_words(key) for key in seen]
+        kept_words: List[set] = []
+        in_context = 0
+        remaining = self.token_budget
+        original_tokens = 0
+        for reference in references:
+            original_tokens += self._cost(reference["question"], reference["answer"])
+            words = _words(reference["question"])
+            if reference_key(reference) in seen or \
+                    any(_overlap(words, other) >= self.duplicate_overlap for other in seen_words):
+                in_context += 1
+                continue
+            if any(_overlap(words, other) >= self.duplicate_overlap for other in kept_words):
+                continue
+            if any(reference["answer"] == other["answer"] for other in kept):
+                continue
+
+            question_cost = self._cost(reference["question"], "")
+            answer_budget = min(self.max_answer_tokens, remaining - question_cost)
+            if answer_budget < self.min_answer_tokens:
+                break
+            answer = self.compress(reference["answer"], query_words | words, answer_budget)
+            kept.append({**reference, "answer": answer})
+            kept_words.append(words)
+            remaining -= question_cost + estimate_tokens(answer)
+
+        metrics.observe("prompt.reference_tokens", original_tokens, unit="tokens",
+                        buckets=metrics.COUNT_BUCKETS, stage="retrieved")
+        metrics.observe("prompt.reference_tokens", self.token_budget - remaining, unit="tokens",
+                        buckets=metrics.COUNT_BUCKETS, stage="sent")
+        return kept, in_context
+
+    def _cost(self, question: str, answer: str) -> int:
+        return self.REFERENCE_OVERHEAD + estimate_tokens(question) + (estimate_tokens(answer) if answer else 0)
+
+    @staticmethod
+    def compress(answer: str, relevant_words: set, budget: int) -> str:
+        """
+        Keep the sentences sharing the most words with the query (and the
+        referenced question) that fit in `budget` tokens, in their original order
+        """
+        if estimate_tokens(answer) <= budget:
+            return answer
+        sentences = [s for s in _SENTENCE.split(answer.strip()) if s]
+        # Earlier sentences win ties: answers usually lead with the direct reply
+        ranked = sorted(range(len(sentences)),
+                        key=lambda i: (-len(_words(sentences[i]) & relevant_words), i))
+        chosen = []
+        used = 0
+        for i in ranked:
+            cost = estimate_tokens(sentences[i])
+            if used + cost <= budget:
+                chosen.append(i)
+                used += cost
+        if not chosen:
+            # A single sentence longer than the budget: hard cut at a word boundary
+            cut = sentences[ranked[0]][:int(budget / 0.3)]
+            return cut.rsplit(" ", 1)[0] + " …"
+        chosen.sort()
+        parts = []
+        for n, i in enumerate(chosen):
+            if n == 0 and i > 0 or n > 0 and i != chosen[n - 1] + 1:
+                parts.append("…")
+            parts.append(sentences[i])
+        if chosen[-1] != len(sentences) - 1:
+            parts.append("…")
+        return " ".join(parts)
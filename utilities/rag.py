@@ -1,16 +1,26 @@
 import torch
-from sentence_transformers import SentenceTransformer
 import faiss
-from openai import OpenAI
 import numpy as np
 import json
 import os
+import hashlib
+import shutil
+import threading
+import time
+from utilities.sharded_index import ShardedIndex
+from utilities.encoders import load_encoder
+from utilities.scheduler import PRIORITY_SUGGESTION, scheduler
+from utilities import metrics, profiling
+from utilities.llm_client import DEFAULT_BASE_URL, get_client
 
 torch.classes.__path__ = []
 
 
 class RAG:
-    def __init__(self, index_path, qa_file_path, model_name="paraphrase-MiniLM-L6-v2", top_k=5, min_similarity=0.75):
+    def __init__(self, index_path, qa_file_path, model_name="paraphrase-MiniLM-L6-v2", top_k=5, min_similarity=0.75,
+                 shard_dir=None, n_probe_shards=3, max_shards=64, max_loaded_shards=8, model=None,
+                 index_type="flat", pq_m=None, mmap=False, verify_checksum=False,
+                 encoder="sentence_transformer", projection=None, projection_dim=None):
         """
         初始化RAG检索系统
 
@@ -20,69 +30,429 @@ class RAG:
             model_name: 使用的句子嵌入模型名称
             top_k: 返回的最相关结果数量
             min_similarity: 最小相似度阈值，低于此值的结果将被过滤
+            shard_dir: 按主题分片索引的目录，为None时使用单一索引；每份问答文件的分片
+                       保存在以其指纹命名的子目录中
+            n_probe_shards: 分片模式下每个查询搜索的分片数量
+            max_shards: 分片模式下的分片数量上限
+            max_loaded_shards: 分片模式下同时驻留内存的分片数量
+            model: 预先加载的编码模型（需提供与SentenceTransformer相同的encode接口），
+                   为None时按model_name加载
+            index_type: 索引存储格式，"flat"(float32精确)、"fp16"(半精度标量量化)或"pq"(乘积量化)
+            pq_m: PQ子量化器数量，为None时每8维一个
+            mmap: 以内存映射方式只读加载索引，多个进程可通过页缓存共享同一份索引
+            verify_checksum: 加载时校验索引文件的sha256（需完整读取文件，默认只校验大小和维度）
+            encoder: 按model_name加载的编码器类型，"sentence_transformer"或"mean_pooling"
+                     （HuggingFace模型+平均池化，如utilities.encoders.BIOBERT_MODEL）
+            projection: 降维方式，None、"pca"或"opq"；在语料上训练，随索引一起保存，
+                        查询时自动应用（不支持分片模式）
+            projection_dim: 降维后的维度
         """
         # 设置设备（GPU或CPU）
         self.device = torch.device(
             "cuda" if torch.cuda.is_available() else "cpu")
         # 加载句子嵌入模型
-        self.model = SentenceTransformer(
-            model_name).to(self.device)
+        self.model = model if model is not None else load_encoder(
+            encoder, model_name, self.device)
         self.qa_file_path = qa_file_path
-        # 加载问答数据
-        self.qa_pairs = self.load_qa_data(qa_file_path)
+        self.index_path = index_path
         # 设置默认参数
         self.top_k = top_k
         self.min_similarity = min_similarity
+        if projection is not None and (shard_dir is not None or not projection_dim):
+            raise ValueError("projection requires projection_dim and is not supported with shard_dir")
+        self.shard_dir = shard_dir
+        self.shard_kwargs = {"n_probe": n_probe_shards, "max_loaded": max_loaded_shards}
+        self.max_shards = max_shards
+        self.pq_m = pq_m
+        self.mmap = mmap
+        self.verify_checksum = verify_checksum
+        # 写入manifest的索引配置（不含问答文件指纹），与已有索引不一致时重新构建
+        self.base_config = {"index_type": index_type, "model_name": model_name, "encoder": encoder,
+                            "projection": projection, "projection_dim": projection_dim}
+
+        # 当前知识库(索引, 问答对, 索引配置)；reload时整体替换，查询开始时取一次引用，
+        # 因此总是看到一致的一对，替换也无需等待进行中的查询
+        self._kb = self.load_knowledge_base()
+        self._reload_lock = threading.Lock()
+        self.reload_status = {"state": "idle", "time": None, "error": None}
+
+    @property
+    def index(self):
+        return self._kb[0]
+
+    @property
+    def qa_pairs(self):
+        return self._kb[1]
+
+    @property
+    def index_config(self):
+        return self._kb[2]
+
+    def load_knowledge_base(self):
+        """
+        读取问答文件并计算其指纹，加载与之匹配的索引，不匹配时重新构建
 
-        # 检查索引文件是否存在，不存在则重新训练
-        if os.path.exists(index_path):
-            self.index = self.load_faiss_index(index_path)
+        返回:
+            (索引, 问答对, 索引配置)
+        """
+        qa_pairs, qa_sha256 = self.load_qa_file(self.qa_file_path)
+        index_config = {**self.base_config, "qa_sha256": qa_sha256}
+        index_path = self.index_path
+
+        # 分片模式：ShardedIndex与faiss索引接口一致，直接作为索引使用。
+        # 新的问答文件构建在新的子目录中，reload期间旧索引仍能按需读取自己的分片
+        if self.shard_dir is not None:
+            generation_dir = os.path.join(self.shard_dir, qa_sha256[:16])
+            if self.shards_match(generation_dir, index_config, len(qa_pairs)):
+                return ShardedIndex(generation_dir, **self.shard_kwargs), qa_pairs, index_config
+            if ShardedIndex.exists(generation_dir):
+                print(f"分片索引 {generation_dir} 与配置 {index_config} 或问答文件不一致，正在重新构建...")
+            else:
+                print(f"分片索引 {generation_dir} 不存在，正在构建...")
+            tmp_dir = generation_dir + ".tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            ShardedIndex.build(
+                self.question_embeddings(qa_pairs, index_config),
+                [item.get("topic", "") for item in qa_pairs],
+                tmp_dir, max_shards=self.max_shards, index_config=index_config)
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            os.replace(tmp_dir, generation_dir)
+            print(f"分片索引已保存到 {generation_dir}")
+            return ShardedIndex(generation_dir, **self.shard_kwargs), qa_pairs, index_config
+
+        # 检查索引文件是否存在、配置和问答文件指纹是否一致，否则重新训练
+        if self.index_matches(index_path, index_config, len(qa_pairs)):
+            try:
+                index = self.load_faiss_index(index_path, mmap=self.mmap)
+                # 文件与manifest不符（损坏或被替换）时同样重新训练
+                self.check_index_manifest(index, index_path, self.verify_checksum)
+                return index, qa_pairs, index_config
+            except (ValueError, RuntimeError) as e:
+                print(f"{e}，正在重新训练...")
+        elif os.path.exists(index_path):
+            print(f"索引文件 {index_path} 与配置 {index_config} 或问答文件不一致，正在重新训练...")
         else:
             print(f"索引文件 {index_path} 不存在，正在重新训练...")
-            # 编码所有问题
-            questions = [item["question"] for item in self.qa_pairs]
-            question_embeddings = self.generate_embeddings(questions)
+        # 编码所有问题
+        question_embeddings = self.question_embeddings(qa_pairs, index_config)
+
+        # 构建并保存索引
+        index = self.build_faiss_index(
+            question_embeddings, index_config["index_type"], self.pq_m,
+            index_config["projection"], index_config["projection_dim"])
+        self.save_faiss_index(index, index_path, index_config)
+        if self.mmap:
+            index = self.load_faiss_index(index_path, mmap=True)
+        print(f"索引已保存到 {index_path}")
+        return index, qa_pairs, index_config
+
+    def index_matches(self, index_path, index_config, n_qa):
+        """
+        索引文件存在，且其manifest与配置（含问答文件指纹）和问答对数量一致
+        """
+        if not os.path.exists(index_path):
+            return False
+        return self.fingerprint_matches(self.load_index_manifest(index_path), index_config, n_qa)
+
+    def shards_match(self, shard_dir, index_config, n_qa):
+        """
+        分片目录存在，且其manifest与配置（含问答文件指纹）和问答对数量一致
+        """
+        if not ShardedIndex.exists(shard_dir):
+            return False
+        return self.fingerprint_matches(ShardedIndex.load_manifest(shard_dir), index_config, n_qa)
 
-            # 构建并保存索引
-            self.index = self.build_faiss_index(question_embeddings)
-            faiss.write_index(self.index, index_path)
-            print(f"索引已保存到 {index_path}")
+    @staticmethod
+    def fingerprint_matches(manifest, index_config, n_qa):
+        """
+        没有manifest或manifest中没有问答文件指纹的旧索引无法确认对应哪份问答文件，视为不匹配
+        """
+        if "qa_sha256" not in manifest or "ntotal" not in manifest:
+            return False
+        return RAG.manifest_matches(manifest, index_config) and manifest["ntotal"] == n_qa
+
+    def knowledge_base_info(self):
+        """
+        当前加载的知识库规模、问答文件指纹和最近一次reload的状态
+        """
+        return {"qa_pairs": len(self.qa_pairs), "qa_sha256": self.index_config["qa_sha256"],
+                "reload": self.reload_status}
+
+    def qa_file_changed(self):
+        """
+        问答文件内容与当前加载的是否不同
+        """
+        return self.file_sha256(self.qa_file_path) != self.index_config["qa_sha256"]
+
+    def reload(self, background=True):
+        """
+        问答文件变化后重新加载知识库：加载匹配的索引或重新构建，完成后原子替换，
+        期间查询继续使用旧的(索引, 问答对)。已有reload在进行时直接返回。
+
+        参数:
+            background: 为True时在后台线程中进行并返回该线程，否则阻塞直到完成
+
+        返回:
+            后台模式下返回线程；阻塞模式下返回是否替换了知识库
+        """
+        if background:
+            thread = threading.Thread(target=self._reload, name="rag-reload", daemon=True)
+            thread.start()
+            return thread
+        return self._reload()
+
+    def _reload(self):
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self.qa_file_changed():
+                return False
+            self.reload_status = {"state": "reloading", "time": time.time(), "error": None}
+            kb = self.load_knowledge_base()
+            previous, self._kb = self._kb, kb
+            if self.shard_dir is not None:
+                # 被替换的分片可能仍有进行中的查询在读取，保留到下一次reload
+                self.remove_stale_shards(keep=(kb[0].shard_dir, previous[0].shard_dir))
+            self.reload_status = {"state": "reloaded", "time": time.time(), "error": None}
+            print(f"知识库已重新加载：{len(kb[1])} 条问答")
+            return True
+        except Exception as e:
+            self.reload_status = {"state": "failed", "time": time.time(), "error": f"{type(e).__name__}: {e}"}
+            print(f"知识库重新加载失败: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+
+    def remove_stale_shards(self, keep):
+        """
+        删除shard_dir下keep以外的分片子目录（包括中断构建留下的临时目录）
+        """
+        for name in os.listdir(self.shard_dir):
+            path = os.path.join(self.shard_dir, name)
+            if path not in keep and os.path.isdir(path) and ShardedIndex.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def start_watcher(self, interval=30.0):
+        """
+        后台线程定期检查问答文件的修改时间和大小，变化时自动reload
+        """
+        def watch():
+            last = None
+            while True:
+                try:
+                    stat = os.stat(self.qa_file_path)
+                    current = (stat.st_mtime_ns, stat.st_size)
+                    if last is not None and current != last:
+                        self._reload()
+                    last = current
+                except OSError as e:
+                    print(f"检查问答文件失败: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=watch, name="rag-kb-watcher", daemon=True)
+        thread.start()
+        return thread
 
     def load_qa_data(self, file_path):
         """
         从JSON文件加载结构化问答对
         """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            qa_pairs = json.load(f)
-        return qa_pairs
+        return self.load_qa_file(file_path)[0]
+
+    @staticmethod
+    def load_qa_file(file_path):
+        """
+        加载问答对并计算文件的sha256指纹（基于同一次读取的内容）
+        """
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return json.loads(data.decode('utf-8')), hashlib.sha256(data).hexdigest()
+
+    def question_embeddings(self, qa_pairs, index_config):
+        """
+        获取所有问题的嵌入向量：已有同一模型、同一问答文件、未降维的float32单一索引时
+        直接从中还原，否则重新编码
+        """
+        flat_config = {**index_config, "index_type": "flat", "projection": None, "projection_dim": None}
+        if self.index_matches(self.index_path, flat_config, len(qa_pairs)):
+            try:
+                index = self.load_faiss_index(self.index_path)
+                self.check_index_manifest(index, self.index_path)
+                return index.reconstruct_n(0, index.ntotal)
+            except (ValueError, RuntimeError):
+                pass
+        questions = [item["question"] for item in qa_pairs]
+
+        # reload时复用当前float32索引中未变化问题的向量，只编码新增或修改的问题
+        previous = getattr(self, "_kb", None)
+        if previous is not None and isinstance(previous[0], faiss.IndexFlat) and \
+                self.manifest_matches(previous[2], {key: index_config[key] for key in ("model_name", "encoder")}):
+            old_rows = {item["question"]: i for i, item in enumerate(previous[1])}
+            rows = [old_rows.get(q) for q in questions]
+            known = [i for i, row in enumerate(rows) if row is not None]
+            missing = [i for i, row in enumerate(rows) if row is None]
+            embeddings = np.empty((len(questions), previous[0].d), dtype="float32")
+            if known:
+                embeddings[known] = previous[0].reconstruct_batch(
+                    np.array([rows[i] for i in known], dtype="int64"))
+            if missing:
+                embeddings[missing] = self.generate_embeddings([questions[i] for i in missing])
+            return embeddings
+
+        return self.generate_embeddings(questions)
 
     def generate_embeddings(self, texts):
         """
         为文本列表生成嵌入向量
         """
-        embeddings = self.model.encode(
-            texts, convert_to_tensor=True, device=self.device)
+        return self.encode_texts(self.model, texts, self.device)
+
+    @staticmethod
+    def encode_texts(model, texts, device):
+        """
+        用给定模型编码文本并归一化，供RAG以外的离线处理（如去重）复用同一编码方式
+        """
+        embeddings = model.encode(
+            texts, convert_to_tensor=True, device=device)
         # 归一化向量
         embeddings = embeddings / torch.norm(embeddings, dim=1, keepdim=True)
         return embeddings.cpu().numpy()
 
     @staticmethod
-    def build_faiss_index(embeddings):
+    def build_faiss_index(embeddings, index_type="flat", pq_m=None, projection=None, projection_dim=None):
         """
         构建FAISS索引用于高效相似度搜索
+
+        参数:
+            embeddings: 归一化后的嵌入矩阵
+            index_type: "flat"、"fp16"或"pq"，见__init__
+            pq_m: PQ子量化器数量，为None时每8维一个
+            projection, projection_dim: 降维方式和目标维度，见__init__
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        n, embedding_dim = embeddings.shape
+        if projection is not None:
+            return RAG.build_projected_index(
+                embeddings, index_type, pq_m, projection, projection_dim)
+        if index_type == "flat":
+            index = faiss.IndexFlatIP(embedding_dim)  # 内积等价于余弦相似度（归一化后）
+        elif index_type == "fp16":
+            index = faiss.IndexScalarQuantizer(
+                embedding_dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        elif index_type == "pq":
+            pq_m = pq_m or max(m for m in range(1, embedding_dim // 8 + 1)
+                               if embedding_dim % m == 0)
+            # 每个子量化器的码本大小不超过训练样本数
+            nbits = int(min(8, max(1, np.log2(max(n, 2)))))
+            index = faiss.IndexPQ(embedding_dim, pq_m, nbits,
+                                  faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        else:
+            raise ValueError(f"Unknown index_type: {index_type}")
+        index.add(embeddings)
+        return index
+
+    @staticmethod
+    def build_projected_index(embeddings, index_type, pq_m, projection, projection_dim):
+        """
+        在语料上训练降维矩阵，返回IndexPreTransform：依次做降维、重新归一化，
+        再交给内层索引。变换保存在索引文件内，查询向量在search时自动投影，
+        内积仍等价于余弦相似度
         """
         embedding_dim = embeddings.shape[1]
-        index = faiss.IndexFlatIP(embedding_dim)  # 内积等价于余弦相似度（归一化后）
-        index.add(np.array(embeddings))
+        if projection == "pca":
+            transform = faiss.PCAMatrix(embedding_dim, projection_dim)
+        elif projection == "opq":
+            # OPQ的旋转针对PQ编码优化，子空间数量与PQ索引保持一致
+            pq_m = pq_m or max(m for m in range(1, projection_dim // 8 + 1)
+                               if projection_dim % m == 0)
+            transform = faiss.OPQMatrix(embedding_dim, pq_m, projection_dim)
+        else:
+            raise ValueError(f"Unknown projection: {projection}")
+        transform.train(embeddings)
+        projected = transform.apply(embeddings)
+        faiss.normalize_L2(projected)
+        index = faiss.IndexPreTransform(
+            faiss.NormalizationTransform(projection_dim),
+            RAG.build_faiss_index(projected, index_type, pq_m))
+        index.prepend_transform(transform)
         return index
 
     @staticmethod
-    def load_faiss_index(index_path):
+    def load_faiss_index(index_path, mmap=False):
         """
-        加载预先构建的FAISS索引
+        加载预先构建的FAISS索引，mmap为True时以只读内存映射方式加载
         """
+        if mmap:
+            # IO_FLAG_MMAP_IFC让Flat/SQ/PQ等编码直接引用映射的文件页（较新的faiss才支持）
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            return faiss.read_index(index_path, flags)
         return faiss.read_index(index_path)
 
+    @staticmethod
+    def save_faiss_index(index, index_path, index_config=None):
+        """
+        保存索引，并在旁边写入记录配置、规模和sha256校验和的manifest文件。
+        先写临时文件再替换，已映射旧文件的进程不受影响
+        """
+        tmp_path = index_path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        manifest = {
+            **(index_config or {"index_type": "flat"}),
+            "dim": index.d,
+            "ntotal": index.ntotal,
+            "file_size": os.path.getsize(tmp_path),
+            "sha256": RAG.file_sha256(tmp_path),
+        }
+        with open(index_path + ".manifest.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, index_path)
+        os.replace(index_path + ".manifest.json.tmp", index_path + ".manifest.json")
+
+    @staticmethod
+    def load_index_manifest(index_path):
+        """
+        读取索引的manifest，旧版本生成的索引没有manifest时返回空dict
+        """
+        manifest_path = index_path + ".manifest.json"
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def manifest_matches(manifest, index_config):
+        """
+        比较manifest与期望的索引配置；旧manifest缺少的字段按默认值处理
+        （记录编码器类型之前只支持sentence_transformer），缺少model_name时不比较
+        """
+        defaults = {"index_type": "flat", "projection": None, "projection_dim": None,
+                    "encoder": "sentence_transformer", "model_name": index_config.get("model_name")}
+        return all(manifest.get(key, defaults.get(key)) == value
+                   for key, value in index_config.items())
+
+    @staticmethod
+    def check_index_manifest(index, index_path, verify_checksum=False):
+        """
+        校验已加载的索引与manifest一致，不一致时抛出ValueError
+        """
+        manifest = RAG.load_index_manifest(index_path)
+        if not manifest:
+            return
+        if manifest["dim"] != index.d or manifest["ntotal"] != index.ntotal or \
+                manifest["file_size"] != os.path.getsize(index_path):
+            raise ValueError(f"索引文件 {index_path} 与manifest不一致，可能已损坏")
+        if verify_checksum and manifest["sha256"] != RAG.file_sha256(index_path):
+            raise ValueError(f"索引文件 {index_path} 校验和不匹配，可能已损坏")
+
+    @staticmethod
+    def file_sha256(path, chunk_size=1 << 20):
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
     def rag_query(self, query, top_k=None, min_similarity=None):
         """
         Execute RAG query, returning the most relevant QA pairs for the query
@@ -95,39 +465,29 @@ class RAG:
         Returns:
             Formatted user_prompt string containing original query and retrieved results
         """
-        # Use default values or passed parameters
-        top_k = top_k if top_k is not None else self.top_k
-        min_similarity = min_similarity if min_similarity is not None else self.min_similarity
-
-        # Generate embedding vector for the query
-        query_embedding = self.model.encode(
-            [query], convert_to_tensor=True, device=self.device)
-        query_embedding = query_embedding / \
-            torch.norm(query_embedding, dim=1, keepdim=True)
-        query_embedding = query_embedding.cpu().numpy()
-
-        # Search for the most similar questions
-        distances, indices = self.index.search(query_embedding, top_k)
-
-        # Organize results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            similarity = float(distances[0][i])
-            # Only add results with similarity above threshold
-            if similarity >= min_similarity:
-                results.append({
-                    "question": self.qa_pairs[idx]["question"],
-                    "answer": self.qa_pairs[idx]["answer"],
-                    "similarity": similarity
-                })
+        with metrics.span("rag.query"):
+            results = self.retrieve_top_questions(query, top_k, min_similarity)
+            with metrics.span("rag.format"):
+                return self.format_prompt(query, results)
 
+    @staticmethod
+    def format_prompt(query, results, note=""):
+        """
+        Build the user_prompt string from a query and its retrieved results.
+        `note` is written in place of the references when there are none
+        """
         # Construct user_prompt
         user_prompt = f"User query: {query}\n\nReference information:\n"
         for i, result in enumerate(results):
             user_prompt += f"Reference {i+1}:\n"
-            user_prompt += f"Question: {result['question']}\n"
-            user_prompt += f"Answer: {result['answer']}\n"
-            user_prompt += f"Similarity: {result['similarity']:.4f}\n\n"
+            if result["question"]:
+                user_prompt += f"Question: {result['question']}\n"
+                user_prompt += f"Answer: {result['answer']}\n\n"
+            else:
+                # Document excerpts have no question
+                user_prompt += f"Excerpt: {result['answer']}\n\n"
+        if not results and note:
+            user_prompt += note + "\n\n"
 
         # Add guidance text
         user_prompt += "Please answer the user's query based on the reference information above. If the reference is irrevalent to the query, please answer the query based on your knowledge."
@@ -146,33 +506,53 @@ class RAG:
         返回:
             包含相似问题、答案和相似度分数的列表
         """
+        return self.retrieve_top_questions_batch([query], top_k, min_similarity)[0]
+
+    @profiling.profiled("rag.retrieve")
+    def retrieve_top_questions_batch(self, queries, top_k=None, min_similarity=None):
+        """
+        批量检索：一次编码、一次搜索多个查询
+
+        参数:
+            queries: 用户查询文本列表
+            top_k: 返回的最相关结果数量，如果为None则使用默认值
+            min_similarity: 最小相似度阈值，如果为None则使用默认值
+
+        返回:
+            与queries一一对应的结果列表，每项格式同retrieve_top_questions
+        """
         # 使用默认值或传入的参数
         top_k = top_k if top_k is not None else self.top_k
         min_similarity = min_similarity if min_similarity is not None else self.min_similarity
 
         # 生成查询的嵌入向量
-        query_embedding = self.model.encode(
-            [query], convert_to_tensor=True, device=self.device)
-        query_embedding = query_embedding / \
-            torch.norm(query_embedding, dim=1, keepdim=True)
-        query_embedding = query_embedding.cpu().numpy()
+        with metrics.span("rag.encode"):
+            query_embeddings = self.generate_embeddings(queries)
+
+        # 同一批查询使用同一个(索引, 问答对)，不受并发reload影响
+        index, qa_pairs, _ = self._kb
 
         # 搜索最相似的问题
-        distances, indices = self.index.search(query_embedding, top_k)
+        with metrics.span("rag.search"):
+            distances, indices = index.search(query_embeddings, top_k)
 
         # 整理结果
-        results = []
-        for i, idx in enumerate(indices[0]):
-            similarity = float(distances[0][i])
-            # 只添加相似度高于阈值的结果
-            if similarity >= min_similarity:
-                results.append({
-                    "question": self.qa_pairs[idx]["question"],
-                    "answer": self.qa_pairs[idx]["answer"],
-                    "similarity": similarity
-                })
-
-        return results
+        batch_results = []
+        for q in range(len(queries)):
+            results = []
+            for i, idx in enumerate(indices[q]):
+                similarity = float(distances[q][i])
+                # 只添加相似度高于阈值的结果
+                if idx >= 0 and similarity >= min_similarity:
+                    results.append({
+                        "question": qa_pairs[idx]["question"],
+                        "answer": qa_pairs[idx]["answer"],
+                        "topic": qa_pairs[idx].get("topic", ""),
+                        "similarity": similarity
+                    })
+            batch_results.append(results)
+
+        return batch_results
 
 
 class NextQuestionGenerator:
@@ -180,7 +560,7 @@ class NextQuestionGenerator:
     基于用户查询和回答生成可能的后续问题
     """
 
-    def __init__(self, api_key="", base_url="https://api.deepseek.com", model="deepseek-chat"):
+    def __init__(self, api_key="", base_url=DEFAULT_BASE_URL, model="deepseek-chat"):
         """
         初始化后续问题生成器
 
@@ -192,12 +572,11 @@ class NextQuestionGenerator:
         self.base_url = base_url
         self.api_key = api_key
         self.model = model
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=self.base_url
-        )
+        self.client = get_client(api_key, self.base_url)
 
-    def generate_next_questions(self, question, answer, n=3):
+    @metrics.timed("nq.generate")
+    @profiling.profiled("nq.generate")
+    def generate_next_questions(self, question, answer, n=3, user="", candidates=None):
         """
         生成用户可能的后续问题
 
@@ -205,6 +584,8 @@ class NextQuestionGenerator:
             question: 用户当前问题
             answer: 系统回答
             n: 生成的后续问题数量
+            user: 请求所属用户，用于调度器的公平排队
+            candidates: 本地推荐的候选问题，提供时让模型在此基础上改写、补充
 
         返回:
             可能的后续问题列表
@@ -212,13 +593,21 @@ class NextQuestionGenerator:
         if not self.client:
             return ["无法生成后续问题：API客户端未初始化"]
 
+        hint = ""
+        if candidates:
+            listed = "\n".join(f"        - {c}" for c in candidates)
+            hint = f"""
+        Related questions from our knowledge base (you may refine, combine or replace them):
+{listed}
+"""
+
         user_prompt = f"""You are a helpful, empathetic, and knowledgeable health assistant.
 
         Your task is to thoughtfully analyze the following Q&A pair and creatively suggest {n} highly relevant and context-aware follow-up questions that the user might naturally ask next.
 
         Q: {question}
         A: {answer}
-
+        {hint}
         Please provide exactly {n} follow-up questions in a numbered list format:
 
         1. 
@@ -227,16 +616,18 @@ class NextQuestionGenerator:
         """
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system",
-                        "content": "You are a helpful and knowledgeable health chatbot."},
-                    {"role": "user", "content": user_prompt.strip()}
-                ],
-                temperature=0.7,
-                max_tokens=128
-            )
+            # 后续问题的优先级低于回答流
+            with scheduler.acquire(user, PRIORITY_SUGGESTION):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system",
+                            "content": "You are a helpful and knowledgeable health chatbot."},
+                        {"role": "user", "content": user_prompt.strip()}
+                    ],
+                    temperature=0.7,
+                    max_tokens=128
+                )
             raw = response.choices[0].message.content.strip()
 
             # 解析输出为问题列表
@@ -0,0 +1,281 @@
+"""
+独立的检索服务：一台机器上只加载一份RAG（编码模型+FAISS索引），
+多个Streamlit工作进程通过HTTP或Unix socket共享。
+
+服务端把并发到达的查询动态合并成微批（最多max_batch_size条、最多等待max_wait_ms），
+一次编码、一次搜索。RetrievalClient提供与RAG相同的rag_query/retrieve_top_questions接口，
+可直接替换st.session_state.rag。
+
+    python -m utilities.retrieval_service --socket /tmp/healthbot_rag.sock
+    HEALTHBOT_RETRIEVAL_URL=unix:///tmp/healthbot_rag.sock streamlit run Homepage.py
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from utilities.rag import RAG
+
+
+class MicroBatcher:
+    """
+    把单条检索请求合并成批量调用RAG.retrieve_top_questions_batch
+    """
+
+    def __init__(self, rag, max_batch_size=32, max_wait_ms=5.0):
+        self.rag = rag
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self._thread = threading.Thread(target=self._run, name="rag-microbatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, top_k=None, min_similarity=None):
+        """
+        提交一条查询，返回Future，结果格式同retrieve_top_questions
+        """
+        future = Future()
+        self._queue.put((query,
+                         top_k if top_k is not None else self.rag.top_k,
+                         min_similarity if min_similarity is not None else self.rag.min_similarity,
+                         future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        # 以批内最大的top_k、最小的阈值统一搜索，再按各自参数截取
+        top_k = max(item[1] for item in batch)
+        min_similarity = min(item[2] for item in batch)
+        try:
+            results = self.rag.retrieve_top_questions_batch(
+                [item[0] for item in batch], top_k, min_similarity)
+        except Exception as e:
+            for item in batch:
+                item[3].set_exception(e)
+            return
+        self.batches += 1
+        self.queries += len(batch)
+        for (_, k, threshold, future), result in zip(batch, results):
+            future.set_result([r for r in result if r["similarity"] >= threshold][:k])
+
+    def stats(self):
+        return {"batches": self.batches, "queries": self.queries,
+                "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "queue_depth": self._queue.qsize()}
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", **self.server.batcher.stats(),
+                             **self.server.batcher.rag.knowledge_base_info()})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            top_k = request.get("top_k")
+            min_similarity = request.get("min_similarity")
+            if self.path == "/retrieve":
+                futures = [self.server.batcher.submit(q, top_k, min_similarity)
+                           for q in request["queries"]]
+                self._send(200, {"results": [f.result() for f in futures]})
+            elif self.path == "/rag_query":
+                results = self.server.batcher.submit(request["query"], top_k, min_similarity).result()
+                self._send(200, {"prompt": RAG.format_prompt(request["query"], results)})
+            elif self.path == "/reload":
+                # 在后台重建/重新加载，查询继续使用旧知识库直到替换完成
+                self.server.batcher.rag.reload(background=True)
+                self._send(202, {"status": "reloading"})
+            else:
+                self._send(404, {"error": "not found"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class RetrievalHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, batcher):
+        super().__init__(address, RetrievalHandler)
+        self.batcher = batcher
+
+
+class RetrievalUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path, batcher):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, RetrievalHandler)
+        self.batcher = batcher
+
+    def get_request(self):
+        # BaseHTTPRequestHandler期望client_address是(host, port)
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RetrievalClient:
+    """
+    检索服务的客户端，接口与RAG的rag_query/retrieve_top_questions一致
+
+    url形如 http://127.0.0.1:8600 或 unix:///tmp/healthbot_rag.sock；
+    每个线程保持一条长连接。
+    """
+
+    def __init__(self, url, top_k=None, min_similarity=None, timeout=30.0):
+        """
+        参数:
+            url: 服务地址
+            top_k, min_similarity: 默认检索参数，为None时使用服务端RAG的默认值
+            timeout: 单次请求超时（秒）
+        """
+        self.url = url
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parsed = urlparse(self.url)
+            if parsed.scheme == "unix":
+                conn = _UnixHTTPConnection(parsed.path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _post(self, path, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", path, body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # 服务端关闭了空闲长连接，重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status not in (200, 202):
+            raise RuntimeError(f"Retrieval service error {response.status}: {data.get('error')}")
+        return data
+
+    def _params(self, top_k, min_similarity):
+        return {"top_k": top_k if top_k is not None else self.top_k,
+                "min_similarity": min_similarity if min_similarity is not None else self.min_similarity}
+
+    def rag_query(self, query, top_k=None, min_similarity=None):
+        return self._post("/rag_query", {"query": query, **self._params(top_k, min_similarity)})["prompt"]
+
+    def retrieve_top_questions(self, query, top_k=None, min_similarity=None):
+        return self.retrieve_top_questions_batch([query], top_k, min_similarity)[0]
+
+    def retrieve_top_questions_batch(self, queries, top_k=None, min_similarity=None):
+        return self._post("/retrieve", {"queries": list(queries), **self._params(top_k, min_similarity)})["results"]
+
+    def reload(self, background=True):
+        """
+        让服务端在后台重新加载知识库（background参数仅为与RAG.reload接口一致）
+        """
+        self._post("/reload", {})
+
+    def knowledge_base_info(self):
+        conn = self._connection()
+        conn.request("GET", "/health")
+        data = json.loads(conn.getresponse().read())
+        return {key: data[key] for key in ("qa_pairs", "qa_sha256", "reload")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shared RAG engine to local processes")
+    parser.add_argument("--index", default="traing_data/qa_embeddings.index")
+    parser.add_argument("--qa", default="traing_data/structured_qa.json")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--min-similarity", type=float, default=0.75)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--socket", default=None, help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--watch", type=float, default=0,
+                        help="reload the knowledge base when the QA file changes, checking every N seconds")
+    args = parser.parse_args()
+
+    rag = RAG(index_path=args.index, qa_file_path=args.qa,
+              top_k=args.top_k, min_similarity=args.min_similarity)
+    if args.watch > 0:
+        rag.start_watcher(args.watch)
+    batcher = MicroBatcher(rag, args.max_batch_size, args.max_wait_ms)
+    if args.socket:
+        server = RetrievalUnixServer(args.socket, batcher)
+        print(f"Retrieval service listening on unix://{args.socket}")
+    else:
+        server = RetrievalHTTPServer((args.host, args.port), batcher)
+        print(f"Retrieval service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+进程内的LLM请求调度器
+
+所有会话的DeepSeek请求先向调度器申请名额：全局并发数不超过max_concurrent，
+超出的请求排队。出队顺序先按优先级（回答流优先于后续问题推荐），同一优先级内
+按用户轮转，避免单个用户的大量请求饿死其他用户。低优先级请求排队超过max_wait秒后
+视同最高优先级，回答流持续占满名额时推荐请求也不会一直等下去。排队深度和等待时间记入metrics。
+
+    ticket = scheduler.submit("alice", PRIORITY_ANSWER)
+    while not ticket.wait(0.25):
+        print("queue position", ticket.position())
+    try:
+        ...  # 调用API
+    finally:
+        ticket.release()
+
+并发上限由环境变量 HEALTHBOT_LLM_CONCURRENCY 设置（默认8），低优先级请求的最长
+优先等待时间由 HEALTHBOT_LLM_MAX_WAIT 设置（默认10秒）。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from utilities import metrics
+
+PRIORITY_ANSWER = 0
+PRIORITY_SUGGESTION = 1
+
+_PRIORITY_NAMES = {PRIORITY_ANSWER: "answer", PRIORITY_SUGGESTION: "suggestion"}
+
+
+class Ticket:
+    def __init__(self, scheduler, user, priority):
+        self.scheduler = scheduler
+        self.user = user
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.state = "waiting"
+        self._granted = threading.Event()
+
+    def wait(self, timeout=None) -> bool:
+        """
+        等待获得名额，返回是否已获得
+        """
+        return self._granted.wait(timeout)
+
+    def position(self) -> int:
+        """
+        按优先级估计的排队位置（1表示下一个获得名额），已获得名额时为0；
+        超过max_wait的低优先级请求实际会更早获得名额
+        """
+        return self.scheduler.position(self)
+
+    def release(self) -> None:
+        """
+        归还名额；仍在排队时则退出队列。可重复调用
+        """
+        self.scheduler.release(self)
+
+
+class RequestScheduler:
+    def __init__(self, max_concurrent: int = 8, max_wait: float = 10.0) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._active = 0
+        # priority -> user -> 该用户排队中的请求；OrderedDict的顺序即轮转顺序
+        self._queues = {p: OrderedDict() for p in _PRIORITY_NAMES}
+
+    def submit(self, user: str, priority: int = PRIORITY_ANSWER) -> Ticket:
+        ticket = Ticket(self, user, priority)
+        with self._lock:
+            self._queues[priority].setdefault(user, deque()).append(ticket)
+            depth = self._queued()
+            self._dispatch()
+        metrics.observe("scheduler.queue_depth", depth, unit="requests",
+                        buckets=metrics.COUNT_BUCKETS, priority=_PRIORITY_NAMES[priority])
+        return ticket
+
+    @contextmanager
+    def acquire(self, user: str, priority: int = PRIORITY_ANSWER):
+        """
+        阻塞直到获得名额，退出时归还
+        """
+        ticket = self.submit(user, priority)
+        try:
+            ticket.wait()
+            yield ticket
+        finally:
+            ticket.release()
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket.state == "granted":
+                self._active -= 1
+                self._dispatch()
+            elif ticket.state == "waiting":
+                user_queue = self._queues[ticket.priority].get(ticket.user)
+                if user_queue is not None:
+                    user_queue.remove(ticket)
+                    if not user_queue:
+                        del self._queues[ticket.priority][ticket.user]
+            ticket.state = "done"
+
+    def _dispatch(self) -> None:
+        # 调用方持有self._lock
+        while self._active < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._active += 1
+            ticket.state = "granted"
+            ticket._granted.set()
+            metrics.observe("scheduler.wait", time.monotonic() - ticket.enqueued_at,
+                            priority=_PRIORITY_NAMES[ticket.priority])
+
+    def _next_ticket(self):
+        priorities = sorted(p for p, users in self._queues.items() if users)
+        if not priorities:
+            return None
+        priority = priorities[0]
+        # 低优先级中有排队超过max_wait的请求时先服务该优先级
+        deadline = time.monotonic() - self.max_wait
+        for lower in priorities[1:]:
+            if any(user_queue[0].enqueued_at <= deadline for user_queue in self._queues[lower].values()):
+                priority = lower
+                break
+        users = self._queues[priority]
+        user, user_queue = next(iter(users.items()))
+        ticket = user_queue.popleft()
+        # 轮到的用户移到队尾
+        del users[user]
+        if user_queue:
+            users[user] = user_queue
+        return ticket
+
+    def _queued(self) -> int:
+        return sum(len(q) for users in self._queues.values() for q in users.values())
+
+    def position(self, ticket: Ticket) -> int:
+        with self._lock:
+            if ticket.state != "waiting":
+                return 0
+            position = 0
+            for priority in sorted(self._queues):
+                user_queues = list(self._queues[priority].values())
+                # 按轮转顺序展开：每个用户的第1个、第2个……
+                for depth in range(max((len(q) for q in user_queues), default=0)):
+                    for user_queue in user_queues:
+                        if depth < len(user_queue):
+                            position += 1
+                            if user_queue[depth] is ticket:
+                                return position
+            return position
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active": self._active, "max_concurrent": self.max_concurrent,
+                    "queued": {_PRIORITY_NAMES[p]: sum(len(q) for q in users.values())
+                               for p, users in self._queues.items()}}
+
+
+scheduler = RequestScheduler(int(os.environ.get("HEALTHBOT_LLM_CONCURRENCY", "8")),
+                             float(os.environ.get("HEALTHBOT_LLM_MAX_WAIT", "10")))
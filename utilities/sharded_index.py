@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+from collections import OrderedDict, defaultdict
+
+import faiss
+import numpy as np
+
+
+class ShardedIndex:
+    """
+    按主题分片的FAISS索引
+
+    每个主题（或主题簇）一个IndexFlatIP分片，另有一个由分片质心构成的小型路由索引。
+    查询时先由路由选出最相近的n_probe个分片，只在这些分片中搜索并合并结果。
+    分片按需加载，超过max_loaded后按LRU淘汰。search()与faiss索引的接口一致，
+    返回的是全局行号，因此可以直接替换RAG.index。
+    """
+
+    ROUTER_FILE = "router.npy"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, shard_dir, n_probe=3, max_loaded=8):
+        """
+        参数:
+            shard_dir: 分片文件所在目录（由build生成）
+            n_probe: 每个查询搜索的分片数量
+            max_loaded: 同时驻留内存的最大分片数量
+        """
+        self.shard_dir = shard_dir
+        self.n_probe = n_probe
+        self.max_loaded = max_loaded
+        self.manifest = self.load_manifest(shard_dir)
+        self.d = self.manifest["dim"]
+        self.ntotal = self.manifest["ntotal"]
+        centroids = np.load(os.path.join(shard_dir, self.ROUTER_FILE))
+        self.router = faiss.IndexFlatIP(self.d)
+        self.router.add(centroids)
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def exists(cls, shard_dir):
+        return os.path.exists(os.path.join(shard_dir, cls.MANIFEST_FILE))
+
+    @classmethod
+    def load_manifest(cls, shard_dir):
+        with open(os.path.join(shard_dir, cls.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def build(cls, embeddings, topics, shard_dir, max_shards=64, index_config=None, **kwargs):
+        """
+        构建并保存分片索引
+
+        参数:
+            embeddings: 归一化后的问题嵌入 (n, d)，行号即问答对下标
+            topics: 与embeddings对应的主题列表
+            shard_dir: 输出目录
+            max_shards: 分片数量上限，主题多于此值时对主题质心做k-means合并；
+                        没有主题信息时直接对向量做k-means
+            index_config: 一并写入manifest的配置（如RAG的模型和问答文件指纹）
+
+        返回:
+            加载好的ShardedIndex实例
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        n, d = embeddings.shape
+
+        rows_by_topic = defaultdict(list)
+        for row, topic in enumerate(topics):
+            rows_by_topic[topic or ""].append(row)
+
+        if len(rows_by_topic) == 1:
+            # 没有可用的主题信息，按向量聚类
+            groups = cls._kmeans_groups(embeddings, min(max_shards, n))
+        elif len(rows_by_topic) > max_shards:
+            topic_rows = list(rows_by_topic.values())
+            topic_centroids = np.stack(
+                [embeddings[rows].mean(axis=0) for rows in topic_rows])
+            faiss.normalize_L2(topic_centroids)
+            groups = [
+                [row for t in topic_group for row in topic_rows[t]]
+                for topic_group in cls._kmeans_groups(topic_centroids, max_shards)
+            ]
+        else:
+            groups = list(rows_by_topic.values())
+
+        os.makedirs(shard_dir, exist_ok=True)
+        centroids = []
+        for shard_id, rows in enumerate(groups):
+            ids = np.asarray(rows, dtype="int64")
+            index = faiss.IndexFlatIP(d)
+            index.add(embeddings[ids])
+            faiss.write_index(index, cls._shard_path(shard_dir, shard_id))
+            np.save(cls._ids_path(shard_dir, shard_id), ids)
+            centroids.append(embeddings[ids].mean(axis=0))
+
+        centroids = np.ascontiguousarray(np.stack(centroids), dtype="float32")
+        faiss.normalize_L2(centroids)
+        np.save(os.path.join(shard_dir, cls.ROUTER_FILE), centroids)
+        with open(os.path.join(shard_dir, cls.MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({**(index_config or {}), "dim": d, "ntotal": n, "n_shards": len(groups),
+                       "sizes": [len(rows) for rows in groups]}, f)
+        return cls(shard_dir, **kwargs)
+
+    @staticmethod
+    def _kmeans_groups(vectors, k):
+        kmeans = faiss.Kmeans(vectors.shape[1], k, niter=20, spherical=True, seed=1234)
+        kmeans.train(vectors)
+        _, assign = kmeans.index.search(vectors, 1)
+        groups = defaultdict(list)
+        for row, cluster in enumerate(assign[:, 0]):
+            groups[int(cluster)].append(row)
+        return list(groups.values())
+
+    @staticmethod
+    def _shard_path(shard_dir, shard_id):
+        return os.path.join(shard_dir, f"shard_{shard_id}.index")
+
+    @staticmethod
+    def _ids_path(shard_dir, shard_id):
+        return os.path.join(shard_dir, f"shard_{shard_id}.ids.npy")
+
+    def _get_shard(self, shard_id):
+        """
+        返回 (分片索引, 全局行号数组)，未加载时从磁盘读取并按LRU淘汰
+        """
+        with self._lock:
+            if shard_id in self._shards:
+                self._shards.move_to_end(shard_id)
+                return self._shards[shard_id]
+        shard = (faiss.read_index(self._shard_path(self.shard_dir, shard_id)),
+                 np.load(self._ids_path(self.shard_dir, shard_id)))
+        with self._lock:
+            self._shards[shard_id] = shard
+            self._shards.move_to_end(shard_id)
+            while len(self._shards) > self.max_loaded:
+                self._shards.popitem(last=False)
+        return shard
+
+    def evict(self, shard_id=None):
+        """
+        释放指定分片，shard_id为None时释放全部已加载分片
+        """
+        with self._lock:
+            if shard_id is None:
+                self._shards.clear()
+            else:
+                self._shards.pop(shard_id, None)
+
+    @property
+    def loaded_shards(self):
+        with self._lock:
+            return list(self._shards)
+
+    def search(self, queries, k):
+        """
+        与faiss的index.search一致：返回 (distances, indices)，形状均为 (nq, k)，
+        indices为全局行号，不足k个时以-1补齐
+        """
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        nq = queries.shape[0]
+        n_probe = min(self.n_probe, self.router.ntotal)
+        _, routed = self.router.search(queries, n_probe)
+
+        # 同一个分片的所有查询合并成一次搜索
+        queries_by_shard = defaultdict(list)
+        for q, shard_ids in enumerate(routed):
+            for shard_id in shard_ids:
+                if shard_id >= 0:
+                    queries_by_shard[int(shard_id)].append(q)
+
+        candidates = [([], []) for _ in range(nq)]
+        for shard_id, qs in queries_by_shard.items():
+            index, ids = self._get_shard(shard_id)
+            distances, local = index.search(queries[qs], min(k, index.ntotal))
+            for row, q in enumerate(qs):
+                valid = local[row] >= 0
+                candidates[q][0].append(distances[row][valid])
+                candidates[q][1].append(ids[local[row][valid]])
+
+        out_d = np.full((nq, k), -np.inf, dtype="float32")
+        out_i = np.full((nq, k), -1, dtype="int64")
+        for q, (ds, ids) in enumerate(candidates):
+            if not ds:
+                continue
+            ds = np.concatenate(ds)
+            ids = np.concatenate(ids)
+            top = np.argsort(-ds)[:k]
+            out_d[q, :len(top)] = ds[top]
+            out_i[q, :len(top)] = ids[top]
+        return out_d, out_i
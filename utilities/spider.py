@@ -1,9 +1,11 @@
 import requests
 from typing import List, Dict
+from utilities import metrics
 
 WHO_NEWS_API = "https://www.who.int/api/hubs/newsitems?sf_site=15210d59-ad60-47ff-a542-7ed76645f0c7&sf_provider=OpenAccessDataProvider&sf_culture=en&$orderby=PublicationDateAndTime%20desc&$select=Title,ItemDefaultUrl,FormatedDate,Tag,ThumbnailUrl&%24format=json&%24top=16&%24count=true"
 
 
+@metrics.timed("news.fetch")
 def fetch_who_news() -> List[Dict]:
     try:
         response = requests.get(WHO_NEWS_API, timeout=10)
@@ -0,0 +1,98 @@
+"""
+基于知识库的本地后续问题推荐
+
+用一次批量检索找出与用户问题和回答最相近的库内问题，按相似度和主题打分，
+去掉已经问过的问题和彼此近似重复的问题。只需一次编码和一次向量搜索，
+毫秒级返回，回答结束时即可显示推荐；LLM生成的推荐作为可选的补充。
+支持RAG和RetrievalClient（只依赖retrieve_top_questions_batch）。
+"""
+import re
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class LocalSuggestionEngine:
+    def __init__(self, rag, candidates=20, min_similarity=0.3, answer_weight=0.8,
+                 topic_bonus=0.05, same_question=0.9, duplicate_overlap=0.6, answer_chars=1000):
+        """
+        参数:
+            rag: RAG或RetrievalClient
+            candidates: 问题和回答各检索的候选数量
+            min_similarity: 候选的最低相似度
+            answer_weight: 由回答检索到的候选的相似度权重（问题为1）
+            topic_bonus: 与用户问题最相近的库内问题同主题时的加分
+            same_question: 与当前或已问问题相似度超过此值的候选视为同一问题，不推荐
+            duplicate_overlap: 两个问题的词集合Jaccard相似度超过此值视为近似重复
+            answer_chars: 用于检索的回答前缀长度（编码器本身也会截断）
+        """
+        self.rag = rag
+        self.candidates = candidates
+        self.min_similarity = min_similarity
+        self.answer_weight = answer_weight
+        self.topic_bonus = topic_bonus
+        self.same_question = same_question
+        self.duplicate_overlap = duplicate_overlap
+        self.answer_chars = answer_chars
+
+    def suggest(self, query, answer, asked=(), n=3):
+        """
+        推荐n个后续问题
+
+        参数:
+            query: 用户当前问题
+            answer: 回答内容
+            asked: 会话中已经问过的问题
+            n: 推荐数量
+
+        返回:
+            问题列表，知识库中没有合适候选时可能少于n个
+        """
+        queries = [query]
+        if answer:
+            queries.append(answer[:self.answer_chars])
+        results = self.rag.retrieve_top_questions_batch(queries, self.candidates, self.min_similarity)
+
+        query_hits = results[0]
+        # 与用户问题最相近的库内问题代表本轮的主题
+        topic = query_hits[0].get("topic") if query_hits and \
+            query_hits[0]["similarity"] >= self.same_question else None
+
+        scores = {}
+        for hits, weight in zip(results, (1.0, self.answer_weight)):
+            for hit in hits:
+                question = hit["question"]
+                if weight == 1.0 and hit["similarity"] >= self.same_question:
+                    # 就是当前问题本身
+                    scores[question] = None
+                    continue
+                if question in scores and scores[question] is None:
+                    continue
+                score = hit["similarity"] * weight
+                if topic and hit.get("topic") == topic:
+                    score += self.topic_bonus
+                scores[question] = max(score, scores.get(question) or 0.0)
+
+        asked_words = [_words(q) for q in list(asked) + [query]]
+        picked = []
+        picked_words = []
+        for question, score in sorted(((q, s) for q, s in scores.items() if s is not None),
+                                      key=lambda item: item[1], reverse=True):
+            words = _words(question)
+            if any(_jaccard(words, other) >= self.duplicate_overlap
+                   for other in asked_words + picked_words):
+                continue
+            picked.append(question)
+            picked_words.append(words)
+            if len(picked) == n:
+                break
+        return picked